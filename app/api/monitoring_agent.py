@@ -9,6 +9,13 @@ from typing import Optional
 import traceback
 from bson import ObjectId  # Gestion des ObjectId pour MongoDB
 from app.services.ip_public_service import get_public_ip  # Import de la fonction
+from app.services.visit_query_service import (
+    after_cursor,
+    build_projection,
+    build_visit_filter,
+    stream_visits_page,
+)
+from fastapi.responses import StreamingResponse
 
 # Charger les variables d'environnement
 load_dotenv()
@@ -154,23 +161,30 @@ async def update_visit_exit(
         raise HTTPException(status_code=500, detail=f"Erreur MongoDB: {str(e)}")
 
 
-# 🧐 Endpoint pour récupérer les visites
+# 🧐 Endpoint pour récupérer les visites (filtrées, paginées par curseur)
 @router.get("/monitoring/visits/")
-async def get_visits():
+async def get_visits(
+    domain: Optional[str] = None,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    ip: Optional[str] = None,
+    tracking_user_analytics: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+):
     try:
-        cursor = visits_collection.find()
-        visits = await cursor.to_list(100)
-        
-        # Convertir ObjectId en string pour la sérialisation JSON
-        for visit in visits:
-            if "_id" in visit:
-                visit["_id"] = str(visit["_id"])
-                
-        return {"status": "success", "visits": visits}
-    except Exception as e:
-        error_details = traceback.format_exc()
-        print("❌ Erreur lors de la récupération des visites:", error_details)
-        raise HTTPException(status_code=500, detail=f"Erreur lors de la récupération des visites: {str(e)}")
+        query = after_cursor(
+            build_visit_filter(domain, start, end, ip, tracking_user_analytics), cursor
+        )
+        projection = build_projection(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        stream_visits_page(visits_collection, query, projection, limit),
+        media_type="application/json",
+    )
 
 # Ajouter les routes à l'application FastAPI
 app.include_router(router)
\ No newline at end of file
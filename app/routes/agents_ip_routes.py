@@ -7,13 +7,15 @@ from fastapi import (
     Depends,
     Header,
     Body,
+    Query,
     WebSocket,
     WebSocketDisconnect,
 )
+from fastapi.responses import StreamingResponse
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 import jwt
 import datetime
 import os
@@ -22,11 +24,31 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from typing import Optional, List
 import traceback
 from bson import ObjectId, json_util
+from pymongo import ReturnDocument
 import json
 import asyncio
 
 # ip_public_service
 from app.services.ip_public_service import get_public_ip
+from app.services.visit_ingest_service import VisitIngestBuffer
+from app.services.rollup_service import VisitRollups
+from app.services.unique_visitor_service import UniqueVisitors
+from app.services.heavy_hitter_service import HeavyHitters
+from app.services.abuse_detector import AbuseDetector
+from app.services.session_cache import create_session_cache
+from app.services.websocket_broadcaster import ENCODINGS, WebSocketBroadcaster
+from app.services.event_bus import create_event_bus
+from app.services.ip_log_service import find_ip_log_buckets
+from app.services.retention_service import RetentionSweeper
+from app.services.visit_export_service import EXPORT_FORMATS, export_filename, export_visits, gzip_chunks
+from app.services.visit_query_service import (
+    after_cursor,
+    build_projection,
+    build_visit_filter,
+    stream_visits_page,
+)
+from app.utils.api_utils import BodyTooLarge, MongoJSONResponse, decompress_body, dumps, loads, read_body
+from config.settings import INGEST_BATCH_MAX_BYTES, INGEST_BATCH_MAX_ITEMS
 
 # Initialisation du logger
 logging.basicConfig(level=logging.INFO)
@@ -35,8 +57,12 @@ logger = logging.getLogger(__name__)
 # Configuration de SlowAPI
 limiter = Limiter(key_func=get_remote_address)
 
-# Liste des connexions WebSocket actives
-active_connections: List[WebSocket] = []
+# Connexions WebSocket actives, chacune avec sa file d'envoi
+broadcaster = WebSocketBroadcaster()
+
+# Bus d'événements entre workers: chaque worker diffuse à ses propres connexions
+event_bus = create_event_bus()
+event_bus.subscribe(broadcaster.publish_events)
 
 # Liste globale des clients connectés
 clients: List[WebSocket] = []
@@ -50,7 +76,33 @@ MONGO_URI = os.getenv("MONGO_URI")
 client = AsyncIOMotorClient(MONGO_URI)
 db = client.monitoring_db
 visits_collection = db.visits
-ip_collection = db.ip_logs  # Collection pour les logs d'IP
+ip_collection = db.ip_logs  # Logs d'IP, un document par (domaine, heure) plafonné
+
+# Agrégats de visites par domaine et minute / heure / jour
+visit_rollups = VisitRollups(db)
+
+# Visiteurs et IPs uniques par domaine et jour (HyperLogLog)
+unique_visitors = UniqueVisitors(db)
+
+# IPs / user agents les plus fréquents par domaine et heure (snapshots démarrés par le lifespan)
+heavy_hitters = HeavyHitters(db)
+
+# Visites récentes par (IP, domaine) sur une fenêtre glissante, en mémoire
+abuse_detector = AbuseDetector()
+
+# Archivage puis suppression des visites / ip_logs hors rétention (démarré par le lifespan)
+retention = RetentionSweeper(db)
+
+# Session ouverte de chaque (domaine, utilisateur), en mémoire ou partagée via Redis
+session_cache = create_session_cache()
+
+# Écriture des visites par lots (démarrée / vidée par le lifespan de l'application)
+visit_ingest = VisitIngestBuffer(
+    visits_collection,
+    ip_collection,
+    listeners=[visit_rollups, unique_visitors, heavy_hitters, abuse_detector],
+    session_cache=session_cache,
+)
 
 app = FastAPI()
 app.state.limiter = limiter
@@ -78,16 +130,6 @@ class VisitUpdateData(BaseModel):
     domain: str
 
 
-# 📌 Fonction
-# Fonction pour convertir automatiquement ObjectId en chaînes lors de la sérialisation
-def custom_json_serializer(obj):
-    if isinstance(obj, ObjectId):
-        return str(obj)  # Convertir ObjectId en chaîne
-    if hasattr(obj, "isoformat"):
-        return obj.isoformat()  # Convertir les objets datetime en chaîne
-    raise TypeError(f"Type {type(obj)} not serializable")
-
-
 # 🔐 Vérification du token JWT
 def verify_token(authorization: str = Header(...)):
     if not authorization or not authorization.startswith("Bearer "):
@@ -103,68 +145,73 @@ def verify_token(authorization: str = Header(...)):
         raise HTTPException(status_code=401, detail="Token invalide")
 
 
-# Fonction pour envoyer une mise à jour en temps réel à toutes les connexions actives
-async def notify_visits_change(visit_data: dict, event_type: str = "new_visit"):
-    message = json.dumps(
-        {"event": event_type, "data": visit_data}, default=custom_json_serializer
-    )  # Utiliser la fonction de sérialisation personnalisée
-    # Envoyer le message à toutes les connexions actives
-    for connection in active_connections:
-        try:
-            await connection.send_text(message)
-        except Exception as e:
-            print(f"Erreur lors de l'envoi du message: {e}")
-
-
-# Fonction pour vérifier les connexions WebSocket inactives
-async def clean_inactive_connections():
-    try:
-        while True:
-            active_connections[:] = [
-                conn
-                for conn in active_connections
-                if conn.client_state == WebSocket.OPEN
-            ]
-            await asyncio.sleep(60)
-    except asyncio.CancelledError:
-        print("🛑 Cleaning task cancelled.")
-        pass  # Ensure we handle task cancellation gracefully
+# Documents écrits pour une visite: la visite elle-même et son entrée dans ip_logs
+def build_visit_documents(visit: UserVisit):
+    visit_data = {
+        "ip": visit.ip,
+        "user_agent": visit.user_agent,
+        "date_entree": visit.date_entree.astimezone(
+            datetime.timezone.utc
+        ),  # Assurer que c'est en UTC
+        "date_sortie": (
+            visit.date_sortie.astimezone(datetime.timezone.utc)
+            if visit.date_sortie
+            else None
+        ),
+        "domain": visit.domain,
+        "tracking_user_analytics": visit.tracking_user_analytics,
+    }
+
+    # Données de l'IP ajoutées au suivi du domaine dans "ip_collection"
+    ip_data = {
+        "ip": visit.ip,
+        "user_agent": visit.user_agent,
+        "date_entree": visit_data["date_entree"],
+        "date_sortie": visit_data["date_sortie"],
+        "tracking_user_analytics": visit.tracking_user_analytics,
+    }
+    return visit_data, ip_data
 
 
-# Fonction pour vérifier si une IP est suspecte
-async def is_suspect_ip(ip: str, domain: str) -> bool:
-    # Récupérer les visites récentes pour cette IP et domaine
-    recent_visits = await visits_collection.find(
+# Fonction pour envoyer une mise à jour en temps réel à toutes les connexions actives
+async def notify_visits_change(visit_data: dict, event_type: str = "new_visit"):
+    # Sérialisé une seule fois par événement (ObjectId et datetime gérés nativement)
+    message = dumps({"event": event_type, "data": visit_data})
+    # Publié sur le bus puis envoyé par chaque worker aux seuls clients abonnés
+    # au domaine et au type d'événement
+    event_bus.publish(
         {
-            "ip": ip,
-            "domain": domain,
-            "date_entree": {
-                "$gt": datetime.datetime.utcnow() - datetime.timedelta(hours=1)
-            },
+            "message": message,
+            # Seuls deux événements du même type pour la même visite peuvent fusionner
+            "key": f"{event_type}:{visit_data['_id']}" if visit_data.get("_id") else None,
+            "domain": visit_data.get("domain"),
+            "event": event_type,
         }
-    ).to_list(100)
+    )
 
-    # Si l'IP a plus de 5 visites dans la dernière heure, elle est suspecte
-    if len(recent_visits) > 5:
-        return True
-    return False
 
+# Liste séparée par des virgules (paramètre de requête)
+def split_list(value: Optional[str]) -> List[str]:
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
 
-# Route WebSocket pour les connexions en temps réel
-async def websocket_visits(websocket: WebSocket, token: str = Depends(verify_token)):
-    try:
-        await websocket.accept()
-        active_connections.append(websocket)
-        print(
-            f"🔌 Connexion WebSocket acceptée. Nombre de clients connectés: {len(active_connections)}"
-        )
 
-        # Maintenant, vous pouvez gérer les messages comme vous le faisiez précédemment
-        # Assurez-vous que le token est bien vérifié avant de continuer
-    except Exception as e:
-        print(f"Erreur de connexion WebSocket: {e}")
-        await websocket.close()
-        active_connections.remove(websocket)
+# Liste de chaînes reçue dans un message WebSocket (subscribe / unsubscribe)
+def string_list(value, name: str) -> List[str]:
+    """
+    Raises:
+        ValueError: If ``value`` is neither None nor a list of strings
+    """
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"{name} doit être une liste de chaînes")
+    return value
+
+
+# Fonction pour vérifier si une IP est suspecte
+async def is_suspect_ip(ip: str, domain: str) -> bool:
+    # Plus de ABUSE_THRESHOLD visites dans la fenêtre glissante (sans requête MongoDB)
+    return abuse_detector.is_suspect(ip, domain)
 
 
 # 📌 Routes
@@ -225,69 +272,22 @@ async def track_visit(
     try:
         print("✅ Enregistrement d'une nouvelle visite:", visit.dict())
 
-        # Vérifier si une visite existe déjà pour cet utilisateur, sans date de sortie
-        existing_visit = await visits_collection.find_one(
-            {
-                "domain": visit.domain,
-                "tracking_user_analytics": visit.tracking_user_analytics,
-                "date_sortie": None,  # Si une visite est en cours
-            }
-        )
-
-        if existing_visit:
-            existing_visit_id = existing_visit["_id"]
-            await visits_collection.update_one(
-                {"_id": existing_visit_id},
-                {
-                    "$set": {"date_sortie": datetime.datetime.utcnow()}
-                },  # Mettre à jour la date de sortie
-            )
-            print(
-                f"🔄 La visite existante pour l'utilisateur {visit.tracking_user_analytics} a été mise à jour avec une date de sortie."
-            )
-
-        # Préparer les données de la nouvelle visite
-        visit_data = {
-            "ip": visit.ip,
-            "user_agent": visit.user_agent,
-            "date_entree": visit.date_entree.astimezone(
-                datetime.timezone.utc
-            ),  # Assurer que c'est en UTC
-            "date_sortie": (
-                visit.date_sortie.astimezone(datetime.timezone.utc)
-                if visit.date_sortie
-                else None
-            ),
-            "domain": visit.domain,
-            "tracking_user_analytics": visit.tracking_user_analytics,
-        }
-
-        # Insérer la nouvelle visite dans la collection "visits"
-        result = await visits_collection.insert_one(visit_data)
+        visit_data, ip_data = build_visit_documents(visit)
 
-        # Ajouter ou mettre à jour l'IP dans la collection "ip_collection"
-        ip_data = {
-            "ip": visit.ip,
-            "user_agent": visit.user_agent,
-            "date_entree": visit.date_entree,
-            "date_sortie": visit.date_sortie,
-            "tracking_user_analytics": visit.tracking_user_analytics,
-        }
-
-        await ip_collection.update_one(
-            {"domain": visit.domain},  # Recherche par domaine
-            {"$push": {"ips": ip_data}},  # Ajouter la nouvelle IP sous le domaine
-            upsert=True,  # Crée une entrée si le domaine n'existe pas
-        )
+        # Clôture de la visite en cours, insertion de la nouvelle visite et ajout de l'IP:
+        # écrits par lots, la réponse part quand le lot est validé en base
+        visit_id = await visit_ingest.submit(visit_data, ip_data)
 
         # Notifier du changement de visite (ex: via WebSocket ou autre mécanisme)
         await notify_visits_change(visit_data)
 
-        return {
-            "status": "success",
-            "visit_id": str(result.inserted_id),
-            "tracking_user_analytics": visit.tracking_user_analytics,
-        }
+        return MongoJSONResponse(
+            {
+                "status": "success",
+                "visit_id": str(visit_id),
+                "tracking_user_analytics": visit.tracking_user_analytics,
+            }
+        )
     except Exception as e:
         error_details = traceback.format_exc()
         print("❌ Erreur lors de l'enregistrement de la visite:", error_details)
@@ -296,6 +296,73 @@ async def track_visit(
         )
 
 
+# Route pour enregistrer un lot de visites (corps JSON éventuellement compressé gzip / deflate)
+@router.post("/agents/visits/batch")
+@limiter.limit("60/minute")
+async def track_visits_batch(request: Request, token: dict = Depends(verify_token)):
+    # Taille annoncée vérifiée avant toute lecture, puis corps lu par morceaux jusqu'à la limite
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > INGEST_BATCH_MAX_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Corps de requête supérieur à {INGEST_BATCH_MAX_BYTES} octets",
+        )
+    try:
+        body = decompress_body(
+            await read_body(request.stream(), INGEST_BATCH_MAX_BYTES),
+            request.headers.get("content-encoding"),
+            INGEST_BATCH_MAX_BYTES,
+        )
+        items = loads(body)
+    except BodyTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if isinstance(items, dict):
+        items = items.get("visits")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Un tableau de visites est attendu")
+    if len(items) > INGEST_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Lot limité à {INGEST_BATCH_MAX_ITEMS} visites",
+        )
+
+    # Validation de tout le lot, les visites invalides sont rapportées sans bloquer les autres
+    results = [None] * len(items)
+    accepted = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise TypeError("une visite doit être un objet JSON")
+            accepted.append((index, build_visit_documents(UserVisit(**item))))
+        except (ValidationError, TypeError) as e:
+            results[index] = {"index": index, "status": "error", "detail": str(e)}
+
+    # Soumises ensemble au buffer d'écriture: écrites par bulk_write de INGEST_MAX_BATCH visites
+    visit_ids = await asyncio.gather(
+        *[visit_ingest.submit(visit_data, ip_data) for _, (visit_data, ip_data) in accepted],
+        return_exceptions=True,
+    )
+    for (index, (visit_data, _)), visit_id in zip(accepted, visit_ids):
+        if isinstance(visit_id, Exception):
+            results[index] = {"index": index, "status": "error", "detail": str(visit_id)}
+        else:
+            results[index] = {"index": index, "status": "success", "visit_id": str(visit_id)}
+            await notify_visits_change(visit_data)
+
+    inserted = sum(result["status"] == "success" for result in results)
+    return MongoJSONResponse(
+        {
+            "status": "success" if inserted == len(results) else "partial",
+            "inserted": inserted,
+            "failed": len(results) - inserted,
+            "results": results,
+        }
+    )
+
+
 # Mise à jour de la sortie de la visite
 @router.put("/agents/visit/update/")
 async def update_visit_exit(
@@ -312,10 +379,6 @@ async def update_visit_exit(
         except Exception as e:
             raise HTTPException(status_code=400, detail="ID de visite invalide")
 
-        existing_visit = await visits_collection.find_one({"_id": object_id})
-        if not existing_visit:
-            raise HTTPException(status_code=404, detail="Visite introuvable")
-
         update_data = {}
 
         if (
@@ -331,18 +394,43 @@ async def update_visit_exit(
             update_data["date_sortie"] = None
             update_data["date_entree"] = datetime.datetime.utcnow()
 
-        update_result = await visits_collection.update_one(
-            {"_id": object_id}, {"$set": update_data}
-        )
-
-        if update_result.modified_count == 0:
-            raise HTTPException(status_code=400, detail="Mise à jour impossible")
-
-        updated_visit = await visits_collection.find_one({"_id": object_id})
+        # Clôture conditionnelle: seul l'appel qui ferme la session la compte dans les agrégats,
+        # même si plusieurs sorties de la même visite arrivent en parallèle
+        closed_now = False
+        updated_visit = None
+        if update_data["date_sortie"] is not None:
+            updated_visit = await visits_collection.find_one_and_update(
+                {"_id": object_id, "date_sortie": None},
+                {"$set": update_data},
+                return_document=ReturnDocument.AFTER,
+            )
+            closed_now = updated_visit is not None
+        if updated_visit is None:
+            updated_visit = await visits_collection.find_one_and_update(
+                {"_id": object_id},
+                {"$set": update_data},
+                return_document=ReturnDocument.AFTER,
+            )
         if not updated_visit:
-            raise HTTPException(
-                status_code=404, detail="Visite introuvable après mise à jour"
+            raise HTTPException(status_code=404, detail="Visite introuvable")
+
+        # La session de cet utilisateur a changé hors du lot d'écriture: relue au prochain lot.
+        # La mise à jour est déjà enregistrée: une panne du cache ne doit pas la faire échouer
+        # (le client la rejouerait), l'entrée expirera avec le TTL du cache
+        try:
+            await session_cache.invalidate(
+                [(updated_visit["domain"], updated_visit["tracking_user_analytics"])]
             )
+        except Exception as e:
+            logger.warning(f"⚠️ Invalidation du cache de session impossible: {e}")
+
+        # Mettre à jour les agrégats si la session vient d'être clôturée; comme pour le cache,
+        # une erreur ici ne doit pas faire rejouer une mise à jour déjà enregistrée
+        if closed_now:
+            try:
+                await visit_rollups.record(closed=[updated_visit])
+            except Exception as e:
+                logger.warning(f"⚠️ Agrégats de la visite {visit_id} non mis à jour: {e}")
 
         event_type = (
             "update_exit"
@@ -351,15 +439,15 @@ async def update_visit_exit(
         )
         await notify_visits_change(updated_visit, event_type)
 
-        # Retourner les résultats après conversion de l'ObjectId en chaîne
-        return {
-            "status": "success",
-            "message": "Session mise à jour",
-            "visit_id": str(object_id),
-            "updated_visit": json.dumps(
-                updated_visit, default=custom_json_serializer
-            ),  # Sérialisation personnalisée
-        }
+        # Visite renvoyée telle quelle: ObjectId et dates sérialisés par la réponse
+        return MongoJSONResponse(
+            {
+                "status": "success",
+                "message": "Session mise à jour",
+                "visit_id": str(object_id),
+                "updated_visit": updated_visit,
+            }
+        )
 
     except Exception as e:
         error_details = traceback.format_exc()
@@ -371,27 +459,42 @@ async def update_visit_exit(
 
 @router.get("/agents/visits")
 @limiter.limit("20/minute")
-async def get_visits_and_ips(request: Request):
-    try:
-        print("📥 Tentative de récupération des visites...")
-        visits = await visits_collection.find().to_list(100)
-        print(f"🔍 Visites récupérées: {visits}")
-
-        if not visits:
-            print("📭 Aucune visite trouvée.")
-            return {"status": "success", "visits": [], "ips": []}
-
-        for visit in visits:
-            visit["_id"] = str(visit["_id"])
-
-        print("📥 Tentative de récupération des IPs...")
-        ip_logs = await ip_collection.find().to_list(100)
-        print(f"🔍 IPs récupérées: {ip_logs}")
+async def get_visits_and_ips(
+    request: Request,
+    domain: Optional[str] = None,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    ip: Optional[str] = None,
+    tracking_user_analytics: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+):
+    """
+    Visites filtrées, paginées par curseur sur (date_entree, _id), plus récentes d'abord.
 
-        for ip_log in ip_logs:
-            ip_log["_id"] = str(ip_log["_id"])
+    La réponse est envoyée au fil de l'eau; ``next_cursor`` permet de demander la page
+    suivante. Les buckets d'IPs de la période ne sont renvoyés qu'avec la première page,
+    limités aux IP_LOG_PAGE_MAX_ENTRIES entrées les plus récentes.
+    """
+    try:
+        query = after_cursor(
+            build_visit_filter(domain, start, end, ip, tracking_user_analytics), cursor
+        )
+        projection = build_projection(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        return {"status": "success", "visits": visits, "ips": ip_logs}
+    try:
+        extra = {}
+        if not cursor:
+            # Requête par plage sur les buckets horaires (domaine et période optionnels)
+            extra["ips"] = await find_ip_log_buckets(ip_collection, domain, start, end)
+
+        return StreamingResponse(
+            stream_visits_page(visits_collection, query, projection, limit, extra),
+            media_type="application/json",
+        )
 
     except Exception as e:
         error_details = traceback.format_exc()
@@ -402,27 +505,203 @@ async def get_visits_and_ips(request: Request):
         )
 
 
+# Route pour exporter toutes les visites d'une période (NDJSON, CSV ou Parquet)
+@router.get("/agents/visits/export")
+@limiter.limit("5/minute")
+async def export_visits_range(
+    request: Request,
+    domain: Optional[str] = None,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    ip: Optional[str] = None,
+    tracking_user_analytics: Optional[str] = None,
+    fields: Optional[str] = None,
+    export_format: str = Query("ndjson", alias="format"),
+    gzip: bool = False,
+):
+    """
+    Export en flux de toutes les visites filtrées, plus récentes d'abord, sans limite de taille.
+
+    ``gzip`` compresse la réponse (fichier .gz); en Parquet il choisit la compression
+    gzip des colonnes.
+    """
+    try:
+        query = build_visit_filter(domain, start, end, ip, tracking_user_analytics)
+        projection = build_projection(fields)
+        chunks = export_visits(visits_collection, query, projection, export_format, gzip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    media_type = "application/gzip" if gzip and export_format != "parquet" else EXPORT_FORMATS[export_format][0]
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(export_format, gzip)}"'},
+    )
+
+
+# Visites en base puis visites archivées de la période, en NDJSON
+async def visit_history_chunks(query, start, end, **filters):
+    async for chunk in export_visits(visits_collection, query, None, "ndjson"):
+        yield chunk
+    async for chunk in retention.archive_chunks(start, end, **filters):
+        yield chunk
+
+
+# Route pour lire les visites d'une période, y compris au-delà de la rétention (archives)
+@router.get("/agents/visits/history")
+@limiter.limit("5/minute")
+async def get_visit_history(
+    request: Request,
+    domain: Optional[str] = None,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    ip: Optional[str] = None,
+    tracking_user_analytics: Optional[str] = None,
+    gzip: bool = False,
+):
+    """
+    Visites de [start, end) en NDJSON, plus récentes d'abord: celles encore en base,
+    puis celles archivées par la rétention (jours antérieurs à l'horizon).
+    """
+    filters = {"domain": domain, "ip": ip, "tracking_user_analytics": tracking_user_analytics}
+    query = build_visit_filter(domain, start, end, ip, tracking_user_analytics)
+    chunks = visit_history_chunks(query, start, end, **filters)
+    return StreamingResponse(
+        gzip_chunks(chunks) if gzip else chunks,
+        media_type="application/gzip" if gzip else EXPORT_FORMATS["ndjson"][0],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename("ndjson", gzip)}"'},
+    )
+
+
+# Route pour lire les agrégats de visites d'un domaine (minute / heure / jour)
+@router.get("/agents/rollups")
+@limiter.limit("60/minute")
+async def get_visit_rollups(
+    request: Request,
+    domain: str,
+    granularity: str = "hour",
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    top: Optional[int] = None,
+):
+    try:
+        buckets = await visit_rollups.query(domain, granularity, start, end, top)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return MongoJSONResponse(
+        {"status": "success", "domain": domain, "granularity": granularity, "buckets": buckets}
+    )
+
+
+# Route pour estimer les visiteurs uniques d'un domaine sur un jour / une semaine / un mois
+@router.get("/agents/visitors/unique")
+@limiter.limit("60/minute")
+async def get_unique_visitors(
+    request: Request,
+    domain: str,
+    period: str = "day",
+    date: Optional[datetime.date] = None,
+):
+    try:
+        estimate = await unique_visitors.query(domain, period, date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return MongoJSONResponse({"status": "success", **estimate})
+
+
+# Route pour lister les IPs / user agents les plus fréquents d'un domaine
+@router.get("/agents/top")
+@limiter.limit("60/minute")
+async def get_top_values(
+    request: Request,
+    domain: str,
+    dim: str = "ip",
+    hours: int = 1,
+    limit: int = 10,
+):
+    try:
+        top = await heavy_hitters.top(domain, dim, hours, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return MongoJSONResponse({"status": "success", **top})
+
+
+# Route pour lister les IPs suspectes (trop de visites sur la fenêtre glissante)
+@router.get("/agents/suspects")
+@limiter.limit("60/minute")
+async def get_suspect_ips(request: Request, domain: Optional[str] = None):
+    return {
+        "status": "success",
+        "window_seconds": abuse_detector.window_seconds,
+        "threshold": abuse_detector.threshold,
+        "tracked": len(abuse_detector.counters),
+        "stats": abuse_detector.stats,
+        "suspects": abuse_detector.suspects(domain),
+    }
+
+
+# Route SSE: même flux que /ws/visits, reprise via Last-Event-ID ou ?last_seq=
+@router.get("/agents/visits/events")
+async def stream_visit_events(
+    request: Request,
+    domains: Optional[str] = None,
+    events: Optional[str] = None,
+    last_seq: Optional[int] = None,
+    last_event_id: Optional[str] = Header(None),
+):
+    if last_seq is None and last_event_id and last_event_id.isdigit():
+        last_seq = int(last_event_id)
+    connection = broadcaster.open_stream(
+        request.client, split_list(domains), split_list(events), last_seq
+    )
+    return StreamingResponse(
+        broadcaster.stream(connection),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # Route WebSocket pour les connexions en temps réel
 @router.websocket("/ws/visits")
-async def websocket_visits(websocket: WebSocket):
+async def websocket_visits(
+    websocket: WebSocket,
+    domains: Optional[str] = None,
+    events: Optional[str] = None,
+    encoding: str = "json",
+    last_seq: Optional[int] = None,
+    heartbeat: bool = False,
+):
+    # ?encoding=batch (tableau JSON par fenêtre) ou zlib (même tableau compressé, binaire)
+    if encoding not in ENCODINGS:
+        await websocket.close(code=1003)
+        return
+    # Abonnement initial via ?domains=a.com,b.com&events=new_visit (tout par défaut);
+    # ?last_seq= rejoue les événements manqués depuis la dernière séquence reçue;
+    # ?heartbeat=1 pour recevoir des événements "ping" auxquels répondre par "pong"
+    connection = await broadcaster.connect(
+        websocket, encoding, split_list(domains), split_list(events), last_seq, heartbeat
+    )
     try:
-        await websocket.accept()
-        active_connections.append(
-            websocket
-        )  # Ajouter le client à la liste des connexions actives
         print("🔌 Connexion WebSocket acceptée")
-        print(f"🌐 Nombre de clients connectés : {len(active_connections)}")
+        print(f"🌐 Nombre de clients connectés : {len(broadcaster.connections)}")
 
         while True:
             # Recevoir les messages du client
             data = await websocket.receive_text()
-            print(f"📨 Message brut reçu: {data}")
+            connection.touch()
 
             try:
                 # On suppose que les messages sont en JSON
                 message = json.loads(data)
 
-                if message.get("event") == "new_visit":
+                if message.get("event") == "pong":
+                    # Réponse au heartbeat: le client est vivant (déjà noté par touch)
+                    pass
+
+                elif message.get("event") == "new_visit":
                     print("Nouvelle visite reçue", message)
                     # Diffuser la nouvelle visite à tous les clients
                     await notify_visits_change(message["data"], event_type="new_visit")
@@ -434,28 +713,52 @@ async def websocket_visits(websocket: WebSocket):
                         message["data"], event_type="update_exit"
                     )
 
+                elif message.get("event") in ("subscribe", "unsubscribe"):
+                    # Abonnement aux domaines / types d'événements, appliqué côté serveur;
+                    # {"all_domains": true} / {"all_events": true} pour tout recevoir à nouveau
+                    domains_list = string_list(message.get("domains"), "domains")
+                    events_list = string_list(message.get("events"), "events")
+                    if message["event"] == "subscribe":
+                        if message.get("heartbeat") is True:
+                            connection.heartbeat = True
+                        broadcaster.subscribe(
+                            connection,
+                            domains_list,
+                            events_list,
+                            all_domains=message.get("all_domains") is True,
+                            all_events=message.get("all_events") is True,
+                        )
+                    else:
+                        broadcaster.unsubscribe(connection, domains_list, events_list)
+                    connection.enqueue(
+                        json.dumps(
+                            {
+                                "event": "subscriptions",
+                                "all_domains": connection.all_domains,
+                                "all_events": connection.all_events,
+                                "domains": sorted(connection.domains),
+                                "events": sorted(connection.events),
+                            }
+                        )
+                    )
+
                 else:
                     print("Événement inconnu")
             except json.JSONDecodeError:
                 print("Erreur de décodage JSON reçu")
-                await websocket.send_text("Erreur: message malformé")
+                connection.enqueue(
+                    json.dumps({"event": "error", "detail": "Erreur: message malformé"})
+                )
+            except ValueError as e:
+                connection.enqueue(json.dumps({"event": "error", "detail": str(e)}))
 
     except WebSocketDisconnect:
-        # Supprimer la connexion de la liste active lorsqu'un client se déconnecte
-        active_connections.remove(websocket)
         print("❌ Un client s'est déconnecté.")
-        print(f"🌐 Nombre de clients restants : {len(active_connections)}")
 
     except Exception as e:
         print(f"❗ Erreur WebSocket: {e}")
-        await websocket.send_text(f"Erreur serveur: {str(e)}")
-
 
-# Ajouter la tâche de nettoyage lors du démarrage du serveur
-@app.on_event("shutdown")
-async def shutdown_event():
-    # Close all active WebSocket connections
-    for connection in active_connections:
-        await connection.close()
-    active_connections.clear()
-    print("🌐 All WebSocket connections closed.")
+    finally:
+        # Retirer la connexion (et arrêter sa tâche d'envoi)
+        await broadcaster.disconnect(connection)
+        print(f"🌐 Nombre de clients restants : {len(broadcaster.connections)}")
@@ -0,0 +1,40 @@
+import hmac
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+
+from app.routes.agents_ip_routes import broadcaster, db, limiter, retention
+from app.services.index_service import index_report
+from config.settings import DEBUG_TOKEN
+
+
+# 🔐 Jeton d'administration distinct des JWT d'agents (émis sans authentification)
+def verify_debug_token(authorization: str = Header(...)):
+    if not DEBUG_TOKEN or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Token manquant ou mal formaté")
+    if not hmac.compare_digest(authorization[len("Bearer "):].encode("utf-8"), DEBUG_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Token invalide")
+
+
+# Détails internes (index, plans, clients, archives): routes enregistrées seulement si DEBUG_TOKEN est défini
+router = APIRouter(dependencies=[Depends(verify_debug_token)])
+
+
+# Route pour vérifier que chaque requête de l'application utilise un index
+@router.get("/debug/indexes")
+@limiter.limit("10/minute")
+async def get_index_report(request: Request):
+    return await index_report(db)
+
+
+# Route pour suivre les clients WebSocket (profondeur de file, retard, messages perdus)
+@router.get("/debug/websockets")
+@limiter.limit("30/minute")
+async def get_websocket_report(request: Request):
+    return broadcaster.info()
+
+
+# Route pour suivre la rétention (horizon, documents archivés, dernier balayage)
+@router.get("/debug/retention")
+@limiter.limit("30/minute")
+async def get_retention_report(request: Request):
+    return retention.info()
@@ -6,6 +6,10 @@ from app.services.domain_service import GetDomainInfo
 from app.services.monitoring_service import MonitoringService
 from app.services.response_time_service import get_response_time
 from app.services.error_page_service import ErrorPageService
+from app.services.job_service import job_manager, Job
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
 import requests
 
 # Création du routeur pour les routes de monitoring
@@ -22,8 +26,8 @@ monitoring_service = MonitoringService()
 
 # Route pour récupérer la liste des domaines depuis une API externe
 @router.get("/domains")
-def get_domains():
-    data = http_service.get_domains()
+async def get_domains():
+    data = await http_service.get_domains()
     if not data:
         return {"error": "Impossible de récupérer les données"}
     return data
@@ -69,8 +73,8 @@ def check_response_time(domain: str):
 
 # Route pour vérifier les pages d'un domaine pour des erreurs (codes HTTP >= 400)
 @router.get("/error_pages/{domain}")
-async def check_error_pages(domain: str):
-    error_page_service = ErrorPageService(domain)
+async def check_error_pages(domain: str, soft_404: bool = False):
+    error_page_service = ErrorPageService(domain, detect_soft_404=soft_404)
     await error_page_service.get_all_pages_from_sitemap()
     errors = await error_page_service.check_error_pages()
 
@@ -98,3 +102,78 @@ def ping_domain(domain: str):
         raise HTTPException(
             status_code=503, detail=f"{domain} est injoignable. Erreur: {str(e)}"
         )
+
+
+# 📌 Jobs de fond pour les scans longs
+async def run_error_pages_job(job: Job, detect_soft_404: bool = False):
+    error_page_service = ErrorPageService(job.key, detect_soft_404=detect_soft_404)
+    await error_page_service.get_all_pages_from_sitemap()
+
+    def on_progress(done, total, error):
+        if error:
+            job.add_result(error)
+        job.set_progress(done, total)
+
+    job.set_progress(0, len(error_page_service.pages))
+    errors = await error_page_service.check_error_pages(on_progress)
+    return {"errors": errors} if errors else {"message": "Aucune erreur trouvée"}
+
+
+async def run_soft_404_job(job: Job):
+    return await run_error_pages_job(job, detect_soft_404=True)
+
+
+async def run_ssl_job(job: Job):
+    # check_ssl est bloquant (socket), on l'exécute hors de la boucle d'événements
+    result = await asyncio.to_thread(ssl_service.check_ssl, job.key)
+    job.set_progress(1, 1)
+    return result
+
+
+JOB_RUNNERS = {
+    "error_pages": run_error_pages_job,
+    "soft_404": run_soft_404_job,
+    "ssl": run_ssl_job,
+}
+
+
+# Route pour lancer un scan en arrière-plan (retourne immédiatement l'identifiant du job)
+@router.post("/jobs/{kind}/{domain}", status_code=202)
+async def submit_job(kind: str, domain: str):
+    runner = JOB_RUNNERS.get(kind)
+    if runner is None:
+        raise HTTPException(status_code=404, detail=f"Type de job inconnu: {kind}")
+    job, created = job_manager.submit(kind, domain, runner)
+    return {"job_id": job.id, "status": job.status, "deduplicated": not created}
+
+
+# Route pour consulter l'avancement et les résultats partiels d'un job
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    return job.to_dict()
+
+
+# Route pour suivre un job en direct (Server-Sent Events)
+@router.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+
+    async def events():
+        async for snapshot in job.watch():
+            yield f"event: {snapshot['status']}\ndata: {json.dumps(snapshot, default=str)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# Route pour annuler un job en attente ou en cours
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    return {"job_id": job.id, "status": job.status}
@@ -0,0 +1,134 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import ABUSE_MAX_KEYS, ABUSE_THRESHOLD, ABUSE_WINDOW_BUCKETS, ABUSE_WINDOW_SECONDS
+
+Key = Tuple[str, str]
+
+
+class WindowCounter:
+    """Events in a sliding window, as a ring of per-bucket counts."""
+
+    __slots__ = ("counts", "total", "current")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.total = 0
+        self.current = -1
+
+    def advance(self, bucket: int):
+        """Move the window so that it ends at ``bucket``, forgetting older buckets."""
+        if bucket <= self.current:
+            return
+        size = len(self.counts)
+        if bucket - self.current >= size:
+            self.counts = [0] * size
+            self.total = 0
+        else:
+            for expired in range(self.current + 1, bucket + 1):
+                self.total -= self.counts[expired % size]
+                self.counts[expired % size] = 0
+        self.current = bucket
+
+    def add(self, bucket: int, count: int = 1):
+        self.advance(bucket)
+        self.counts[bucket % len(self.counts)] += count
+        self.total += count
+
+
+class AbuseDetector:
+    def __init__(
+        self,
+        window_seconds: float = ABUSE_WINDOW_SECONDS,
+        buckets: int = ABUSE_WINDOW_BUCKETS,
+        threshold: int = ABUSE_THRESHOLD,
+        max_keys: int = ABUSE_MAX_KEYS,
+    ):
+        """
+        Visits per (ip, domain) over a sliding window, kept in memory.
+
+        The window is split in ``buckets`` slots, so recording a visit or checking
+        an IP costs O(1) and never queries MongoDB. Keys idle for a whole window
+        are dropped, and at most ``max_keys`` keys are kept (least recently seen
+        evicted first).
+
+        Args:
+            window_seconds: Length of the sliding window
+            buckets: Number of slots of the window (its resolution)
+            threshold: An IP with more visits than this in the window is suspect
+            max_keys: Maximum number of (ip, domain) counters kept
+        """
+        self.window_seconds = window_seconds
+        self.bucket_seconds = window_seconds / buckets
+        self.buckets = buckets
+        self.threshold = threshold
+        self.max_keys = max_keys
+        self.counters: "OrderedDict[Key, WindowCounter]" = OrderedDict()
+        self.suspects_keys: set = set()
+        self.stats = {"expired": 0, "evicted": 0}
+
+    def bucket(self, now: Optional[float] = None) -> int:
+        return int((time.monotonic() if now is None else now) // self.bucket_seconds)
+
+    def record(self, ip: str, domain: str, count: int = 1, now: Optional[float] = None) -> int:
+        """
+        Count visits of an IP on a domain.
+
+        Returns:
+            Number of visits of the IP on the domain within the window
+        """
+        bucket = self.bucket(now)
+        key = (ip, domain)
+        counter = self.counters.get(key)
+        if counter is None:
+            counter = self.counters[key] = WindowCounter(self.buckets)
+        else:
+            self.counters.move_to_end(key)
+        counter.add(bucket, count)
+        if counter.total > self.threshold:
+            self.suspects_keys.add(key)
+        self.expire(bucket)
+        return counter.total
+
+    def count(self, ip: str, domain: str, now: Optional[float] = None) -> int:
+        counter = self.counters.get((ip, domain))
+        if counter is None:
+            return 0
+        counter.advance(self.bucket(now))
+        return counter.total
+
+    def is_suspect(self, ip: str, domain: str, now: Optional[float] = None) -> bool:
+        return self.count(ip, domain, now) > self.threshold
+
+    def expire(self, bucket: int):
+        """Drop the counters idle for a whole window, and the oldest ones beyond max_keys."""
+        # Les compteurs sont ordonnés du moins au plus récemment vu
+        while self.counters:
+            key, counter = next(iter(self.counters.items()))
+            if bucket - counter.current >= self.buckets:
+                self.stats["expired"] += 1
+            elif len(self.counters) > self.max_keys:
+                self.stats["evicted"] += 1
+            else:
+                break
+            del self.counters[key]
+            self.suspects_keys.discard(key)
+
+    async def on_batch(self, batch):
+        for visit in batch.visits:
+            self.record(visit["ip"], visit["domain"])
+
+    def suspects(self, domain: Optional[str] = None, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """IPs currently above the threshold, most active first."""
+        bucket = self.bucket(now)
+        suspects = []
+        for key in list(self.suspects_keys):
+            counter = self.counters[key]
+            counter.advance(bucket)
+            if counter.total <= self.threshold:
+                self.suspects_keys.discard(key)
+            elif domain is None or key[1] == domain:
+                suspects.append({"ip": key[0], "domain": key[1], "visits": counter.total})
+        suspects.sort(key=lambda suspect: suspect["visits"], reverse=True)
+        return suspects
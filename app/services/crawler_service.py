@@ -0,0 +1,185 @@
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+from urllib.parse import urljoin, urldefrag, urlsplit
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+from cachetools import TTLCache
+from lxml import etree
+
+from app.utils.bloom_filter import BloomFilter
+from config.settings import (
+    CRAWL_CONCURRENCY,
+    CRAWL_MAX_DEPTH,
+    CRAWL_MAX_PAGES,
+    CRAWL_USER_AGENT,
+)
+
+logger = logging.getLogger(__name__)
+
+# robots.txt déjà récupérés, par origine (scheme://host)
+_robots_cache: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+
+# Taille maximale lue par page pour en extraire les liens
+MAX_PAGE_BYTES = 1024 * 1024
+CHUNK_SIZE = 16 * 1024
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class SiteCrawler:
+    def __init__(
+        self,
+        base_url: str,
+        max_depth: int = CRAWL_MAX_DEPTH,
+        max_pages: int = CRAWL_MAX_PAGES,
+        concurrency: int = CRAWL_CONCURRENCY,
+        user_agent: str = CRAWL_USER_AGENT,
+    ):
+        """
+        Breadth-first, same-origin crawler used when a domain has no sitemap.
+
+        Args:
+            base_url: URL the crawl starts from
+            max_depth: Number of link hops followed from the start URL
+            max_pages: Maximum number of URLs returned
+            concurrency: Maximum number of pages fetched at the same time
+            user_agent: User-Agent sent with requests and matched against robots.txt
+        """
+        self.base_url = base_url.rstrip("/") + "/"
+        self.origin = _origin(self.base_url)
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.user_agent = user_agent
+        self.visited = BloomFilter(capacity=max_pages)
+
+    async def get_robots(self, session: aiohttp.ClientSession) -> RobotFileParser:
+        """
+        Get the robots.txt rules of the crawled origin, fetching them once per host.
+
+        Returns:
+            Parsed robots.txt rules
+        """
+        robots = _robots_cache.get(self.origin)
+        if robots is not None:
+            return robots
+
+        robots = RobotFileParser(f"{self.origin}/robots.txt")
+        try:
+            async with session.get(robots.url, timeout=10) as response:
+                if response.status in (401, 403):
+                    robots.disallow_all = True
+                elif response.status >= 400:
+                    robots.allow_all = True
+                else:
+                    robots.parse((await response.text(errors="replace")).splitlines())
+        except Exception as e:
+            logger.warning(f"robots.txt indisponible pour {self.origin}: {str(e)}")
+            robots.allow_all = True
+
+        _robots_cache[self.origin] = robots
+        return robots
+
+    def normalize(self, url: str, href: str) -> Optional[str]:
+        """
+        Resolve a link against the page it was found on and keep it only if same-origin.
+
+        Returns:
+            The absolute URL without fragment, or None if the link must not be followed
+        """
+        href = href.strip()
+        if not href or href.startswith(("mailto:", "tel:", "javascript:", "data:")):
+            return None
+        absolute, _ = urldefrag(urljoin(url, href))
+        if _origin(absolute) != self.origin:
+            return None
+        return absolute
+
+    async def extract_links(self, response: aiohttp.ClientResponse) -> List[str]:
+        """
+        Stream an HTML response through lxml and collect the href of every <a> tag.
+
+        Only the first MAX_PAGE_BYTES are read, the page is never buffered whole.
+        """
+        parser = etree.HTMLPullParser(events=("start",), tag="a")
+        links = []
+        read = 0
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            parser.feed(chunk)
+            for _, element in parser.read_events():
+                href = element.get("href")
+                if href:
+                    links.append(href)
+                element.clear()
+            read += len(chunk)
+            if read >= MAX_PAGE_BYTES:
+                break
+        try:
+            parser.close()
+        except etree.LxmlError:
+            pass
+        return links
+
+    async def fetch_links(
+        self, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, url: str
+    ) -> List[str]:
+        async with semaphore:
+            try:
+                async with session.get(url, timeout=10, allow_redirects=True) as response:
+                    content_type = response.headers.get("Content-Type", "")
+                    if response.status >= 400 or "html" not in content_type:
+                        return []
+                    # Une redirection vers un autre domaine ne doit pas étendre le crawl
+                    if _origin(str(response.url)) != self.origin:
+                        return []
+                    links = await self.extract_links(response)
+                    return [link for link in (self.normalize(str(response.url), href) for href in links) if link]
+            except Exception as e:
+                logger.debug(f"Crawl impossible pour {url}: {str(e)}")
+                return []
+
+    async def crawl(self, session: Optional[aiohttp.ClientSession] = None) -> List[str]:
+        """
+        Crawl the site breadth-first from the base URL.
+
+        Pages found at ``max_depth`` are returned but not expanded.
+
+        Returns:
+            List of discovered URLs, the base URL first
+        """
+        if session is None:
+            headers = {"User-Agent": self.user_agent}
+            async with aiohttp.ClientSession(headers=headers) as session:
+                return await self.crawl(session)
+
+        robots = await self.get_robots(session)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        pages: List[str] = [self.base_url]
+        self.visited.add(self.base_url)
+        frontier: List[Tuple[str, int]] = [(self.base_url, 0)]
+
+        while frontier and len(pages) < self.max_pages:
+            to_expand = [url for url, depth in frontier if depth < self.max_depth]
+            depth = frontier[0][1] + 1
+            frontier = []
+            results = await asyncio.gather(
+                *(self.fetch_links(session, semaphore, url) for url in to_expand)
+            )
+            for links in results:
+                for link in links:
+                    if len(pages) >= self.max_pages:
+                        break
+                    if not robots.can_fetch(self.user_agent, link):
+                        continue
+                    if self.visited.add(link):
+                        pages.append(link)
+                        frontier.append((link, depth))
+
+        logger.info(f"Crawl de {self.origin}: {len(pages)} pages découvertes")
+        return pages
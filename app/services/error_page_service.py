@@ -2,17 +2,46 @@ import asyncio
 import aiohttp
 import requests
 from bs4 import BeautifulSoup
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, Callable
 import logging
+import uuid
+from urllib.parse import urlsplit
+from cachetools import TTLCache
+from app.services.crawler_service import SiteCrawler
+from app.utils.simhash import simhash, html_tokens, hamming_distance
+from config.settings import SOFT_404_MAX_BYTES, SOFT_404_MAX_DISTANCE, SOFT_404_MIN_TOKENS
+
+# Callback (pages vérifiées, total, erreur ou None) appelé après chaque page
+ProgressCallback = Callable[[int, int, Optional[Dict[str, Any]]], None]
+
+# Empreinte de la page 404 de chaque site, apprise une fois par origine
+_not_found_fingerprints: TTLCache = TTLCache(maxsize=1024, ttl=24 * 3600)
+
+# Origines dont la sonde a échoué (timeout, erreur réseau): pas de nouvelle sonde pendant 10 minutes,
+# sinon chaque page du scan attendrait le verrou puis refairait une sonde de 10 s
+_failed_fingerprint_probes: TTLCache = TTLCache(maxsize=1024, ttl=600)
+
+
+def page_fingerprint(html: str) -> Optional[int]:
+    """Simhash of the body text, or None if it has too few words to be compared."""
+    tokens = html_tokens(html)
+    if len(tokens) < SOFT_404_MIN_TOKENS:
+        return None
+    return simhash(tokens)
 
 class ErrorPageService:
-    def __init__(self, domain: Union[str, List[str]]):
+    def __init__(self, domain: Union[str, List[str]], crawl_fallback: bool = True, detect_soft_404: bool = False):
         """
         Initialize the ErrorPageService with a domain or list of domains.
         
         Args:
             domain: The domain to check for error pages, or a list of URLs
+            crawl_fallback: Crawl the site when it has no usable sitemap.xml
+            detect_soft_404: Also report pages answering 200 with the site's "not found" content
         """
+        self.crawl_fallback = crawl_fallback
+        self.detect_soft_404 = detect_soft_404
+        self.fingerprint_lock = asyncio.Lock()
         if isinstance(domain, list):
             # If a list is provided, use it directly as the pages to check
             self.domain = None
@@ -27,7 +56,8 @@ class ErrorPageService:
     async def get_all_pages_from_sitemap(self) -> List[str]:
         """
         Get all pages from the sitemap.xml of the domain.
-        If sitemap.xml is not found, add the root URL.
+        If sitemap.xml is not found, crawl the site from the root URL
+        (or only check the root URL when crawl_fallback is disabled).
         
         Returns:
             List of URLs to check
@@ -49,18 +79,33 @@ class ErrorPageService:
                         if urls:
                             self.pages = [url.text for url in urls]
                         else:
-                            # If sitemap doesn't contain URLs, add the root URL
-                            self.pages = [self.base_url]
+                            # If sitemap doesn't contain URLs, discover pages from the root URL
+                            self.pages = await self.get_fallback_pages()
                     else:
-                        # If sitemap doesn't exist, add the root URL
-                        self.pages = [self.base_url]
+                        # If sitemap doesn't exist, discover pages from the root URL
+                        self.pages = await self.get_fallback_pages()
         except Exception as e:
             logging.error(f"Error fetching sitemap for {self.domain}: {str(e)}")
-            # Add the root URL as fallback
-            self.pages = [self.base_url]
+            self.pages = await self.get_fallback_pages()
             
         return self.pages
 
+    async def get_fallback_pages(self) -> List[str]:
+        """
+        Get the pages to check when the sitemap is missing or empty.
+        
+        Returns:
+            URLs found by crawling the site, or only the root URL if crawling is disabled or fails
+        """
+        if not self.crawl_fallback:
+            return [self.base_url]
+
+        try:
+            return await SiteCrawler(self.base_url).crawl()
+        except Exception as e:
+            logging.error(f"Error crawling {self.domain}: {str(e)}")
+            return [self.base_url]
+
     async def check_single_page(self, session: aiohttp.ClientSession, url: str) -> Optional[Dict[str, Any]]:
         """
         Check a single page for errors.
@@ -81,6 +126,8 @@ class ErrorPageService:
                         "status_code": status,
                         "error_message": response.reason
                     }
+                if self.detect_soft_404:
+                    return await self.check_soft_404(session, url, response)
                 return None
         except Exception as e:
             return {
@@ -89,10 +136,107 @@ class ErrorPageService:
                 "error_message": str(e)
             }
 
-    async def get_errors_async(self) -> List[Dict[str, Any]]:
+    async def read_head(self, response: aiohttp.ClientResponse) -> str:
+        """
+        Read only the first SOFT_404_MAX_BYTES of a response body.
+        
+        Returns:
+            The decoded beginning of the body
+        """
+        chunks = []
+        size = 0
+        while size < SOFT_404_MAX_BYTES:
+            chunk = await response.content.read(SOFT_404_MAX_BYTES - size)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        return b"".join(chunks).decode(response.charset or "utf-8", errors="replace")
+
+    async def get_not_found_fingerprint(self, session: aiohttp.ClientSession, origin: str) -> Optional[Dict[str, Any]]:
+        """
+        Learn what the site answers for a page that does not exist, once per origin.
+        
+        Args:
+            session: The aiohttp session to use
+            origin: scheme://host of the site
+            
+        Returns:
+            The simhash and final URL of the "not found" page, or None if the site returns
+            real 404s or could not be probed recently
+        """
+        if origin in _not_found_fingerprints:
+            return _not_found_fingerprints[origin]
+        if origin in _failed_fingerprint_probes:
+            return None
+
+        async with self.fingerprint_lock:
+            if origin in _not_found_fingerprints:
+                return _not_found_fingerprints[origin]
+            if origin in _failed_fingerprint_probes:
+                return None
+
+            probe_url = f"{origin}/{uuid.uuid4().hex}"
+            try:
+                async with session.get(probe_url, timeout=10, allow_redirects=True) as response:
+                    fingerprint = None
+                    if response.status < 400:
+                        fingerprint = {
+                            "simhash": page_fingerprint(await self.read_head(response)),
+                            "final_url": str(response.url),
+                            "redirected": str(response.url) != probe_url,
+                        }
+            except Exception as e:
+                logging.warning(f"Unable to learn the 404 page of {origin}: {str(e)}")
+                _failed_fingerprint_probes[origin] = True
+                return None
+
+            _not_found_fingerprints[origin] = fingerprint
+            return fingerprint
+
+    async def check_soft_404(self, session: aiohttp.ClientSession, url: str, response: aiohttp.ClientResponse) -> Optional[Dict[str, Any]]:
+        """
+        Check whether a successful response is actually the site's "not found" page.
+        
+        Returns:
+            Dictionary with error details if the page is a soft 404, None otherwise
+        """
+        parts = urlsplit(url)
+        fingerprint = await self.get_not_found_fingerprint(session, f"{parts.scheme}://{parts.netloc}")
+        if not fingerprint:
+            return None
+
+        final_url = str(response.url)
+        if fingerprint["redirected"]:
+            # Le site redirige les pages inexistantes (souvent vers l'accueil)
+            if final_url == url or final_url != fingerprint["final_url"]:
+                return None
+            distance = 0
+        else:
+            # Page 404 ou page vérifiée sans assez de texte: pas de comparaison possible
+            page_simhash = page_fingerprint(await self.read_head(response))
+            if fingerprint["simhash"] is None or page_simhash is None:
+                return None
+            distance = hamming_distance(page_simhash, fingerprint["simhash"])
+            if distance > SOFT_404_MAX_DISTANCE:
+                return None
+
+        return {
+            "url": url,
+            "status_code": response.status,
+            "error_message": "Soft 404: page not found content served with a success status",
+            "soft_404": True,
+            "distance": distance
+        }
+
+    async def get_errors_async(self, on_progress: Optional[ProgressCallback] = None) -> List[Dict[str, Any]]:
         """
         Asynchronously check all pages for errors.
         
+        Args:
+            on_progress: Optional callback called after each page with
+                (pages checked, total pages, error details or None)
+        
         Returns:
             List of dictionaries with error details
         """
@@ -101,8 +245,19 @@ class ErrorPageService:
         if not self.pages:
             await self.get_all_pages_from_sitemap()
             
+        total = len(self.pages)
+        done = 0
+
+        async def check_and_report(session: aiohttp.ClientSession, url: str) -> Optional[Dict[str, Any]]:
+            nonlocal done
+            result = await self.check_single_page(session, url)
+            done += 1
+            if on_progress:
+                on_progress(done, total, result)
+            return result
+
         async with aiohttp.ClientSession() as session:
-            tasks = [self.check_single_page(session, url) for url in self.pages]
+            tasks = [check_and_report(session, url) for url in self.pages]
             results = await asyncio.gather(*tasks, return_exceptions=True)
             
             for result in results:
@@ -111,14 +266,17 @@ class ErrorPageService:
                     
         return errors
 
-    async def check_error_pages(self) -> List[Dict[str, Any]]:
+    async def check_error_pages(self, on_progress: Optional[ProgressCallback] = None) -> List[Dict[str, Any]]:
         """
         Check all pages in the sitemap for errors.
         
+        Args:
+            on_progress: Optional callback, see get_errors_async
+        
         Returns:
             List of dictionaries with error details
         """
         # Simply await the async task instead of using run_until_complete()
-        errors_result = await self.get_errors_async()
+        errors_result = await self.get_errors_async(on_progress)
         
         return errors_result
\ No newline at end of file
@@ -0,0 +1,151 @@
+import asyncio
+import itertools
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+from redis import asyncio as aioredis
+
+from config.settings import EVENT_BUS_CHANNEL, EVENT_BUS_FLUSH_MS, EVENT_BUS_REDIS_URL, EVENT_BUS_SEQUENCE_KEY
+
+logger = logging.getLogger(__name__)
+
+# Événement diffusé: {"seq", "message": JSON sérialisé, "key", "domain", "event"}
+Event = Dict[str, Any]
+Handler = Callable[[List[Event]], None]
+
+
+def stamp(event: Event, seq: int) -> Event:
+    """Give an event its sequence number, also added to its serialized message."""
+    event["seq"] = seq
+    event["message"] = f'{{"seq":{seq},{event["message"][1:]}'
+    return event
+
+
+class LocalEventBus:
+    """
+    In-process bus: events only reach the sockets of this worker.
+
+    Events are numbered by a counter of the process, restarted with it.
+    """
+
+    def __init__(self):
+        self.handlers: List[Handler] = []
+        self.sequence = itertools.count(1)
+        self.stats = {"published": 0, "batches": 0}
+
+    def subscribe(self, handler: Handler):
+        self.handlers.append(handler)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def deliver(self, events: List[Event]):
+        self.stats["batches"] += 1
+        for handler in self.handlers:
+            try:
+                handler(events)
+            except Exception:
+                logger.exception("❌ Erreur lors de la diffusion d'événements")
+
+    def publish(self, event: Event):
+        self.stats["published"] += 1
+        self.deliver([stamp(event, next(self.sequence))])
+
+
+class RedisEventBus(LocalEventBus):
+    def __init__(
+        self,
+        redis_client,
+        channel: str = EVENT_BUS_CHANNEL,
+        flush_ms: int = EVENT_BUS_FLUSH_MS,
+        sequence_key: str = EVENT_BUS_SEQUENCE_KEY,
+    ):
+        """
+        Redis pub/sub bus shared by every worker.
+
+        Events published within ``flush_ms`` are sent as one Redis message; each
+        worker (including the publisher) receives it through its subscription and
+        hands it to its local handlers. Sequence numbers come from a Redis counter
+        (one INCRBY per message), so they are shared by every worker.
+
+        Args:
+            redis_client: ``redis.asyncio`` client
+            channel: Redis channel of the visit events
+            flush_ms: Time an event waits for others to be published with it
+            sequence_key: Redis key of the event counter
+        """
+        super().__init__()
+        self.redis = redis_client
+        self.channel = channel
+        self.sequence_key = sequence_key
+        self.flush_interval = flush_ms / 1000
+        self.pending: List[Event] = []
+        self.flush_task: Optional[asyncio.Task] = None
+        self.listen_task: Optional[asyncio.Task] = None
+        self.pubsub = None
+
+    async def start(self):
+        if self.listen_task is None or self.listen_task.done():
+            self.pubsub = self.redis.pubsub()
+            await self.pubsub.subscribe(self.channel)
+            self.listen_task = asyncio.create_task(self.listen())
+
+    async def stop(self):
+        try:
+            await self.flush()
+        finally:
+            # Redis indisponible: le listener et l'abonnement sont libérés quand même
+            if self.listen_task is not None:
+                self.listen_task.cancel()
+                await asyncio.gather(self.listen_task, return_exceptions=True)
+                self.listen_task = None
+            if self.pubsub is not None:
+                pubsub, self.pubsub = self.pubsub, None
+                try:
+                    await pubsub.unsubscribe(self.channel)
+                finally:
+                    await pubsub.aclose()
+
+    def publish(self, event: Event):
+        self.stats["published"] += 1
+        self.pending.append(event)
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("❌ Erreur lors de la publication d'événements sur Redis")
+
+    async def flush(self):
+        events, self.pending = self.pending, []
+        if events:
+            last = await self.redis.incrby(self.sequence_key, len(events))
+            for seq, event in enumerate(events, start=last - len(events) + 1):
+                stamp(event, seq)
+            await self.redis.publish(self.channel, json.dumps(events))
+
+    async def listen(self):
+        while True:
+            try:
+                async for message in self.pubsub.listen():
+                    if message["type"] == "message":
+                        self.deliver(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("❌ Abonnement Redis interrompu, nouvelle tentative")
+                await asyncio.sleep(1)
+
+
+def create_event_bus(redis_url: Optional[str] = EVENT_BUS_REDIS_URL):
+    """Redis bus when ``redis_url`` is set (several workers), in-process otherwise."""
+    if not redis_url:
+        return LocalEventBus()
+    return RedisEventBus(aioredis.from_url(redis_url))
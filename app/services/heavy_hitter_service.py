@@ -0,0 +1,153 @@
+import asyncio
+import datetime
+import logging
+import os
+import socket
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from app.services.rollup_service import truncate
+from app.utils.space_saving import SpaceSaving
+from config.settings import HEAVY_HITTERS_CAPACITY, HEAVY_HITTERS_SNAPSHOT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Snapshots des résumés top-K par (domaine, dimension, heure, worker)
+HEAVY_HITTER_COLLECTION = "heavy_hitters"
+
+# Dimension demandée via ?dim= : champ de la visite
+HEAVY_HITTER_DIMENSIONS = {"ip": "ip", "user_agent": "user_agent"}
+
+# Nombre maximal d'heures fusionnées par GET /agents/top
+HEAVY_HITTERS_MAX_HOURS = 24 * 7
+
+# Durée de vie des snapshots (index TTL): la plage lisible plus une marge d'un jour
+HEAVY_HITTERS_TTL_SECONDS = (HEAVY_HITTERS_MAX_HOURS + 24) * 3600
+
+WindowKey = Tuple[str, str, datetime.datetime]
+
+
+class HeavyHitters:
+    def __init__(
+        self,
+        db,
+        capacity: int = HEAVY_HITTERS_CAPACITY,
+        snapshot_interval: float = HEAVY_HITTERS_SNAPSHOT_INTERVAL,
+    ):
+        """
+        Most frequent IPs / user agents per domain and hour, as Space-Saving summaries.
+
+        Summaries of the current and previous hour are updated in memory at
+        ingest and snapshotted to MongoDB every ``snapshot_interval`` seconds,
+        one document per worker; reads merge the snapshots of every worker.
+
+        Args:
+            db: Motor database holding the snapshot collection
+            capacity: Counters per summary (memory per domain, dimension and hour)
+            snapshot_interval: Seconds between two snapshots
+        """
+        self.collection = db[HEAVY_HITTER_COLLECTION]
+        self.capacity = capacity
+        self.snapshot_interval = snapshot_interval
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.windows: Dict[WindowKey, SpaceSaving] = {}
+        self.dirty: set = set()
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.snapshot()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await self.snapshot()
+            except Exception:
+                logger.exception("❌ Erreur lors de la sauvegarde des top-K")
+
+    def record(self, visits: Iterable[Dict[str, Any]]):
+        """
+        Count visits of the current and previous hour.
+
+        ``date_entree`` comes from the client: a visit outside these windows is
+        ignored, since its hour may already be snapshotted and dropped from
+        memory (a fresh summary would overwrite the stored counts).
+        """
+        current_hour = truncate(datetime.datetime.utcnow(), "hour")
+        previous_hour = current_hour - datetime.timedelta(hours=1)
+        for visit in visits:
+            hour = truncate(visit["date_entree"], "hour")
+            if not previous_hour <= hour <= current_hour:
+                continue
+            for dim, field in HEAVY_HITTER_DIMENSIONS.items():
+                if visit.get(field):
+                    key = (visit["domain"], dim, hour)
+                    summary = self.windows.get(key)
+                    if summary is None:
+                        summary = self.windows[key] = SpaceSaving(self.capacity)
+                    summary.add(str(visit[field]))
+                    self.dirty.add(key)
+
+    async def on_batch(self, batch):
+        self.record(batch.visits)
+
+    async def snapshot(self):
+        """Save the summaries changed since the last snapshot and forget the closed hours."""
+        dirty, self.dirty = self.dirty, set()
+        operations = [
+            UpdateOne(
+                {"domain": domain, "dim": dim, "window": hour, "worker": self.worker},
+                {"$set": {**self.windows[(domain, dim, hour)].to_dict(), "updated_at": datetime.datetime.utcnow()}},
+                upsert=True,
+            )
+            for domain, dim, hour in dirty
+        ]
+        if operations:
+            try:
+                await self.collection.bulk_write(operations, ordered=False)
+            except Exception:
+                self.dirty |= dirty
+                raise
+
+        # Au-delà de l'heure précédente, les visites n'arrivent plus: le snapshot fait foi
+        previous_hour = truncate(datetime.datetime.utcnow(), "hour") - datetime.timedelta(hours=1)
+        for key in [key for key in self.windows if key[2] < previous_hour and key not in self.dirty]:
+            del self.windows[key]
+
+    async def top(self, domain: str, dim: str = "ip", hours: int = 1, limit: int = 10) -> Dict[str, Any]:
+        """
+        Most frequent values of a dimension over the last ``hours`` hours.
+
+        Raises:
+            ValueError: If the dimension is unknown
+        """
+        if dim not in HEAVY_HITTER_DIMENSIONS:
+            raise ValueError(f"Dimension inconnue: {dim}")
+        hours = max(1, min(hours, HEAVY_HITTERS_MAX_HOURS))
+        start = truncate(datetime.datetime.utcnow(), "hour") - datetime.timedelta(hours=hours - 1)
+
+        total = SpaceSaving(self.capacity)
+        live = {
+            hour: summary
+            for (window_domain, window_dim, hour), summary in self.windows.items()
+            if window_domain == domain and window_dim == dim and hour >= start
+        }
+        for summary in live.values():
+            total.merge(summary)
+        query = {"domain": domain, "dim": dim, "window": {"$gte": start}}
+        async for snapshot in self.collection.find(query, {"_id": 0}):
+            # Les résumés en mémoire de ce worker sont plus récents que leur snapshot
+            if snapshot["worker"] == self.worker and snapshot["window"] in live:
+                continue
+            total.merge(SpaceSaving.from_dict(snapshot))
+
+        return {"domain": domain, "dim": dim, "start": start, "total": total.total, "top": total.top(limit)}
@@ -1,17 +1,68 @@
 # app/services/http_service.py
 
-import requests
-from config.settings import API_URL
+import asyncio
+import logging
+import time
+
+import aiohttp
+from config.settings import API_URL, DOMAINS_CACHE_TTL, DOMAINS_FETCH_TIMEOUT, DOMAINS_RETRY_DELAY
+
+logger = logging.getLogger(__name__)
+
 
 class HTTPService:
+    # Cache partagé par toutes les instances (stale-while-revalidate)
+    _cache = {"data": None, "etag": None, "refresh_at": 0.0}
+    _refresh_task = None
+
     def __init__(self):
         self.api_url = API_URL  # Récupère l'URL depuis settings.py
 
-    def get_domains(self):
-        try:
-            response = requests.get(self.api_url)  # Effectue l'appel à l'API externe
-            response.raise_for_status()  # Vérifie que la requête a réussi (code 200)
-            return response.json()  # Retourne les données JSON
-        except requests.exceptions.RequestException as e:
-            print(f"Erreur lors de la récupération des données : {e}")
+    async def get_domains(self):
+        """
+        Retourne la liste des domaines depuis le cache.
+
+        Les données sont servies immédiatement; une fois le TTL dépassé elles sont
+        rafraîchies en arrière-plan, et restent servies si l'API externe est indisponible.
+        Seul le tout premier appel attend la réponse de l'API; après un échec sans
+        données en cache, None est retourné jusqu'à la fin du délai de réessai.
+        """
+        cache = HTTPService._cache
+        due = time.monotonic() >= cache["refresh_at"]
+        if cache["data"] is None:
+            task = HTTPService._refresh_task
+            if due or (task is not None and not task.done()):
+                return await asyncio.shield(self.refresh())
             return None
+        if due:
+            self.refresh()
+        return cache["data"]
+
+    def refresh(self) -> asyncio.Task:
+        # Un seul rafraîchissement à la fois, partagé par les requêtes concurrentes
+        task = HTTPService._refresh_task
+        if task is None or task.done():
+            task = HTTPService._refresh_task = asyncio.create_task(self.fetch_domains())
+        return task
+
+    async def fetch_domains(self):
+        cache = HTTPService._cache
+        headers = {"If-None-Match": cache["etag"]} if cache["etag"] and cache["data"] is not None else {}
+        try:
+            timeout = aiohttp.ClientTimeout(total=DOMAINS_FETCH_TIMEOUT)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.get(self.api_url, headers=headers) as response:  # Effectue l'appel à l'API externe
+                    if response.status != 304:
+                        response.raise_for_status()  # Vérifie que la requête a réussi (code 200)
+                        cache["data"] = await response.json(content_type=None)
+                        cache["etag"] = response.headers.get("ETag")
+            cache["refresh_at"] = time.monotonic() + DOMAINS_CACHE_TTL
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.warning(f"Erreur lors de la récupération des données : {e}")
+            # On garde les données périmées et on réessaie plus tard
+            cache["refresh_at"] = time.monotonic() + DOMAINS_RETRY_DELAY
+        except Exception:
+            # Tâche en arrière-plan: aucune exception ne doit rester non récupérée
+            logger.exception("Erreur inattendue lors de la récupération des données")
+            cache["refresh_at"] = time.monotonic() + DOMAINS_RETRY_DELAY
+        return cache["data"]
@@ -0,0 +1,280 @@
+import datetime
+import logging
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError, ServerSelectionTimeoutError
+
+from app.services.heavy_hitter_service import HEAVY_HITTER_COLLECTION, HEAVY_HITTERS_TTL_SECONDS
+from app.services.retention_service import RETENTION_COLLECTIONS
+from app.services.rollup_service import ROLLUP_COLLECTIONS
+from app.services.unique_visitor_service import SKETCH_COLLECTION
+from app.services.visit_ingest_service import DUPLICATE_KEY, OPEN_SESSION
+from app.services.visit_query_service import VISIT_SORT
+from config.settings import IP_LOG_BUCKET_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Index attendus sur chaque collection, créés au démarrage
+INDEXES: Dict[str, List[IndexModel]] = {
+    "visits": [
+        # Session ouverte d'un utilisateur (clôturée à chaque nouvelle visite),
+        # unique pour empêcher deux sessions ouvertes en parallèle
+        IndexModel(
+            [("domain", ASCENDING), ("tracking_user_analytics", ASCENDING)],
+            name="open_session_unique",
+            partialFilterExpression=OPEN_SESSION,
+            unique=True,
+        ),
+        # Visites d'une IP sur un domaine (GET /agents/visits?domain=&ip=)
+        IndexModel(
+            [("domain", ASCENDING), ("ip", ASCENDING), ("date_entree", DESCENDING)],
+            name="domain_ip_date_entree",
+        ),
+        # Pagination par curseur de GET /agents/visits (avec ou sans filtres)
+        IndexModel([("date_entree", DESCENDING), ("_id", DESCENDING)], name="date_entree_id"),
+        IndexModel(
+            [("domain", ASCENDING), ("date_entree", DESCENDING), ("_id", DESCENDING)],
+            name="domain_date_entree_id",
+        ),
+        IndexModel(
+            [
+                ("domain", ASCENDING),
+                ("tracking_user_analytics", ASCENDING),
+                ("date_entree", DESCENDING),
+                ("_id", DESCENDING),
+            ],
+            name="domain_tracking_date_entree_id",
+        ),
+    ],
+    "ip_logs": [
+        # Bucket horaire non plein d'un domaine (écriture)
+        IndexModel(
+            [("domain", ASCENDING), ("bucket", DESCENDING), ("count", ASCENDING)],
+            name="domain_bucket_count",
+        ),
+        # Plage de buckets tous domaines confondus (lecture)
+        IndexModel([("bucket", DESCENDING)], name="bucket"),
+    ],
+    # Un document par (domaine, bucket) dans chaque collection d'agrégats
+    **{
+        collection_name: [
+            IndexModel([("domain", ASCENDING), ("bucket", ASCENDING)], name="domain_bucket", unique=True)
+        ]
+        for collection_name in ROLLUP_COLLECTIONS.values()
+    },
+    # Un sketch HyperLogLog par (domaine, jour)
+    SKETCH_COLLECTION: [
+        IndexModel([("domain", ASCENDING), ("day", ASCENDING)], name="domain_day", unique=True),
+    ],
+    # Un snapshot top-K par (domaine, dimension, heure, worker)
+    HEAVY_HITTER_COLLECTION: [
+        IndexModel(
+            [("domain", ASCENDING), ("dim", ASCENDING), ("window", ASCENDING), ("worker", ASCENDING)],
+            name="domain_dim_window_worker",
+            unique=True,
+        ),
+        # Snapshots expirés une fois hors de la plage lue par GET /agents/top
+        IndexModel([("window", ASCENDING)], name="window_ttl", expireAfterSeconds=HEAVY_HITTERS_TTL_SECONDS),
+    ],
+}
+
+# Index remplacés, supprimés au démarrage
+OBSOLETE_INDEXES: Dict[str, List[str]] = {
+    "visits": ["open_session"],
+}
+
+# Formes des requêtes exécutées par l'application, vérifiées par /debug/indexes
+_SAMPLE_DATE = datetime.datetime(2000, 1, 1)
+QUERY_SHAPES: List[Dict[str, Any]] = [
+    {
+        "name": "open_session",
+        "collection": "visits",
+        "filter": {"domain": "example.com", "tracking_user_analytics": "sample", **OPEN_SESSION},
+    },
+    {
+        "name": "visits_page_by_ip",
+        "collection": "visits",
+        "filter": {"domain": "example.com", "ip": "0.0.0.0", "date_entree": {"$gte": _SAMPLE_DATE}},
+        "sort": VISIT_SORT,
+    },
+    {
+        "name": "visits_page",
+        "collection": "visits",
+        "filter": {"date_entree": {"$lt": _SAMPLE_DATE}},
+        "sort": VISIT_SORT,
+    },
+    {
+        "name": "visits_page_by_domain",
+        "collection": "visits",
+        "filter": {"domain": "example.com", "date_entree": {"$gte": _SAMPLE_DATE}},
+        "sort": VISIT_SORT,
+    },
+    {
+        "name": "visits_page_by_visitor",
+        "collection": "visits",
+        "filter": {"domain": "example.com", "tracking_user_analytics": "sample"},
+        "sort": VISIT_SORT,
+    },
+    {
+        "name": "visit_rollups_range",
+        "collection": ROLLUP_COLLECTIONS["hour"],
+        "filter": {"domain": "example.com", "bucket": {"$gte": _SAMPLE_DATE}},
+        "sort": [("bucket", ASCENDING)],
+    },
+    {
+        "name": "visitor_sketches_range",
+        "collection": SKETCH_COLLECTION,
+        "filter": {"domain": "example.com", "day": {"$gte": _SAMPLE_DATE, "$lt": _SAMPLE_DATE}},
+    },
+    {
+        "name": "heavy_hitters_range",
+        "collection": HEAVY_HITTER_COLLECTION,
+        "filter": {"domain": "example.com", "dim": "ip", "window": {"$gte": _SAMPLE_DATE}},
+    },
+    # Balayage de rétention: documents les plus anciens avant l'horizon
+    *[
+        {
+            "name": f"{collection_name}_retention_sweep",
+            "collection": collection_name,
+            "filter": {field: {"$lt": _SAMPLE_DATE}},
+            "sort": [(field, ASCENDING)],
+        }
+        for collection_name, field in RETENTION_COLLECTIONS.items()
+    ],
+    {
+        "name": "ip_log_bucket_append",
+        "collection": "ip_logs",
+        "filter": {"domain": "example.com", "bucket": _SAMPLE_DATE, "count": {"$lte": IP_LOG_BUCKET_SIZE - 1}},
+    },
+    {
+        "name": "ip_log_bucket_range",
+        "collection": "ip_logs",
+        "filter": {"domain": "example.com", "bucket": {"$exists": True, "$gte": _SAMPLE_DATE}},
+        "sort": [("bucket", DESCENDING)],
+    },
+    {
+        "name": "ip_log_bucket_range_all_domains",
+        "collection": "ip_logs",
+        "filter": {"bucket": {"$exists": True, "$gte": _SAMPLE_DATE}},
+        "sort": [("bucket", DESCENDING)],
+    },
+]
+
+# Résultat du dernier ensure_indexes (erreurs par collection)
+ensure_errors: Dict[str, str] = {}
+
+
+async def ensure_indexes(db) -> Dict[str, str]:
+    """
+    Create the declared indexes that do not exist yet.
+
+    An index that cannot be built (e.g. conflicting data) is logged and reported,
+    it does not prevent the application from starting.
+
+    Returns:
+        Error message per collection whose indexes could not all be created
+    """
+    ensure_errors.clear()
+    for collection_name, indexes in INDEXES.items():
+        try:
+            obsolete = OBSOLETE_INDEXES.get(collection_name, [])
+            if obsolete:
+                existing = await db[collection_name].index_information()
+                for index_name in obsolete:
+                    if index_name in existing:
+                        await db[collection_name].drop_index(index_name)
+
+            try:
+                await db[collection_name].create_indexes(indexes)
+            except OperationFailure as e:
+                if e.code != DUPLICATE_KEY or collection_name != "visits":
+                    raise
+                # Des sessions ouvertes en double empêchent l'index unique: on les répare
+                await close_duplicate_open_sessions(db.visits)
+                await db[collection_name].create_indexes(indexes)
+        except ServerSelectionTimeoutError as e:
+            # Serveur injoignable: inutile d'attendre le délai de sélection pour chaque collection
+            logger.error(f"❌ MongoDB injoignable, index non vérifiés: {e}")
+            for name in INDEXES:
+                ensure_errors.setdefault(name, str(e))
+            break
+        except PyMongoError as e:
+            logger.error(f"❌ Impossible de créer les index de {collection_name}: {e}")
+            ensure_errors[collection_name] = str(e)
+    return ensure_errors
+
+
+async def close_duplicate_open_sessions(visits_collection) -> int:
+    """
+    Close every open session but the most recent one of each (domain, user).
+
+    Returns:
+        Number of sessions closed
+    """
+    pipeline = [
+        {"$match": OPEN_SESSION},
+        {"$sort": {"date_entree": DESCENDING}},
+        {
+            "$group": {
+                "_id": {"domain": "$domain", "tracking_user_analytics": "$tracking_user_analytics"},
+                "ids": {"$push": "$_id"},
+                "count": {"$sum": 1},
+            }
+        },
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    closed = 0
+    now = datetime.datetime.utcnow()
+    async for group in visits_collection.aggregate(pipeline, allowDiskUse=True):
+        result = await visits_collection.update_many(
+            {"_id": {"$in": group["ids"][1:]}}, {"$set": {"date_sortie": now}}
+        )
+        closed += result.modified_count
+    logger.warning(f"⚠️ {closed} sessions ouvertes en double clôturées")
+    return closed
+
+
+def plan_stages(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten an explain() plan tree into its stages, root first."""
+    plan = plan.get("queryPlan", plan)
+    stages = [{"stage": plan.get("stage"), "index": plan.get("indexName")}]
+    children = plan.get("inputStages", [])
+    if "inputStage" in plan:
+        children = [plan["inputStage"]] + children
+    for child in children:
+        stages.extend(plan_stages(child))
+    return stages
+
+
+async def index_report(db) -> Dict[str, Any]:
+    """
+    Explain every declared query shape and flag the ones running without an index.
+
+    Returns:
+        Existing indexes per collection, the winning plan of each query shape
+        and the names of the shapes that need a collection scan
+    """
+    report: Dict[str, Any] = {"indexes": {}, "queries": [], "unindexed": [], "ensure_errors": ensure_errors}
+    for collection_name in INDEXES:
+        report["indexes"][collection_name] = await db[collection_name].index_information()
+
+    for shape in QUERY_SHAPES:
+        cursor = db[shape["collection"]].find(shape["filter"])
+        if shape.get("sort"):
+            cursor = cursor.sort(shape["sort"])
+        explain = await cursor.explain()
+        stages = plan_stages(explain["queryPlanner"]["winningPlan"])
+        indexed = not any(stage["stage"] == "COLLSCAN" for stage in stages)
+        report["queries"].append(
+            {
+                "name": shape["name"],
+                "collection": shape["collection"],
+                "indexed": indexed,
+                "indexes_used": [stage["index"] for stage in stages if stage["index"]],
+                "stages": [stage["stage"] for stage in stages],
+            }
+        )
+        if not indexed:
+            report["unindexed"].append(shape["name"])
+    return report
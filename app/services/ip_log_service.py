@@ -0,0 +1,115 @@
+import datetime
+from typing import Any, Dict, List, Optional
+
+from pymongo import DESCENDING, UpdateOne
+
+from config.settings import IP_LOG_BUCKET_SIZE, IP_LOG_PAGE_MAX_ENTRIES
+
+
+def bucket_start(date: datetime.datetime) -> datetime.datetime:
+    """Start of the hour bucket (UTC) a log entry belongs to."""
+    if date.tzinfo is not None:
+        date = date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return date.replace(minute=0, second=0, microsecond=0)
+
+
+def bucket_operations(domain: str, entries: List[Dict[str, Any]], size: int = IP_LOG_BUCKET_SIZE) -> List[UpdateOne]:
+    """
+    Build the writes appending IP log entries to the (domain, hour) buckets.
+
+    A bucket only accepts a chunk of entries if it still holds at most ``size``
+    entries afterwards, otherwise the upsert starts a new document for the same hour. Each write therefore
+    touches a bounded document, whatever the history of the domain.
+
+    Args:
+        domain: Domain the entries belong to
+        entries: IP log entries, each with a ``date_entree``
+        size: Maximum number of entries pushed into a bucket document
+
+    Returns:
+        UpdateOne operations for a bulk_write on ``ip_logs``
+    """
+    by_bucket: Dict[datetime.datetime, List[Dict[str, Any]]] = {}
+    for entry in entries:
+        by_bucket.setdefault(bucket_start(entry["date_entree"]), []).append(entry)
+
+    operations = []
+    for bucket, bucket_entries in by_bucket.items():
+        for i in range(0, len(bucket_entries), size):
+            chunk = bucket_entries[i:i + size]
+            dates = [entry["date_entree"] for entry in chunk]
+            operations.append(
+                UpdateOne(
+                    # Seul un bucket ayant la place pour tout le morceau convient, sinon upsert
+                    {"domain": domain, "bucket": bucket, "count": {"$lte": size - len(chunk)}},
+                    {
+                        "$push": {"ips": {"$each": chunk}},
+                        "$inc": {"count": len(chunk)},
+                        "$min": {"first": min(dates)},
+                        "$max": {"last": max(dates)},
+                    },
+                    upsert=True,
+                )
+            )
+    return operations
+
+
+def bucket_query(
+    domain: Optional[str] = None,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+) -> Dict[str, Any]:
+    """Filter selecting the buckets of a domain overlapping [start, end)."""
+    query: Dict[str, Any] = {"bucket": {"$exists": True}}
+    if domain:
+        query["domain"] = domain
+    if start:
+        query["bucket"]["$gte"] = bucket_start(start)
+    if end:
+        query["bucket"]["$lt"] = end
+    return query
+
+
+async def find_ip_log_buckets(
+    ip_collection,
+    domain: Optional[str] = None,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    limit: int = 100,
+    max_entries: int = IP_LOG_PAGE_MAX_ENTRIES,
+) -> List[Dict[str, Any]]:
+    """
+    Range query over the IP log buckets, most recent first.
+
+    At most ``max_entries`` entries are returned in total, the most recent
+    ones, so the response stays bounded whatever the size of the buckets.
+    ``count`` keeps the number of entries stored in the bucket.
+
+    Returns:
+        Bucket documents with their ``_id`` as a string and their ``ips``
+        most recent first
+    """
+    pipeline = [
+        {"$match": bucket_query(domain, start, end)},
+        {"$sort": {"bucket": DESCENDING, "_id": DESCENDING}},
+        {"$limit": limit},
+        # Une entrée par document, puis seules les max_entries plus récentes (tri top-k borné)
+        {"$unwind": {"path": "$ips", "includeArrayIndex": "position"}},
+        {"$sort": {"bucket": DESCENDING, "_id": DESCENDING, "position": DESCENDING}},
+        {"$limit": max_entries},
+        {
+            "$group": {
+                "_id": "$_id",
+                "domain": {"$first": "$domain"},
+                "bucket": {"$first": "$bucket"},
+                "count": {"$first": "$count"},
+                "first": {"$first": "$first"},
+                "last": {"$first": "$last"},
+                "ips": {"$push": "$ips"},
+            }
+        },
+        {"$sort": {"bucket": DESCENDING, "_id": DESCENDING}},
+        # _id converti par le serveur plutôt que document par document
+        {"$addFields": {"_id": {"$toString": "$_id"}}},
+    ]
+    return await ip_collection.aggregate(pipeline, allowDiskUse=True).to_list(limit)
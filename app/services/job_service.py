@@ -0,0 +1,199 @@
+import asyncio
+import datetime
+import logging
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config.settings import JOB_HISTORY, JOB_WORKERS
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+
+
+class Job:
+    def __init__(self, kind: str, key: str, func: Callable[["Job"], Awaitable[Any]]):
+        """
+        A long-running check executed by the JobManager worker pool.
+
+        Args:
+            kind: Type of job (e.g. "error_pages", "ssl")
+            key: What the job runs on, usually the domain
+            func: Coroutine function called with the job, its return value becomes the result
+        """
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.func = func
+        self.status = PENDING
+        self.progress = {"done": 0, "total": None}
+        self.results: List[Any] = []
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.datetime.utcnow()
+        self.started_at: Optional[datetime.datetime] = None
+        self.finished_at: Optional[datetime.datetime] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def notify(self):
+        # Réveiller les clients qui suivent le job puis réarmer l'événement
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def set_progress(self, done: int, total: Optional[int] = None):
+        self.progress = {"done": done, "total": total if total is not None else self.progress["total"]}
+        self.notify()
+
+    def add_result(self, item: Any):
+        """Publish a partial result while the job is still running."""
+        self.results.append(item)
+        self.notify()
+
+    def to_dict(self, results_from: int = 0) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "key": self.key,
+            "status": self.status,
+            "progress": self.progress,
+            "results": self.results[results_from:],
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    async def watch(self) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield the job state each time it changes, until it is finished.
+
+        Each snapshot only contains the partial results added since the previous one.
+        """
+        sent = 0
+        while True:
+            changed = self._changed
+            snapshot = self.to_dict(results_from=sent)
+            sent += len(snapshot["results"])
+            yield snapshot
+            if self.finished:
+                return
+            await changed.wait()
+
+
+class JobManager:
+    def __init__(self, workers: int = JOB_WORKERS, history: int = JOB_HISTORY):
+        """
+        Bounded worker pool running jobs in the background.
+
+        Args:
+            workers: Number of jobs allowed to run at the same time
+            history: Number of finished jobs kept for polling
+        """
+        self.workers = workers
+        self.history = history
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.in_flight: Dict[Tuple[str, str], Job] = {}
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker_tasks: List[asyncio.Task] = []
+        self.stopping = False
+
+    def start(self):
+        if self.worker_tasks:
+            return
+        self.stopping = False
+        self.queue = asyncio.Queue()
+        self.worker_tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        self.stopping = True
+        for job in list(self.in_flight.values()):
+            self.cancel(job.id)
+        for task in self.worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self.worker_tasks, return_exceptions=True)
+        self.worker_tasks = []
+
+    def submit(self, kind: str, key: str, func: Callable[[Job], Awaitable[Any]]) -> Tuple[Job, bool]:
+        """
+        Queue a job, or return the identical job already pending or running.
+
+        Returns:
+            The job and True if it was created by this call
+        """
+        existing = self.in_flight.get((kind, key))
+        if existing is not None:
+            return existing, False
+
+        self.start()
+        job = Job(kind, key, func)
+        self.jobs[job.id] = job
+        self.in_flight[(kind, key)] = job
+        self.queue.put_nowait(job)
+        self.prune()
+        return job, True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            # Pas encore démarré: le worker l'ignorera
+            self.finish(job, CANCELLED)
+        return job
+
+    def finish(self, job: Job, status: str, error: Optional[str] = None):
+        job.status = status
+        job.error = error
+        job.finished_at = datetime.datetime.utcnow()
+        self.in_flight.pop((job.kind, job.key), None)
+        job.notify()
+
+    def prune(self):
+        # Oublier les jobs terminés les plus anciens au-delà de l'historique
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    async def worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                if job.finished:
+                    continue
+                job.status = RUNNING
+                job.started_at = datetime.datetime.utcnow()
+                job.notify()
+                job.task = asyncio.create_task(job.func(job))
+                try:
+                    job.result = await job.task
+                    self.finish(job, DONE)
+                except asyncio.CancelledError:
+                    self.finish(job, CANCELLED)
+                    if self.stopping:
+                        raise
+                except Exception as e:
+                    logger.exception(f"Job {job.kind} {job.key} en échec")
+                    self.finish(job, FAILED, str(e))
+            finally:
+                self.queue.task_done()
+
+
+job_manager = JobManager()
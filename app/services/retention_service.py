@@ -0,0 +1,356 @@
+import asyncio
+import datetime
+import gzip
+import heapq
+import itertools
+import logging
+import os
+import socket
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, DeleteOne
+from pymongo.errors import DuplicateKeyError
+
+from app.services.rollup_service import to_utc
+from app.services.visit_query_service import VISIT_DATE_FIELDS
+from app.utils.api_utils import dumps, iso_date, loads
+from config.settings import (
+    RETENTION_ARCHIVE_DIR,
+    RETENTION_BATCH_SIZE,
+    RETENTION_DAYS,
+    RETENTION_SWEEP_INTERVAL,
+    VISITS_STREAM_CHUNK,
+)
+
+logger = logging.getLogger(__name__)
+
+# Collections soumises à la rétention et leur champ date
+RETENTION_COLLECTIONS = {"visits": "date_entree", "ip_logs": "bucket"}
+
+# Champ modifié par les écritures tardives: un document changé depuis sa lecture n'est pas supprimé
+RETENTION_VERSION_FIELDS = {"visits": "date_sortie", "ip_logs": "count"}
+
+# Bail du balayage: un seul worker archive à la fois
+RETENTION_STATE_COLLECTION = "retention_state"
+
+
+def parse_date(value: Any) -> Optional[datetime.datetime]:
+    """Naive UTC datetime of an archived ISO date."""
+    if not isinstance(value, str):
+        return value
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    return to_utc(datetime.datetime.fromisoformat(value))
+
+
+def write_part(path: str, documents: List[Dict[str, Any]]):
+    """Write an archive part atomically (temporary file, fsync, rename)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        with gzip.GzipFile(fileobj=file, mode="wb") as archive:
+            archive.write("".join(dumps(document) + "\n" for document in documents).encode("utf-8"))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def visit_order(visit: Dict[str, Any]):
+    """Sort key of an archived visit (VISIT_SORT order when reversed)."""
+    return parse_date(visit["date_entree"]), visit["_id"]
+
+
+def list_parts(directory: str) -> List[str]:
+    """Parts of an archived day, most recently written first."""
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".ndjson.gz")]
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+
+def json_visit(visit: Dict[str, Any]) -> Dict[str, Any]:
+    """Archived visit with its dates formatted like json_date (archives hold isoformat strings)."""
+    for field in VISIT_DATE_FIELDS:
+        if isinstance(visit.get(field), str):
+            try:
+                visit[field] = iso_date(parse_date(visit[field]))
+            except ValueError:
+                pass
+    return visit
+
+
+def iter_part(path: str, keep: Callable[[Dict[str, Any]], bool]) -> Iterator[Dict[str, Any]]:
+    with gzip.open(path, "rb") as archive:
+        for line in archive:
+            document = loads(line)
+            if keep(document):
+                yield document
+
+
+def merge_parts(paths: List[str], keep: Callable[[Dict[str, Any]], bool]) -> Iterator[Dict[str, Any]]:
+    """
+    Matching visits of a day's parts, most recent first.
+
+    Each part is sorted, so they are merged lazily: memory does not depend on
+    the size of the day. A visit archived twice (sweep interrupted between the
+    archive and the delete, or visit updated after being read) comes out twice
+    in a row and is returned once, from the first path (list_parts: the latest).
+    """
+    last_id = None
+    for visit in heapq.merge(*[iter_part(path, keep) for path in paths], key=visit_order, reverse=True):
+        if visit["_id"] != last_id:
+            last_id = visit["_id"]
+            yield visit
+
+
+def take(iterator: Iterator[Dict[str, Any]], count: int) -> List[Dict[str, Any]]:
+    return list(itertools.islice(iterator, count))
+
+
+class RetentionSweeper:
+    def __init__(
+        self,
+        db,
+        days: int = RETENTION_DAYS,
+        archive_dir: str = RETENTION_ARCHIVE_DIR,
+        interval: float = RETENTION_SWEEP_INTERVAL,
+        batch_size: int = RETENTION_BATCH_SIZE,
+    ):
+        """
+        Keep ``visits`` and ``ip_logs`` to the last ``days`` days.
+
+        A periodic sweep writes the older documents to
+        ``archive_dir/<collection>/<YYYY-MM-DD>/part-<first _id>-<unique id>.ndjson.gz``
+        (most recent first) and deletes them once the part is on disk, unless
+        they changed since they were read (they are archived again by the next
+        batch). A lease
+        in MongoDB, renewed after each batch, lets a single worker sweep at a
+        time. Documents are never deleted without being archived.
+
+        Args:
+            db: Motor database
+            days: Days kept in MongoDB, counted from the start of today (UTC); 0 disables retention
+            archive_dir: Root directory of the archives
+            interval: Seconds between two sweeps
+            batch_size: Documents archived (and deleted) per part
+        """
+        self.db = db
+        self.days = days
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self.batch_size = batch_size
+        self.state = db[RETENTION_STATE_COLLECTION]
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, Any] = {"sweeps": 0, "archived": {}, "last_sweep": None, "last_error": None}
+
+    @property
+    def enabled(self) -> bool:
+        return self.days > 0
+
+    def horizon(self, now: Optional[datetime.datetime] = None) -> datetime.datetime:
+        """Documents dated before this are out of hot retention."""
+        today = (now or datetime.datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+        return today - datetime.timedelta(days=self.days)
+
+    def start(self):
+        if self.enabled and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                logger.exception("❌ Erreur lors du balayage de rétention")
+            await asyncio.sleep(self.interval)
+
+    async def acquire(self, now: datetime.datetime) -> bool:
+        """Take the sweep lease for one interval, unless another worker holds it."""
+        try:
+            await self.state.find_one_and_update(
+                {"_id": "sweep", "$or": [{"lease_until": {"$lt": now}}, {"worker": self.worker}]},
+                {"$set": {"lease_until": now + datetime.timedelta(seconds=self.interval), "worker": self.worker}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def renew(self) -> bool:
+        """Extend the lease held by this worker; False if it was taken over."""
+        now = datetime.datetime.utcnow()
+        result = await self.state.update_one(
+            {"_id": "sweep", "worker": self.worker},
+            {"$set": {"lease_until": now + datetime.timedelta(seconds=self.interval)}},
+        )
+        return result.matched_count == 1
+
+    async def sweep(self, now: Optional[datetime.datetime] = None) -> Dict[str, int]:
+        """
+        Archive then delete the documents older than the horizon.
+
+        Returns:
+            Number of documents archived per collection (empty if the lease is held elsewhere)
+        """
+        now = now or datetime.datetime.utcnow()
+        if not await self.acquire(now):
+            return {}
+        horizon = self.horizon(now)
+        archived = {}
+        for collection_name, field in RETENTION_COLLECTIONS.items():
+            if archived and not await self.renew():
+                break
+            archived[collection_name] = await self.archive_collection(collection_name, field, horizon)
+            self.stats["archived"][collection_name] = (
+                self.stats["archived"].get(collection_name, 0) + archived[collection_name]
+            )
+        self.stats["sweeps"] += 1
+        self.stats["last_sweep"] = now
+        self.stats["last_error"] = None
+        await self.state.update_one(
+            {"_id": "sweep"}, {"$set": {"last_sweep": now, "horizon": horizon, "archived": archived}}
+        )
+        if any(archived.values()):
+            logger.info(f"🗄️ Rétention: {archived} documents archivés avant le {horizon.date()}")
+        return archived
+
+    async def archive_collection(self, collection_name: str, field: str, horizon: datetime.datetime) -> int:
+        collection = self.db[collection_name]
+        total = 0
+        while True:
+            # Les documents archivés sont supprimés: chaque lot repart des plus anciens
+            cursor = collection.find({field: {"$lt": horizon}}).sort(field, ASCENDING).limit(self.batch_size)
+            documents = await cursor.to_list(self.batch_size)
+            if not documents:
+                return total
+            by_day: Dict[datetime.date, List[Dict[str, Any]]] = {}
+            for document in documents:
+                by_day.setdefault(to_utc(document[field]).date(), []).append(document)
+            for day, day_documents in by_day.items():
+                day_documents.sort(key=lambda document: (document[field], document["_id"]), reverse=True)
+                # Nom unique: un document réarchivé ne doit pas écraser la part précédente
+                path = os.path.join(
+                    self.archive_dir,
+                    collection_name,
+                    day.isoformat(),
+                    f"part-{day_documents[0]['_id']}-{ObjectId()}.ndjson.gz",
+                )
+                await asyncio.to_thread(write_part, path, day_documents)
+            # Suppression de la version archivée seulement (sortie ou ajout d'IP arrivé entre-temps)
+            version = RETENTION_VERSION_FIELDS[collection_name]
+            result = await collection.bulk_write(
+                [
+                    DeleteOne({"_id": document["_id"], field: {"$lt": horizon}, version: document.get(version)})
+                    for document in documents
+                ],
+                ordered=False,
+            )
+            if result.deleted_count < len(documents):
+                logger.info(
+                    f"🗄️ {len(documents) - result.deleted_count} documents de {collection_name} "
+                    "modifiés depuis leur lecture, conservés"
+                )
+            total += result.deleted_count
+            if len(documents) < self.batch_size:
+                return total
+            # Balayage long (rattrapage): garder le bail, ou s'arrêter s'il a été repris
+            if not await self.renew():
+                logger.warning("⚠️ Bail de rétention repris par un autre worker, balayage interrompu")
+                return total
+
+    def archived_days(
+        self,
+        collection_name: str,
+        start: Optional[datetime.datetime] = None,
+        end: Optional[datetime.datetime] = None,
+    ) -> List[datetime.date]:
+        """Archived days overlapping [start, end), most recent first."""
+        root = os.path.join(self.archive_dir, collection_name)
+        if not os.path.isdir(root):
+            return []
+        days = []
+        for name in os.listdir(root):
+            try:
+                day = datetime.date.fromisoformat(name)
+            except ValueError:
+                continue
+            if start and day < to_utc(start).date():
+                continue
+            if end and datetime.datetime.combine(day, datetime.time()) >= to_utc(end):
+                continue
+            days.append(day)
+        return sorted(days, reverse=True)
+
+    async def read_archive(
+        self,
+        start: Optional[datetime.datetime] = None,
+        end: Optional[datetime.datetime] = None,
+        chunk_size: int = VISITS_STREAM_CHUNK,
+        **filters: Optional[str],
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Archived visits dated in [start, end), most recent first.
+
+        Parts are read one day at a time and merged lazily (see merge_parts);
+        reading and decompressing run in a thread, ``chunk_size`` visits at a time.
+
+        Args:
+            start: First date included
+            end: Dates at or after ``end`` are excluded
+            chunk_size: Visits read per thread call
+            **filters: Equality filters on visit fields (domain, ip, ...), None ignored
+        """
+        start = to_utc(start) if start else None
+        end = to_utc(end) if end else None
+        filters = {key: value for key, value in filters.items() if value}
+
+        def keep(visit: Dict[str, Any]) -> bool:
+            if any(visit.get(key) != value for key, value in filters.items()):
+                return False
+            date = parse_date(visit["date_entree"])
+            return (start is None or date >= start) and (end is None or date < end)
+
+        # Accès disque hors de la boucle d'événements
+        for day in await asyncio.to_thread(self.archived_days, "visits", start, end):
+            paths = await asyncio.to_thread(list_parts, os.path.join(self.archive_dir, "visits", day.isoformat()))
+            visits = merge_parts(paths, keep)
+            while True:
+                chunk = await asyncio.to_thread(take, visits, chunk_size)
+                if not chunk:
+                    break
+                for visit in chunk:
+                    yield visit
+
+    async def archive_chunks(
+        self,
+        start: Optional[datetime.datetime] = None,
+        end: Optional[datetime.datetime] = None,
+        chunk_size: int = VISITS_STREAM_CHUNK,
+        **filters: Optional[str],
+    ) -> AsyncIterator[bytes]:
+        """read_archive as NDJSON, ``chunk_size`` visits per chunk, dates formatted like json_date."""
+        lines: List[str] = []
+        async for visit in self.read_archive(start, end, chunk_size, **filters):
+            lines.append(dumps(json_visit(visit)) + "\n")
+            if len(lines) == chunk_size:
+                yield "".join(lines).encode("utf-8")
+                lines = []
+        if lines:
+            yield "".join(lines).encode("utf-8")
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "days": self.days,
+            "horizon": self.horizon() if self.enabled else None,
+            "archive_dir": self.archive_dir,
+            "running": self.task is not None and not self.task.done(),
+            **self.stats,
+        }
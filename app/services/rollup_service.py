@@ -0,0 +1,167 @@
+import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.services.visit_ingest_service import DUPLICATE_KEY
+from config.settings import ROLLUP_QUERY_MAX
+
+# Collection d'agrégats par granularité
+ROLLUP_COLLECTIONS = {
+    "minute": "visit_rollups_minute",
+    "hour": "visit_rollups_hour",
+    "day": "visit_rollups_day",
+}
+
+# Compteurs d'un bucket
+ROLLUP_COUNTERS = ("visits", "open_sessions", "closed_sessions", "duration_sum")
+
+
+def to_utc(date: datetime.datetime) -> datetime.datetime:
+    """Naive UTC datetime, as returned by pymongo."""
+    if date.tzinfo is not None:
+        date = date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return date
+
+
+def truncate(date: datetime.datetime, granularity: str) -> datetime.datetime:
+    """Start of the ``granularity`` bucket containing ``date``."""
+    date = to_utc(date).replace(second=0, microsecond=0)
+    if granularity in ("hour", "day"):
+        date = date.replace(minute=0)
+    if granularity == "day":
+        date = date.replace(hour=0)
+    return date
+
+
+class VisitRollups:
+    def __init__(self, db):
+        """
+        Visit counters per domain and minute / hour / day, maintained at ingest.
+
+        Each bucket holds the number of visits started in it, the sessions started
+        in it that are still open or already closed, and the summed duration of the
+        closed ones (in seconds), so dashboards read O(buckets) documents.
+
+        Args:
+            db: Motor database holding the rollup collections
+        """
+        self.db = db
+
+    def accumulate(
+        self,
+        increments: Dict[Tuple[str, str, datetime.datetime], Dict[str, float]],
+        domain: str,
+        date: datetime.datetime,
+        **counters: float,
+    ):
+        for granularity in ROLLUP_COLLECTIONS:
+            bucket = increments.setdefault((granularity, domain, truncate(date, granularity)), {})
+            for counter, value in counters.items():
+                bucket[counter] = bucket.get(counter, 0) + value
+
+    async def record(
+        self,
+        opened: Iterable[Dict[str, Any]] = (),
+        closed: Iterable[Dict[str, Any]] = (),
+    ):
+        """
+        Apply new visits and closed sessions to the rollups with $inc upserts.
+
+        Sessions count in the bucket of their ``date_entree``.
+
+        Args:
+            opened: New visit documents (``domain``, ``date_entree``, ``date_sortie``)
+            closed: Closed sessions (``domain``, ``date_entree``, ``date_sortie``)
+        """
+        increments: Dict[Tuple[str, str, datetime.datetime], Dict[str, float]] = {}
+        closed = list(closed)
+        for visit in opened:
+            self.accumulate(increments, visit["domain"], visit["date_entree"], visits=1, open_sessions=1)
+            if visit.get("date_sortie") is not None:
+                # Visite reçue déjà terminée: ouverte et clôturée dans le même lot
+                closed.append(visit)
+        for session in closed:
+            duration = (to_utc(session["date_sortie"]) - to_utc(session["date_entree"])).total_seconds()
+            self.accumulate(
+                increments,
+                session["domain"],
+                session["date_entree"],
+                open_sessions=-1,
+                closed_sessions=1,
+                duration_sum=max(0.0, duration),
+            )
+
+        operations: Dict[str, List[UpdateOne]] = {}
+        for (granularity, domain, bucket), counters in increments.items():
+            operations.setdefault(granularity, []).append(
+                UpdateOne({"domain": domain, "bucket": bucket}, {"$inc": counters}, upsert=True)
+            )
+        for granularity, granularity_operations in operations.items():
+            await self.write(self.db[ROLLUP_COLLECTIONS[granularity]], granularity_operations)
+
+    async def write(self, collection, operations: List[UpdateOne]):
+        try:
+            await collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Deux upserts concurrents sur un nouveau bucket: le perdant est rejoué
+            retry = [operations[error["index"]] for error in e.details["writeErrors"] if error.get("code") == DUPLICATE_KEY]
+            if len(retry) != len(e.details["writeErrors"]):
+                raise
+            await collection.bulk_write(retry, ordered=False)
+
+    async def on_batch(self, batch):
+        await self.record(batch.visits, batch.closed)
+
+    async def query(
+        self,
+        domain: str,
+        granularity: str = "hour",
+        start: Optional[datetime.datetime] = None,
+        end: Optional[datetime.datetime] = None,
+        top: Optional[int] = None,
+        limit: int = ROLLUP_QUERY_MAX,
+    ) -> List[Dict[str, Any]]:
+        """
+        Read the rollup buckets of a domain.
+
+        Args:
+            domain: Domain to read
+            granularity: "minute", "hour" or "day"
+            start: First bucket included (truncated to the granularity)
+            end: Buckets starting at or after ``end`` are excluded
+            top: Return the ``top`` busiest buckets instead of chronological order
+            limit: Maximum number of buckets returned
+
+        Returns:
+            Buckets with their counters and the average session duration
+
+        Raises:
+            ValueError: If the granularity is unknown
+        """
+        if granularity not in ROLLUP_COLLECTIONS:
+            raise ValueError(f"Granularité inconnue: {granularity}")
+
+        query: Dict[str, Any] = {"domain": domain}
+        if start or end:
+            query["bucket"] = {}
+            if start:
+                query["bucket"]["$gte"] = truncate(start, granularity)
+            if end:
+                query["bucket"]["$lt"] = to_utc(end)
+
+        cursor = self.db[ROLLUP_COLLECTIONS[granularity]].find(query, {"_id": 0})
+        if top:
+            cursor = cursor.sort("visits", DESCENDING).limit(min(top, limit))
+        else:
+            cursor = cursor.sort("bucket", ASCENDING).limit(limit)
+
+        buckets = []
+        async for bucket in cursor:
+            for counter in ROLLUP_COUNTERS:
+                bucket.setdefault(counter, 0)
+            closed = bucket["closed_sessions"]
+            bucket["avg_duration"] = bucket["duration_sum"] / closed if closed else None
+            buckets.append(bucket)
+        return buckets
@@ -0,0 +1,110 @@
+import datetime
+import json
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from bson import ObjectId
+from cachetools import TTLCache
+from redis import asyncio as aioredis
+
+from config.settings import SESSION_CACHE_REDIS_URL, SESSION_CACHE_SIZE, SESSION_CACHE_TTL
+
+# (domain, tracking_user_analytics)
+SessionKey = Tuple[str, str]
+
+# Valeur en cache: la session ouverte ({"_id", "date_entree"}), ou None si l'utilisateur
+# n'en a pas; une clé absente du résultat de get_many n'est pas connue du cache
+OpenSession = Optional[Dict[str, Any]]
+
+
+class LocalSessionCache:
+    def __init__(self, maxsize: int = SESSION_CACHE_SIZE, ttl: float = SESSION_CACHE_TTL):
+        """
+        Open session of each (domain, user), in the memory of this worker.
+
+        Only consistent when a single worker ingests visits; use RedisSessionCache otherwise.
+        """
+        self.entries: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.stats = {"hits": 0, "misses": 0}
+
+    async def get_many(self, keys: Iterable[SessionKey]) -> Dict[SessionKey, OpenSession]:
+        found = {}
+        for key in keys:
+            if key in self.entries:
+                found[key] = self.entries[key]
+                self.stats["hits"] += 1
+            else:
+                self.stats["misses"] += 1
+        return found
+
+    async def set_many(self, sessions: Dict[SessionKey, OpenSession]):
+        for key, session in sessions.items():
+            self.entries[key] = session
+
+    async def invalidate(self, keys: Iterable[SessionKey]):
+        for key in keys:
+            self.entries.pop(key, None)
+
+
+class RedisSessionCache:
+    def __init__(self, redis_client, ttl: float = SESSION_CACHE_TTL, prefix: str = "open_session"):
+        """
+        Open session of each (domain, user), shared by every worker through Redis.
+
+        Args:
+            redis_client: ``redis.asyncio`` client
+            ttl: Seconds an entry is kept without being refreshed
+            prefix: Prefix of the Redis keys
+        """
+        self.redis = redis_client
+        self.ttl = int(ttl)
+        self.prefix = prefix
+        self.stats = {"hits": 0, "misses": 0}
+
+    def redis_key(self, key: SessionKey) -> str:
+        return f"{self.prefix}:{json.dumps(key)}"
+
+    @staticmethod
+    def dumps(session: OpenSession) -> str:
+        if session is None:
+            return "null"
+        return json.dumps({"_id": str(session["_id"]), "date_entree": session["date_entree"].isoformat()})
+
+    @staticmethod
+    def loads(value) -> OpenSession:
+        session = json.loads(value)
+        if session is None:
+            return None
+        date_entree = datetime.datetime.fromisoformat(session["date_entree"])
+        if date_entree.tzinfo is not None:
+            date_entree = date_entree.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return {"_id": ObjectId(session["_id"]), "date_entree": date_entree}
+
+    async def get_many(self, keys: Iterable[SessionKey]) -> Dict[SessionKey, OpenSession]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = await self.redis.mget([self.redis_key(key) for key in keys])
+        found = {key: self.loads(value) for key, value in zip(keys, values) if value is not None}
+        self.stats["hits"] += len(found)
+        self.stats["misses"] += len(keys) - len(found)
+        return found
+
+    async def set_many(self, sessions: Dict[SessionKey, OpenSession]):
+        if not sessions:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, session in sessions.items():
+                pipe.set(self.redis_key(key), self.dumps(session), ex=self.ttl)
+            await pipe.execute()
+
+    async def invalidate(self, keys: Iterable[SessionKey]):
+        redis_keys = [self.redis_key(key) for key in keys]
+        if redis_keys:
+            await self.redis.delete(*redis_keys)
+
+
+def create_session_cache(redis_url: Optional[str] = SESSION_CACHE_REDIS_URL):
+    """Redis-backed cache when ``redis_url`` is set (several workers), in-memory otherwise."""
+    if not redis_url:
+        return LocalSessionCache()
+    return RedisSessionCache(aioredis.from_url(redis_url))
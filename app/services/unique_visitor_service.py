@@ -0,0 +1,211 @@
+import asyncio
+import datetime
+import logging
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+
+from app.services.rollup_service import truncate
+from app.utils.hyperloglog import HyperLogLog
+from config.settings import HLL_FLUSH_INTERVAL, HLL_PRECISION
+
+logger = logging.getLogger(__name__)
+
+# Sketches HyperLogLog par (domaine, jour)
+SKETCH_COLLECTION = "visitor_sketches"
+
+# Identité comptée par chaque sketch: champ de la visite
+SKETCH_FIELDS = {"visitors": "tracking_user_analytics", "ips": "ip"}
+
+PERIODS = ("day", "week", "month")
+
+# Tentatives d'écriture d'un sketch modifié en parallèle par une autre instance
+MAX_MERGE_ATTEMPTS = 5
+
+# Passes de fusion à l'arrêt avant d'abandonner les sketches restants
+STOP_FLUSH_ATTEMPTS = 3
+
+
+def period_range(period: str, date: datetime.date) -> Tuple[datetime.datetime, datetime.datetime]:
+    """
+    Days [start, end) of the day, ISO week or calendar month containing ``date``.
+
+    Raises:
+        ValueError: If the period is unknown
+    """
+    if period == "day":
+        start = date
+        end = date + datetime.timedelta(days=1)
+    elif period == "week":
+        start = date - datetime.timedelta(days=date.weekday())
+        end = start + datetime.timedelta(days=7)
+    elif period == "month":
+        start = date.replace(day=1)
+        end = (start + datetime.timedelta(days=32)).replace(day=1)
+    else:
+        raise ValueError(f"Période inconnue: {period}")
+    return datetime.datetime.combine(start, datetime.time()), datetime.datetime.combine(end, datetime.time())
+
+
+class UniqueVisitors:
+    def __init__(self, db, precision: int = HLL_PRECISION, flush_interval: float = HLL_FLUSH_INTERVAL):
+        """
+        Unique visitors and IPs per domain and day, as HyperLogLog sketches.
+
+        Visits are added at ingest to in-memory sketches, merged every
+        ``flush_interval`` seconds with the one stored for the day (a
+        compare-and-swap on ``version``, written only when a register changes),
+        and merged again at read time for weeks and months.
+
+        Args:
+            db: Motor database holding the sketch collection
+            precision: HyperLogLog precision, 2 ** precision bytes per sketch
+            flush_interval: Seconds between two merges into MongoDB
+        """
+        self.collection = db[SKETCH_COLLECTION]
+        self.precision = precision
+        self.flush_interval = flush_interval
+        self.pending: Dict[Tuple[str, datetime.datetime], Dict[str, HyperLogLog]] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        for attempt in range(STOP_FLUSH_ATTEMPTS):
+            try:
+                await self.flush()
+                return
+            except Exception as e:
+                logger.warning(f"⚠️ Fusion des sketches à l'arrêt, passe {attempt + 1}/{STOP_FLUSH_ATTEMPTS}: {e}")
+                if attempt + 1 < STOP_FLUSH_ATTEMPTS:
+                    await asyncio.sleep(2 ** attempt)
+        dropped = ", ".join(f"{domain} du {day.date()}" for domain, day in self.pending)
+        logger.error(f"❌ Sketches de visiteurs uniques perdus à l'arrêt: {dropped}")
+        self.pending = {}
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("❌ Erreur lors de la fusion des sketches de visiteurs uniques")
+
+    def load(self, document: Optional[Dict[str, Any]], name: str) -> HyperLogLog:
+        if document is None or name not in document:
+            return HyperLogLog(self.precision)
+        return HyperLogLog.from_bytes(document[name])
+
+    def record(self, visits: Iterable[Dict[str, Any]]):
+        """Add new visits to the in-memory sketches of their (domain, day)."""
+        for visit in visits:
+            sketches = self.pending.setdefault((visit["domain"], truncate(visit["date_entree"], "day")), {})
+            for name, field in SKETCH_FIELDS.items():
+                if visit.get(field):
+                    sketches.setdefault(name, HyperLogLog(self.precision)).add(str(visit[field]))
+
+    def keep(self, key: Tuple[str, datetime.datetime], sketches: Dict[str, HyperLogLog]):
+        """Put back sketches that could not be written, merged with those recorded since."""
+        current = self.pending.setdefault(key, {})
+        for name, sketch in sketches.items():
+            if name in current:
+                current[name].merge(sketch)
+            else:
+                current[name] = sketch
+
+    async def flush(self):
+        """Merge the sketches recorded since the last flush into MongoDB."""
+        pending, self.pending = list(self.pending.items()), {}
+        failed = 0
+        for index, (key, sketches) in enumerate(pending):
+            try:
+                await self.merge(*key, sketches)
+            except asyncio.CancelledError:
+                # Arrêt pendant une fusion: les sketches non écrits restent pour la fusion finale
+                for key, sketches in pending[index:]:
+                    self.keep(key, sketches)
+                raise
+            except Exception:
+                # Fusion idempotente: réessayée au prochain passage
+                self.keep(key, sketches)
+                failed += 1
+        if failed:
+            raise RuntimeError(f"{failed} sketch(s) non fusionné(s), conservé(s) en mémoire")
+
+    async def merge(self, domain: str, day: datetime.datetime, sketches: Dict[str, HyperLogLog]):
+        for _ in range(MAX_MERGE_ATTEMPTS):
+            document = await self.collection.find_one({"domain": domain, "day": day})
+            if document is None:
+                try:
+                    await self.collection.insert_one(
+                        {
+                            "domain": domain,
+                            "day": day,
+                            "version": 1,
+                            **{name: Binary(sketch.to_bytes()) for name, sketch in sketches.items()},
+                        }
+                    )
+                    return
+                except DuplicateKeyError:
+                    # Créé entre-temps par une autre instance: on fusionne avec lui
+                    continue
+
+            changed = {}
+            for name, sketch in sketches.items():
+                stored = self.load(document, name)
+                if stored.merge(sketch) or name not in document:
+                    changed[name] = Binary(stored.to_bytes())
+            if not changed:
+                return
+            result = await self.collection.update_one(
+                {"_id": document["_id"], "version": document["version"]},
+                {"$set": changed, "$inc": {"version": 1}},
+            )
+            if result.modified_count:
+                return
+        raise RuntimeError(f"Sketch {domain} du {day.date()} modifié en parallèle, fusion abandonnée")
+
+    async def on_batch(self, batch):
+        self.record(batch.visits)
+
+    async def query(self, domain: str, period: str = "day", date: Optional[datetime.date] = None) -> Dict[str, Any]:
+        """
+        Estimated unique visitors and IPs of a domain over a day, week or month.
+
+        Reads at most one sketch per day of the period, whatever the traffic,
+        plus the sketches of this worker not flushed yet.
+
+        Raises:
+            ValueError: If the period is unknown
+        """
+        date = date or datetime.datetime.utcnow().date()
+        start, end = period_range(period, date)
+        totals = {name: HyperLogLog(self.precision) for name in SKETCH_FIELDS}
+        days = set()
+        cursor = self.collection.find({"domain": domain, "day": {"$gte": start, "$lt": end}}, {"version": 0})
+        async for document in cursor:
+            days.add(document["day"])
+            for name, total in totals.items():
+                if name in document:
+                    total.merge(self.load(document, name))
+        for (pending_domain, day), sketches in self.pending.items():
+            if pending_domain == domain and start <= day < end:
+                days.add(day)
+                for name, sketch in sketches.items():
+                    totals[name].merge(sketch)
+        return {
+            "domain": domain,
+            "period": period,
+            "start": start,
+            "end": end,
+            "days": len(days),
+            **{name: total.count() for name, total in totals.items()},
+            "relative_error": round(totals["visitors"].relative_error, 4),
+        }
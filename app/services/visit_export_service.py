@@ -0,0 +1,202 @@
+import csv
+import datetime
+import io
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.services.visit_query_service import (
+    VISIT_DATE_FIELDS,
+    projected_fields,
+    visits_pipeline,
+)
+from app.utils.api_utils import dumps
+from app.utils.bson_json import document_json, iter_documents
+from config.settings import EXPORT_BATCH_SIZE
+
+# Formats d'export: type MIME et extension du fichier
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def export_filename(export_format: str, compress: bool = False) -> str:
+    extension = EXPORT_FORMATS[export_format][1]
+    # Parquet compresse ses colonnes lui-même: pas de suffixe .gz
+    if compress and export_format != "parquet":
+        extension += ".gz"
+    return f"visits.{extension}"
+
+
+def import_pyarrow():
+    """
+    Raises:
+        RuntimeError: If pyarrow is not installed
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("L'export parquet nécessite pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+class ParquetSink:
+    """Write-only file collecting what the Parquet writer emits until it is drained."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_value(field: str, value: Any) -> Any:
+    """
+    Value matching the column type: the schema is fixed, but visits written by
+    older versions may hold numbers, sub-documents or dates stored as strings.
+    """
+    if value is None:
+        return None
+    if field in VISIT_DATE_FIELDS:
+        if isinstance(value, datetime.datetime):
+            return value
+        try:
+            return datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return dumps(value)
+    return str(value)
+
+
+async def visit_batches(visits_collection, query: Dict[str, Any], projection, dates_as_strings: bool = True):
+    """Visits in VISIT_SORT order, grouped by EXPORT_BATCH_SIZE."""
+    cursor = visits_collection.aggregate(
+        visits_pipeline(query, projection, dates_as_strings=dates_as_strings),
+        batchSize=EXPORT_BATCH_SIZE,
+        allowDiskUse=True,
+    )
+    batch = []
+    async for visit in cursor:
+        batch.append(visit)
+        if len(batch) == EXPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def ndjson_chunks(visits_collection, query, projection) -> AsyncIterator[bytes]:
+    # Lots BSON bruts transcodés directement en NDJSON, sans dict par visite
+    cursor = visits_collection.aggregate_raw_batches(
+        visits_pipeline(query, projection), batchSize=EXPORT_BATCH_SIZE, allowDiskUse=True
+    )
+    async for batch in cursor:
+        yield b"".join(document_json(document) + b"\n" for document in iter_documents(batch))
+
+
+async def csv_chunks(visits_collection, query, projection) -> AsyncIterator[bytes]:
+    fields = projected_fields(projection)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    async for batch in visit_batches(visits_collection, query, projection):
+        for visit in batch:
+            writer.writerow([visit.get(field) for field in fields])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Export vide: seulement l'en-tête
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def parquet_chunks(visits_collection, query, projection, compression: str = "snappy") -> AsyncIterator[bytes]:
+    pa = import_pyarrow()
+    fields = projected_fields(projection)
+    schema = pa.schema(
+        [
+            (field, pa.timestamp("ms", tz="UTC") if field in VISIT_DATE_FIELDS else pa.string())
+            for field in fields
+        ]
+    )
+    sink = ParquetSink()
+    # Un row group par lot lu sur le curseur: la mémoire reste bornée par EXPORT_BATCH_SIZE
+    writer = pa.parquet.ParquetWriter(sink, schema, compression=compression)
+    try:
+        async for batch in visit_batches(visits_collection, query, projection, dates_as_strings=False):
+            columns = [[parquet_value(field, visit.get(field)) for visit in batch] for field in fields]
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_visits(
+    visits_collection,
+    query: Dict[str, Any],
+    projection: Optional[Dict[str, int]] = None,
+    export_format: str = "ndjson",
+    compress: bool = False,
+) -> AsyncIterator[bytes]:
+    """
+    Stream every visit matching ``query`` in VISIT_SORT order.
+
+    The visits are read in EXPORT_BATCH_SIZE batches on a single server-side
+    cursor and each batch is encoded and sent before the next one is read.
+    The arguments are checked here, before the response starts.
+
+    Args:
+        visits_collection: Motor collection of visits
+        query: Filter on visits
+        projection: Fields to export (all visit fields if None)
+        export_format: "ndjson", "csv" or "parquet"
+        compress: gzip the output (parquet: gzip column compression instead)
+
+    Raises:
+        ValueError: If the format is unknown
+        RuntimeError: If parquet is requested and pyarrow is not installed
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Format d'export inconnu: {export_format}")
+    if export_format == "parquet":
+        import_pyarrow()
+        return parquet_chunks(visits_collection, query, projection, "gzip" if compress else "snappy")
+    chunks = ndjson_chunks if export_format == "ndjson" else csv_chunks
+    return gzip_chunks(chunks(visits_collection, query, projection)) if compress else chunks(visits_collection, query, projection)
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    # wbits 31: conteneur gzip
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+    yield compressor.flush()
@@ -0,0 +1,357 @@
+import asyncio
+import datetime
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.services.ip_log_service import bucket_operations
+from config.settings import INGEST_FLUSH_INTERVAL_MS, INGEST_MAX_BATCH
+
+logger = logging.getLogger(__name__)
+
+# Session encore ouverte (date_sortie explicitement nulle), couverte par l'index
+# partiel unique "open_session_unique": au plus une par (domaine, utilisateur)
+OPEN_SESSION = {"date_sortie": {"$type": "null"}}
+
+DUPLICATE_KEY = 11000
+# Nombre de tentatives d'une visite dont l'ouverture de session entre en conflit
+MAX_ROLLOVER_ATTEMPTS = 3
+
+
+class PendingVisit:
+    def __init__(self, visit_data: Dict[str, Any], ip_data: Dict[str, Any]):
+        """
+        A visit waiting in the ingest buffer.
+
+        Args:
+            visit_data: Document inserted into ``visits``
+            ip_data: Entry appended to the domain's ``ip_logs``
+        """
+        self.visit_data = visit_data
+        self.ip_data = ip_data
+        # Date de sortie appliquée à la session ouverte précédente
+        self.received_at = datetime.datetime.utcnow()
+        # Envois refusés pour clé dupliquée (bascule de session rejouée)
+        self.attempts = 0
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def resolve(self, error: Optional[BaseException] = None):
+        if self.future.done():
+            return
+        if error is None:
+            self.future.set_result(self.visit_data["_id"])
+        else:
+            self.future.set_exception(error)
+
+
+def session_key(item: PendingVisit) -> Tuple[str, str]:
+    return item.visit_data["domain"], item.visit_data["tracking_user_analytics"]
+
+
+class IngestBatch:
+    def __init__(self, visits: List[Dict[str, Any]], closed: List[Dict[str, Any]]):
+        """
+        Visits committed by one flush, passed to the ingest listeners.
+
+        Args:
+            visits: Inserted visit documents, in ingest order
+            closed: Sessions closed by the rollover, with their ``domain``,
+                ``tracking_user_analytics``, ``date_entree`` and ``date_sortie``
+        """
+        self.visits = visits
+        self.closed = closed
+
+
+class VisitIngestBuffer:
+    def __init__(
+        self,
+        visits_collection,
+        ip_collection,
+        flush_interval_ms: int = INGEST_FLUSH_INTERVAL_MS,
+        max_batch: int = INGEST_MAX_BATCH,
+        listeners: Optional[list] = None,
+        session_cache=None,
+    ):
+        """
+        Collect visits and write them to MongoDB in batches.
+
+        A batch is flushed every ``flush_interval_ms`` or as soon as it holds
+        ``max_batch`` visits: one ordered bulk_write on ``visits`` (closing the
+        previous open session then inserting the new one, for each visit; the
+        unique partial index on open sessions rejects a concurrent rollover,
+        which is then retried) and one
+        bulk_write appending to the hourly ``ip_logs`` buckets. Each caller is
+        acknowledged when its batch commits.
+
+        Args:
+            visits_collection: Motor collection of visits
+            ip_collection: Motor collection of IP logs
+            flush_interval_ms: Maximum time a visit waits before being written
+            max_batch: Number of visits that triggers an immediate flush
+            listeners: Objects whose ``on_batch(IngestBatch)`` coroutine is awaited
+                after each committed batch, before the callers are acknowledged
+            session_cache: Cache of the open session per (domain, user), saving the
+                lookup of the sessions a batch closes (only done for listeners)
+        """
+        self.visits_collection = visits_collection
+        self.ip_collection = ip_collection
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.listeners = listeners or []
+        self.session_cache = session_cache
+        self.pending: List[PendingVisit] = []
+        self.full = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.stopping = False
+        self.stats = {"visits": 0, "batches": 0, "round_trips": 0}
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.stopping = False
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """
+        Stop the flush loop and write what is still pending.
+
+        The batch being written is awaited, not cancelled: its callers are
+        always answered. A batch that fails is logged (its callers get the
+        error) and the next ones are still written.
+        """
+        if self.task is not None:
+            self.stopping = True
+            self.full.set()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        while self.pending:
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("❌ Erreur lors de l'écriture d'un lot de visites à l'arrêt")
+
+    async def submit(self, visit_data: Dict[str, Any], ip_data: Dict[str, Any]) -> ObjectId:
+        """
+        Queue a visit and wait until its batch is committed.
+
+        Returns:
+            The ObjectId of the inserted visit
+        """
+        self.start()
+        visit_data.setdefault("_id", ObjectId())
+        item = PendingVisit(visit_data, ip_data)
+        self.pending.append(item)
+        if len(self.pending) >= self.max_batch:
+            self.full.set()
+        return await asyncio.shield(item.future)
+
+    async def run(self):
+        while not self.stopping:
+            try:
+                await asyncio.wait_for(self.full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.full.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("❌ Erreur lors de l'écriture d'un lot de visites")
+
+    def visit_operations(self, item: PendingVisit) -> list:
+        visit = item.visit_data
+        return [
+            # Clôturer la session encore ouverte pour cet utilisateur (au plus une)
+            UpdateOne(
+                {
+                    "domain": visit["domain"],
+                    "tracking_user_analytics": visit["tracking_user_analytics"],
+                    **OPEN_SESSION,
+                },
+                {"$set": {"date_sortie": item.received_at}},
+            ),
+            InsertOne(visit),
+        ]
+
+    async def write_visits(self, batch: List[PendingVisit]) -> List[PendingVisit]:
+        """
+        Write the visits of a batch, skipping the ones MongoDB rejects.
+
+        Returns:
+            The visits that were committed
+        """
+        committed: List[PendingVisit] = []
+        remaining = batch
+        while remaining:
+            operations, owners = [], []
+            for item in remaining:
+                for operation in self.visit_operations(item):
+                    operations.append(operation)
+                    owners.append(item)
+            try:
+                self.stats["round_trips"] += 1
+                await self.visits_collection.bulk_write(operations, ordered=True)
+                committed.extend(remaining)
+                return committed
+            except BulkWriteError as e:
+                if e.details.get("writeConcernErrors"):
+                    logger.warning(f"⚠️ Write concern non satisfait pour un lot de visites: {e.details['writeConcernErrors']}")
+                if not e.details.get("writeErrors"):
+                    # Seul le write concern a échoué: toutes les écritures ont été appliquées
+                    committed.extend(remaining)
+                    return committed
+                # Écriture ordonnée: tout ce qui précède l'erreur est validé
+                error = e.details["writeErrors"][0]
+                failed = owners[error["index"]]
+                position = remaining.index(failed)
+                committed.extend(remaining[:position])
+                if error.get("code") == DUPLICATE_KEY:
+                    failed.attempts += 1
+                if error.get("code") == DUPLICATE_KEY and failed.attempts < MAX_ROLLOVER_ATTEMPTS:
+                    # Une autre instance a ouvert une session entre la clôture et l'insertion:
+                    # on rejoue la bascule, qui clôturera cette session
+                    remaining = remaining[position:]
+                else:
+                    failed.resolve(e)
+                    remaining = remaining[position + 1:]
+        return committed
+
+    async def find_open_sessions(self, batch: List[PendingVisit]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """
+        Fetch the sessions the batch is about to close, from the session cache
+        and, for the users it does not know, in one query.
+
+        Returns:
+            Open session per (domain, tracking_user_analytics)
+        """
+        keys = {session_key(item) for item in batch}
+        cached = {}
+        if self.session_cache:
+            try:
+                cached = await self.session_cache.get_many(keys)
+            except Exception:
+                logger.exception("❌ Cache des sessions indisponible, lecture dans MongoDB")
+        open_sessions = {key: session for key, session in cached.items() if session is not None}
+        missing = keys - cached.keys()
+        if not missing:
+            return open_sessions
+
+        query = {
+            "$or": [{"domain": domain, "tracking_user_analytics": tracking} for domain, tracking in missing],
+            **OPEN_SESSION,
+        }
+        projection = {"domain": 1, "tracking_user_analytics": 1, "date_entree": 1}
+        self.stats["round_trips"] += 1
+        async for session in self.visits_collection.find(query, projection):
+            open_sessions[(session["domain"], session["tracking_user_analytics"])] = session
+        return open_sessions
+
+    async def update_session_cache(self, batch: List[PendingVisit], committed: List[PendingVisit]):
+        """Record the open session each user has after the batch."""
+        sessions: Dict[Tuple[str, str], Optional[Dict[str, Any]]] = {}
+        for item in committed:
+            visit = item.visit_data
+            if visit["date_sortie"] is None:
+                sessions[session_key(item)] = {"_id": visit["_id"], "date_entree": visit["date_entree"]}
+            else:
+                sessions[session_key(item)] = None
+        # Visite rejetée ou bascule rejouée: une autre instance a touché la session, l'état est inconnu
+        committed_ids = {id(item) for item in committed}
+        uncertain = {
+            session_key(item) for item in batch if item.attempts > 0 or id(item) not in committed_ids
+        }
+        for key in uncertain:
+            sessions.pop(key, None)
+        await self.session_cache.invalidate(uncertain)
+        await self.session_cache.set_many(sessions)
+
+    def closed_sessions(
+        self, committed: List[PendingVisit], open_sessions: Dict[Tuple[str, str], Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Replay the rollovers of the committed visits to list the sessions they closed."""
+        open_sessions = dict(open_sessions)
+        closed = []
+        for item in committed:
+            visit = item.visit_data
+            key = (visit["domain"], visit["tracking_user_analytics"])
+            previous = open_sessions.pop(key, None)
+            if previous is not None:
+                closed.append(
+                    {
+                        "_id": previous["_id"],
+                        "domain": visit["domain"],
+                        "tracking_user_analytics": visit["tracking_user_analytics"],
+                        "date_entree": previous["date_entree"],
+                        "date_sortie": item.received_at,
+                    }
+                )
+            if visit["date_sortie"] is None:
+                open_sessions[key] = visit
+        return closed
+
+    async def forget_sessions(self, batch: List[PendingVisit]):
+        """Drop the cached sessions of a batch left in an unknown state, they will be read from MongoDB."""
+        try:
+            await self.session_cache.invalidate({session_key(item) for item in batch})
+        except Exception:
+            logger.exception("❌ Impossible d'invalider le cache des sessions")
+
+    async def notify_listeners(self, batch: IngestBatch):
+        for listener in self.listeners:
+            try:
+                await listener.on_batch(batch)
+            except Exception:
+                # Les visites sont déjà validées: un agrégat en échec ne doit pas les faire échouer
+                logger.exception(f"❌ Erreur de {type(listener).__name__} sur un lot de visites")
+
+    async def write_ip_logs(self, batch: List[PendingVisit]):
+        entries: Dict[str, List[Dict[str, Any]]] = {}
+        for item in batch:
+            entries.setdefault(item.visit_data["domain"], []).append(item.ip_data)
+        operations = [
+            operation
+            for domain, ips in entries.items()
+            for operation in bucket_operations(domain, ips)
+        ]
+        self.stats["round_trips"] += 1
+        await self.ip_collection.bulk_write(operations, ordered=True)
+
+    async def flush(self):
+        batch, self.pending = self.pending[: self.max_batch], self.pending[self.max_batch:]
+        if not batch:
+            return
+        if self.pending:
+            self.full.set()
+
+        try:
+            open_sessions = await self.find_open_sessions(batch) if self.listeners else {}
+            committed = await self.write_visits(batch)
+            if committed:
+                await self.write_ip_logs(committed)
+        except Exception as e:
+            if self.session_cache:
+                await self.forget_sessions(batch)
+            for item in batch:
+                item.resolve(e)
+            raise
+
+        if self.session_cache:
+            try:
+                await self.update_session_cache(batch, committed)
+            except Exception:
+                logger.exception("❌ Erreur lors de la mise à jour du cache des sessions")
+                await self.forget_sessions(batch)
+
+        if committed and self.listeners:
+            await self.notify_listeners(
+                IngestBatch(
+                    [item.visit_data for item in committed],
+                    self.closed_sessions(committed, open_sessions),
+                )
+            )
+
+        self.stats["visits"] += len(committed)
+        self.stats["batches"] += 1
+        for item in committed:
+            item.resolve()
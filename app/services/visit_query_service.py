@@ -0,0 +1,200 @@
+import base64
+import datetime
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import bson
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import DESCENDING
+
+from app.utils.api_utils import dumps_bytes, json_date
+from app.utils.bson_json import document_json, iter_documents
+from config.settings import VISITS_PAGE_MAX, VISITS_STREAM_CHUNK
+
+# Champs d'une visite pouvant être demandés via ?fields=
+VISIT_FIELDS = ("ip", "user_agent", "date_entree", "date_sortie", "domain", "tracking_user_analytics")
+
+# Champs date convertis en chaîne ISO 8601 par le serveur
+VISIT_DATE_FIELDS = ("date_entree", "date_sortie")
+
+# Ordre de pagination: plus récentes d'abord, _id pour départager les égalités
+VISIT_SORT = [("date_entree", DESCENDING), ("_id", DESCENDING)]
+
+
+def build_visit_filter(
+    domain: Optional[str] = None,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    ip: Optional[str] = None,
+    tracking_user_analytics: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Filter on visits; start/end bound date_entree as [start, end)."""
+    query: Dict[str, Any] = {}
+    if domain:
+        query["domain"] = domain
+    if ip:
+        query["ip"] = ip
+    if tracking_user_analytics:
+        query["tracking_user_analytics"] = tracking_user_analytics
+    if start or end:
+        query["date_entree"] = {}
+        if start:
+            query["date_entree"]["$gte"] = start
+        if end:
+            query["date_entree"]["$lt"] = end
+    return query
+
+
+def build_projection(fields: Optional[str]) -> Optional[Dict[str, int]]:
+    """
+    Projection for a comma separated list of fields.
+
+    ``_id`` and ``date_entree`` are always returned, they make up the cursor.
+
+    Raises:
+        ValueError: If a field is unknown
+    """
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in VISIT_FIELDS]
+    if unknown:
+        raise ValueError(f"Champs inconnus: {', '.join(unknown)}")
+    projection = {field: 1 for field in requested}
+    projection["date_entree"] = 1
+    return projection
+
+
+def projected_fields(projection: Optional[Dict[str, int]] = None) -> List[str]:
+    """Visit fields returned for ``projection``, ``_id`` first."""
+    return ["_id"] + [field for field in VISIT_FIELDS if projection is None or field in projection]
+
+
+def json_projection(projection: Optional[Dict[str, int]] = None, dates_as_strings: bool = True) -> Dict[str, Any]:
+    """
+    $project stage returning visits as JSON-ready values.
+
+    ``_id`` and the dates are converted to strings by the server, so raw BSON
+    batches hold only JSON-ready values and can be converted to JSON without
+    decoding the documents (see app.utils.bson_json).
+    With ``dates_as_strings`` False the dates stay BSON dates (columnar exports).
+    """
+    stage: Dict[str, Any] = {"_id": {"$toString": "$_id"}}
+    for field in projected_fields(projection)[1:]:
+        if field in VISIT_DATE_FIELDS and dates_as_strings:
+            stage[field] = json_date(field)
+        else:
+            stage[field] = f"${field}"
+    return {"$project": stage}
+
+
+def visits_pipeline(
+    query: Dict[str, Any],
+    projection: Optional[Dict[str, int]] = None,
+    limit: Optional[int] = None,
+    dates_as_strings: bool = True,
+) -> List[Dict[str, Any]]:
+    """Aggregation selecting visits in VISIT_SORT order, projected by json_projection."""
+    pipeline: List[Dict[str, Any]] = [{"$match": query}, {"$sort": dict(VISIT_SORT)}]
+    if limit:
+        pipeline.append({"$limit": limit})
+    pipeline.append(json_projection(projection, dates_as_strings))
+    return pipeline
+
+
+def encode_cursor(visit: Dict[str, Any]) -> str:
+    """Opaque cursor pointing after ``visit`` in VISIT_SORT order."""
+    date_entree = visit["date_entree"]
+    if isinstance(date_entree, datetime.datetime):
+        date_entree = date_entree.isoformat()
+    raw = json.dumps([date_entree, str(visit["_id"])])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, ObjectId]:
+    """
+    Raises:
+        ValueError: If the cursor was not produced by encode_cursor
+    """
+    try:
+        date_entree, visit_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        # Dates formatées par le serveur: suffixe Z pour UTC
+        if date_entree.endswith("Z"):
+            date_entree = date_entree[:-1] + "+00:00"
+        date = datetime.datetime.fromisoformat(date_entree)
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        return date, ObjectId(visit_id)
+    except (ValueError, TypeError, InvalidId) as e:
+        raise ValueError(f"Curseur invalide: {e}")
+
+
+def after_cursor(query: Dict[str, Any], cursor: Optional[str]) -> Dict[str, Any]:
+    """Add the keyset condition selecting the visits after ``cursor``."""
+    if not cursor:
+        return query
+    date_entree, visit_id = decode_cursor(cursor)
+    keyset = {
+        "$or": [
+            {"date_entree": {"$lt": date_entree}},
+            {"date_entree": date_entree, "_id": {"$lt": visit_id}},
+        ]
+    }
+    return {"$and": [query, keyset]} if query else keyset
+
+
+async def stream_visits_page(
+    visits_collection,
+    query: Dict[str, Any],
+    projection: Optional[Dict[str, int]] = None,
+    limit: int = 100,
+    extra: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Stream one page of visits as a JSON object, document by document.
+
+    Visits are read as raw BSON batches and converted by document_json; the
+    last one is also decoded, to build the cursor of the next page.
+
+    The object holds ``status``, the ``visits`` array, ``next_cursor`` (None on
+    the last page) and the keys of ``extra``.
+
+    Args:
+        visits_collection: Motor collection of visits
+        query: Filter, including the keyset condition of the current cursor
+        projection: Fields to return
+        limit: Page size, capped to VISITS_PAGE_MAX
+        extra: Additional keys appended after next_cursor
+    """
+    limit = max(1, min(limit, VISITS_PAGE_MAX))
+    # Une visite de plus pour savoir s'il existe une page suivante
+    cursor = visits_collection.aggregate_raw_batches(
+        visits_pipeline(query, projection, limit + 1), batchSize=limit + 1
+    )
+
+    yield b'{"status": "success", "visits": ['
+    sent = 0
+    last = None
+    more = False
+    chunk: List[bytes] = []
+    async for batch in cursor:
+        for document in iter_documents(batch):
+            if sent == limit:
+                more = True
+                break
+            # Valeurs déjà converties en chaînes par le serveur, envoyées par paquets
+            chunk.append(document_json(document))
+            last = document
+            sent += 1
+            if len(chunk) == VISITS_STREAM_CHUNK:
+                yield (b"," if sent > len(chunk) else b"") + b",".join(chunk)
+                chunk = []
+        if more:
+            break
+    if chunk:
+        yield (b"," if sent > len(chunk) else b"") + b",".join(chunk)
+
+    tail = {"next_cursor": encode_cursor(bson.decode(last)) if more else None}
+    tail.update(extra or {})
+    yield b"]," + dumps_bytes(tail)[1:]
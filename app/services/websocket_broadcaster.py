@@ -0,0 +1,561 @@
+import asyncio
+import itertools
+import json
+import logging
+import time
+import zlib
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Dict, Hashable, Iterable, List, Optional, Set
+
+from fastapi import WebSocket
+from starlette.websockets import WebSocketState
+
+from config.settings import (
+    WS_COALESCE_MS,
+    WS_HEARTBEAT_INTERVAL,
+    WS_HEARTBEAT_TIMEOUT,
+    WS_OVERFLOW_POLICY,
+    WS_QUEUE_SIZE,
+    WS_REPLAY_SIZE,
+    WS_SEND_TIMEOUT,
+    WS_SSE_KEEPALIVE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Politiques appliquées quand la file d'un client est pleine
+OVERFLOW_POLICIES = ("coalesce", "drop_oldest", "disconnect")
+
+# Format des trames choisi par le client (?encoding=):
+# - json: un événement par trame texte
+# - batch: tableau JSON des événements d'une fenêtre, en trame texte
+# - zlib: le même tableau compressé zlib, en trame binaire
+ENCODINGS = ("json", "batch", "zlib")
+
+# Trames compressées récemment, partagées entre clients ayant les mêmes abonnements
+COMPRESSED_CACHE_SIZE = 64
+
+_connection_ids = itertools.count(1)
+
+
+class ClientConnection:
+    def __init__(
+        self,
+        websocket: Optional[WebSocket],
+        queue_size: int,
+        overflow: str,
+        encoding: str = "json",
+        client=None,
+    ):
+        """
+        A live client (WebSocket, or server-sent events when ``websocket`` is None)
+        with its bounded outbound queue.
+
+        Queued messages are keyed (event type and visit): with the "coalesce"
+        policy, once the queue is full a message whose key is already queued
+        replaces the older one instead of evicting the oldest message. Below
+        capacity every message is kept.
+        """
+        self.id = next(_connection_ids)
+        self.websocket = websocket
+        self.client = websocket.client if websocket is not None else client
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.encoding = encoding
+        # clé -> (message, instant de mise en file, numéro de séquence)
+        self.queue: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.task: Optional[asyncio.Task] = None
+        self.connected_at = time.time()
+        # Dernier message reçu du client; heartbeat: pings applicatifs demandés par le client
+        self.last_seen = time.monotonic()
+        self.heartbeat = False
+        # Abonnements: tous les domaines / types d'événements, ou seulement ceux listés
+        # (un ensemble vide après désabonnement ne reçoit rien)
+        self.all_domains = True
+        self.all_events = True
+        self.domains: Set[str] = set()
+        self.events: Set[str] = set()
+        self.stats = {"sent": 0, "frames": 0, "bytes": 0, "dropped": 0, "coalesced": 0}
+
+    def enqueue(
+        self, message: str, key: Optional[Hashable] = None, seq: Optional[int] = None, replace: bool = False
+    ) -> bool:
+        """
+        Queue a message without waiting.
+
+        With ``replace`` a message already queued under ``key`` is replaced in
+        place, whatever the queue depth (pings: a slow client gets one, not one
+        per interval).
+
+        Returns:
+            False if the client is too slow and must be disconnected
+        """
+        if key is None:
+            key = object()
+        if replace and key in self.queue:
+            queued_at = self.queue[key][1]
+            self.queue[key] = (message, queued_at, seq)
+            self.stats["coalesced"] += 1
+            return True
+        full = len(self.queue) >= self.queue_size
+        if full and self.overflow == "coalesce" and key in self.queue:
+            # File pleine: l'événement en attente cède la place à sa version la plus récente
+            del self.queue[key]
+            self.queue[key] = (message, time.monotonic(), seq)
+            self.stats["coalesced"] += 1
+            self.ready.set()
+            return True
+        if key in self.queue:
+            key = object()
+        if full:
+            if self.overflow == "disconnect":
+                return False
+            self.queue.popitem(last=False)
+            self.stats["dropped"] += 1
+        self.queue[key] = (message, time.monotonic(), seq)
+        self.ready.set()
+        return True
+
+    def touch(self):
+        """Record a message received from the client."""
+        self.last_seen = time.monotonic()
+
+    @property
+    def lag(self) -> float:
+        """Seconds the oldest queued message has been waiting."""
+        if not self.queue:
+            return 0.0
+        return time.monotonic() - next(iter(self.queue.values()))[1]
+
+    def info(self) -> Dict[str, Any]:
+        client = self.client
+        return {
+            "id": self.id,
+            "client": f"{client.host}:{client.port}" if client else None,
+            "connected_at": self.connected_at,
+            "encoding": self.encoding,
+            "all_domains": self.all_domains,
+            "all_events": self.all_events,
+            "domains": sorted(self.domains),
+            "events": sorted(self.events),
+            "heartbeat": self.heartbeat,
+            "idle": round(time.monotonic() - self.last_seen, 3),
+            "queue_depth": len(self.queue),
+            "lag": round(self.lag, 3),
+            **self.stats,
+        }
+
+
+class WebSocketBroadcaster:
+    def __init__(
+        self,
+        queue_size: int = WS_QUEUE_SIZE,
+        overflow: str = WS_OVERFLOW_POLICY,
+        send_timeout: float = WS_SEND_TIMEOUT,
+        coalesce_ms: int = WS_COALESCE_MS,
+        heartbeat_interval: float = WS_HEARTBEAT_INTERVAL,
+        heartbeat_timeout: float = WS_HEARTBEAT_TIMEOUT,
+        replay_size: int = WS_REPLAY_SIZE,
+    ):
+        """
+        Fan-out of messages to the connected WebSocket clients.
+
+        ``publish`` only puts the message in the queue of each client; every
+        client has its own task sending its queue, so a slow or stalled client
+        never delays the publisher nor the other clients. When a queue is full
+        the overflow policy applies: "coalesce" (replace the queued message with
+        the same event type and visit, else drop the oldest), "drop_oldest" or
+        "disconnect".
+
+        Clients subscribe to domains and event types; an index from domain to
+        subscribers limits each publication to the matching clients.
+
+        Clients using the "batch" or "zlib" encoding receive the events queued
+        during ``coalesce_ms`` as a single array frame (zlib-compressed binary for
+        "zlib"). permessage-deflate is negotiated by the server (uvicorn) when the
+        client offers it, whatever the encoding.
+
+        A heartbeat task reaps the dead clients every ``heartbeat_interval``.
+        Clients that opted in (?heartbeat=1 or "heartbeat": true when
+        subscribing) also get a "ping" event and are reaped when they stay
+        silent for ``heartbeat_timeout``. The others (older dashboards) never see
+        a ping: the server (uvicorn --ws-ping-interval) pings them with protocol
+        frames and closes their socket, and they are reaped when it is closed,
+        when a send times out or when their queue has not been drained for
+        ``heartbeat_timeout``.
+
+        The last ``replay_size`` events received from the bus are kept with their
+        sequence number: a client reconnecting with the last sequence it received
+        gets the events it missed, or a "reset" event when they are no longer
+        available (it then reloads a snapshot through GET /agents/visits).
+
+        Args:
+            queue_size: Maximum number of messages queued per client
+            overflow: One of OVERFLOW_POLICIES
+            send_timeout: A send blocked longer than this disconnects the client
+            coalesce_ms: Window during which events are packed into one frame
+            heartbeat_interval: Seconds between two pings
+            heartbeat_timeout: Silence after which a client is considered dead
+            replay_size: Number of events kept for resuming clients
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Politique de débordement inconnue: {overflow}")
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.send_timeout = send_timeout
+        self.coalesce_window = coalesce_ms / 1000
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.heartbeat_task: Optional[asyncio.Task] = None
+        # (seq, événement) des derniers événements reçus du bus
+        self.history: deque = deque(maxlen=replay_size)
+        self.last_seq = 0
+        self.compressed: "OrderedDict[str, bytes]" = OrderedDict()
+        self.connections: Dict[int, ClientConnection] = {}
+        # Index des abonnés par domaine, et clients abonnés à tous les domaines
+        self.by_domain: Dict[str, Dict[int, ClientConnection]] = {}
+        self.all_domains: Dict[int, ClientConnection] = {}
+        self.stats = {
+            "connected": 0,
+            "disconnected": 0,
+            "slow_disconnected": 0,
+            "reaped": 0,
+            "send_timeouts": 0,
+            "pings": 0,
+            "published": 0,
+            "replayed": 0,
+            "resets": 0,
+        }
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        encoding: str = "json",
+        domains: Iterable[str] = (),
+        events: Iterable[str] = (),
+        last_seq: Optional[int] = None,
+        heartbeat: bool = False,
+    ) -> ClientConnection:
+        """
+        Accept a WebSocket client, subscribe it and replay what it missed since ``last_seq``.
+
+        With ``heartbeat`` the client receives "ping" events and must answer them.
+
+        Raises:
+            ValueError: If the encoding is unknown
+        """
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Encodage inconnu: {encoding}")
+        await websocket.accept()
+        connection = ClientConnection(websocket, self.queue_size, self.overflow, encoding)
+        connection.heartbeat = heartbeat
+        self.register(connection, domains, events, last_seq)
+        connection.task = asyncio.create_task(self.sender(connection))
+        return connection
+
+    def open_stream(
+        self,
+        client=None,
+        domains: Iterable[str] = (),
+        events: Iterable[str] = (),
+        last_seq: Optional[int] = None,
+    ) -> ClientConnection:
+        """Register a server-sent events client, whose queue is drained by ``stream``."""
+        connection = ClientConnection(None, self.queue_size, self.overflow, "sse", client)
+        self.register(connection, domains, events, last_seq)
+        return connection
+
+    def register(
+        self,
+        connection: ClientConnection,
+        domains: Iterable[str],
+        events: Iterable[str],
+        last_seq: Optional[int],
+    ):
+        # Sans await: aucun événement ne peut être publié entre la reprise et le direct
+        self.connections[connection.id] = connection
+        self.all_domains[connection.id] = connection
+        self.subscribe(connection, domains, events)
+        if last_seq is not None:
+            self.replay(connection, last_seq)
+        self.stats["connected"] += 1
+
+    def replay(self, connection: ClientConnection, last_seq: int):
+        """Queue the events after ``last_seq`` matching the client's subscriptions, in sequence order."""
+        # Les lots de workers différents peuvent arriver dans le désordre: tout le tampon
+        # est parcouru, et la reprise n'est possible que si aucun numéro ne manque
+        available = [(seq, event) for seq, event in self.history if seq > last_seq]
+        complete = last_seq <= self.last_seq and len(available) == self.last_seq - last_seq
+        missed = [
+            (seq, event)
+            for seq, event in available
+            if self.matches(connection, event.get("domain"), event.get("event"))
+        ]
+        if not complete or len(missed) > connection.queue_size:
+            # Trou trop ancien (ou séquence inconnue, ex. après redémarrage): recharger un snapshot
+            oldest = min((seq for seq, _ in self.history), default=self.last_seq + 1)
+            self.stats["resets"] += 1
+            connection.enqueue(json.dumps({"event": "reset", "seq": self.last_seq, "oldest_seq": oldest}))
+            return
+        missed.sort(key=lambda item: item[0])
+        for seq, event in missed:
+            connection.enqueue(event["message"], event.get("key"), seq)
+        self.stats["replayed"] += len(missed)
+
+    def unregister(self, connection: ClientConnection) -> bool:
+        """Remove a client from the registry and stop its sender, in O(1)."""
+        if connection.closed:
+            return False
+        connection.closed = True
+        self.connections.pop(connection.id, None)
+        self.unsubscribe(connection, domains=list(connection.domains))
+        self.all_domains.pop(connection.id, None)
+        self.stats["disconnected"] += 1
+        if connection.task is not None and connection.task is not asyncio.current_task():
+            connection.task.cancel()
+        # Réveiller le flux SSE pour qu'il se termine
+        connection.ready.set()
+        return True
+
+    def subscribe(
+        self,
+        connection: ClientConnection,
+        domains: Iterable[str] = (),
+        events: Iterable[str] = (),
+        all_domains: bool = False,
+        all_events: bool = False,
+    ):
+        """
+        Add domains / event types to a client's subscriptions.
+
+        A client starts subscribed to everything; its first domain (event type)
+        restricts it to the listed ones, until ``all_domains`` (``all_events``)
+        subscribes it to everything again.
+        """
+        if all_domains:
+            self.unsubscribe(connection, domains=list(connection.domains))
+            connection.all_domains = True
+            self.all_domains[connection.id] = connection
+        else:
+            for domain in domains:
+                if connection.all_domains:
+                    connection.all_domains = False
+                    self.all_domains.pop(connection.id, None)
+                connection.domains.add(domain)
+                self.by_domain.setdefault(domain, {})[connection.id] = connection
+        if all_events:
+            connection.all_events = True
+            connection.events.clear()
+        else:
+            for event in events:
+                connection.all_events = False
+                connection.events.add(event)
+
+    def unsubscribe(self, connection: ClientConnection, domains: Iterable[str] = (), events: Iterable[str] = ()):
+        """Remove domains / event types from a client restricted to a list of them."""
+        for domain in domains:
+            connection.domains.discard(domain)
+            subscribers = self.by_domain.get(domain)
+            if subscribers is not None:
+                subscribers.pop(connection.id, None)
+                if not subscribers:
+                    del self.by_domain[domain]
+        connection.events.difference_update(events)
+
+    async def disconnect(self, connection: ClientConnection, code: int = 1000):
+        if self.unregister(connection):
+            await self.close(connection, code)
+
+    async def close(self, connection: ClientConnection, code: int):
+        if connection.websocket is None:
+            return
+        try:
+            await asyncio.wait_for(connection.websocket.close(code=code), self.send_timeout)
+        except Exception:
+            # Déjà fermée par le client
+            pass
+
+    def start(self):
+        if self.heartbeat_task is None or self.heartbeat_task.done():
+            self.heartbeat_task = asyncio.create_task(self.run_heartbeat())
+
+    async def run_heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.reap()
+            except Exception:
+                logger.exception("❌ Erreur lors de la vérification des connexions WebSocket")
+
+    def is_dead(self, connection: ClientConnection, now: float) -> bool:
+        websocket = connection.websocket
+        if websocket is not None and websocket.client_state == WebSocketState.DISCONNECTED:
+            return True
+        if connection.task is not None and connection.task.done():
+            return True
+        if connection.heartbeat and now - connection.last_seen > self.heartbeat_timeout:
+            return True
+        # Tous clients: file non vidée depuis trop longtemps
+        return connection.lag > self.heartbeat_timeout
+
+    async def reap(self) -> int:
+        """Close the dead clients and ping the others."""
+        now = time.monotonic()
+        dead = [connection for connection in self.connections.values() if self.is_dead(connection, now)]
+        for connection in dead:
+            self.unregister(connection)
+            self.stats["reaped"] += 1
+        ping = json.dumps({"event": "ping", "ts": time.time()})
+        for connection in list(self.connections.values()):
+            # Seuls les clients ayant demandé le heartbeat reçoivent l'événement (SSE: commentaires keepalive)
+            if connection.heartbeat and connection.enqueue(ping, key="ping", replace=True):
+                self.stats["pings"] += 1
+        await asyncio.gather(*[self.close(connection, 1001) for connection in dead])
+        if dead:
+            logger.info(f"🧹 {len(dead)} connexions WebSocket inactives fermées, {len(self.connections)} actives")
+        return len(dead)
+
+    async def close_all(self):
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+            await asyncio.gather(self.heartbeat_task, return_exceptions=True)
+            self.heartbeat_task = None
+        await asyncio.gather(*[self.disconnect(connection, 1001) for connection in list(self.connections.values())])
+
+    def subscribers(self, domain: Optional[str] = None) -> List[ClientConnection]:
+        subscribers = list(self.all_domains.values())
+        if domain is not None:
+            subscribers.extend(self.by_domain.get(domain, {}).values())
+        return subscribers
+
+    @staticmethod
+    def matches(connection: ClientConnection, domain: Optional[str], event: Optional[str]) -> bool:
+        return (connection.all_domains or domain in connection.domains) and (
+            connection.all_events or event in connection.events
+        )
+
+    def publish(
+        self,
+        message: str,
+        key: Optional[Hashable] = None,
+        domain: Optional[str] = None,
+        event: Optional[str] = None,
+        seq: Optional[int] = None,
+    ):
+        """
+        Queue a serialized message for the clients subscribed to its domain and
+        event type, without waiting for any send.
+        """
+        self.stats["published"] += 1
+        for connection in self.subscribers(domain):
+            if not connection.all_events and event not in connection.events:
+                continue
+            if not connection.enqueue(message, key, seq):
+                self.stats["slow_disconnected"] += 1
+                logger.warning(f"⚠️ Client WebSocket {connection.id} trop lent, déconnecté")
+                self.unregister(connection)
+                # La fermeture ne doit pas bloquer la publication
+                asyncio.ensure_future(self.close(connection, 1008))
+
+    def publish_events(self, events: List[Dict[str, Any]]):
+        """Event bus handler: publish a batch of events to the local clients."""
+        for event in events:
+            seq = event.get("seq")
+            if seq is not None:
+                self.history.append((seq, event))
+                self.last_seq = max(self.last_seq, seq)
+            self.publish(event["message"], event.get("key"), event.get("domain"), event.get("event"), seq)
+
+    def compress(self, frame: str) -> bytes:
+        data = self.compressed.get(frame)
+        if data is None:
+            data = self.compressed[frame] = zlib.compress(frame.encode("utf-8"))
+            if len(self.compressed) > COMPRESSED_CACHE_SIZE:
+                self.compressed.popitem(last=False)
+        return data
+
+    async def send_frame(self, connection: ClientConnection, messages: List[str]):
+        websocket = connection.websocket
+        if connection.encoding == "json":
+            frame = messages[0]
+            await asyncio.wait_for(websocket.send_text(frame), self.send_timeout)
+            size = len(frame)
+        else:
+            frame = "[" + ",".join(messages) + "]"
+            if connection.encoding == "zlib":
+                data = self.compress(frame)
+                await asyncio.wait_for(websocket.send_bytes(data), self.send_timeout)
+                size = len(data)
+            else:
+                await asyncio.wait_for(websocket.send_text(frame), self.send_timeout)
+                size = len(frame)
+        connection.stats["sent"] += len(messages)
+        connection.stats["frames"] += 1
+        connection.stats["bytes"] += size
+
+    async def sender(self, connection: ClientConnection):
+        try:
+            while True:
+                await connection.ready.wait()
+                if connection.encoding != "json" and self.coalesce_window:
+                    # Laisser la fenêtre se remplir pour n'envoyer qu'une trame
+                    await asyncio.sleep(self.coalesce_window)
+                connection.ready.clear()
+                while connection.queue:
+                    if connection.encoding == "json":
+                        _, (message, _, _) = connection.queue.popitem(last=False)
+                        messages = [message]
+                    else:
+                        messages = [message for message, _, _ in connection.queue.values()]
+                        connection.queue.clear()
+                    await self.send_frame(connection, messages)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            # Envoi bloqué: socket morte ou client qui ne lit plus
+            self.stats["send_timeouts"] += 1
+            self.stats["reaped"] += 1
+            logger.warning(f"⚠️ Envoi au client WebSocket {connection.id} expiré, connexion fermée")
+            await self.disconnect(connection, 1011)
+        except Exception as e:
+            logger.warning(f"⚠️ Envoi impossible au client WebSocket {connection.id}: {e}")
+            await self.disconnect(connection, 1011)
+
+    async def stream(self, connection: ClientConnection, keepalive: float = WS_SSE_KEEPALIVE) -> AsyncIterator[str]:
+        """Server-sent events of a client opened with ``open_stream``, with the sequence as event id."""
+        try:
+            while not connection.closed:
+                try:
+                    await asyncio.wait_for(connection.ready.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                connection.ready.clear()
+                while connection.queue and not connection.closed:
+                    _, (message, _, seq) = connection.queue.popitem(last=False)
+                    frame = (f"id: {seq}\n" if seq is not None else "") + f"data: {message}\n\n"
+                    connection.stats["sent"] += 1
+                    connection.stats["frames"] += 1
+                    connection.stats["bytes"] += len(frame)
+                    yield frame
+        finally:
+            self.unregister(connection)
+
+    def info(self) -> Dict[str, Any]:
+        connections: List[Dict[str, Any]] = [connection.info() for connection in self.connections.values()]
+        return {
+            "connections": len(connections),
+            "domains": len(self.by_domain),
+            "queue_size": self.queue_size,
+            "overflow": self.overflow,
+            "coalesce_ms": round(self.coalesce_window * 1000),
+            "heartbeat_interval": self.heartbeat_interval,
+            "heartbeat_timeout": self.heartbeat_timeout,
+            "last_seq": self.last_seq,
+            "replay_buffer": len(self.history),
+            "max_lag": max((connection["lag"] for connection in connections), default=0.0),
+            **self.stats,
+            "clients": connections,
+        }
@@ -0,0 +1,137 @@
+import datetime
+import json
+import zlib
+from typing import Any, AsyncIterator
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson absent: repli sur json + custom_json_serializer
+    orjson = None
+
+
+# Fonction pour convertir automatiquement ObjectId en chaînes lors de la sérialisation
+def custom_json_serializer(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)  # Convertir ObjectId en chaîne
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()  # Convertir les objets datetime en chaîne
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+def _orjson_default(obj):
+    # orjson gère nativement datetime, date et UUID: seul ObjectId passe par ici
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    return custom_json_serializer(obj)
+
+
+# Sérialisation rapide des documents MongoDB (ObjectId, datetime) en JSON
+def dumps_bytes(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=custom_json_serializer, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(obj: Any) -> str:
+    return dumps_bytes(obj).decode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    """
+    Raises:
+        ValueError: If ``data`` is not valid JSON
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Format ISO 8601 UTC appliqué côté serveur par $dateToString: toujours en millisecondes
+# avec suffixe Z (ex. 2026-01-01T10:00:00.000Z), là où isoformat() omettait le fuseau
+ISO_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%LZ"
+
+
+def iso_date(date) -> str:
+    """Python counterpart of json_date, for a naive UTC or timezone-aware datetime."""
+    if date.tzinfo is not None:
+        date = date.astimezone(datetime.timezone.utc)
+    return date.strftime("%Y-%m-%dT%H:%M:%S.") + f"{date.microsecond // 1000:03d}Z"
+
+
+def json_date(field: str):
+    """
+    Expression formatting a date field as ISO 8601.
+
+    Only BSON dates are converted: null stays null, and dates stored as strings
+    by older agents are returned unchanged ($dateToString would fail the query).
+    """
+    return {
+        "$cond": [
+            {"$eq": [{"$type": f"${field}"}, "date"]},
+            {"$dateToString": {"date": f"${field}", "format": ISO_DATE_FORMAT}},
+            f"${field}",
+        ]
+    }
+
+
+class MongoJSONResponse(JSONResponse):
+    """
+    JSON response rendering MongoDB documents directly with ``dumps_bytes``.
+
+    Return it from the route (rather than a dict) to also skip FastAPI's
+    jsonable_encoder pass.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
+
+
+class BodyTooLarge(ValueError):
+    """Request body (received or decompressed) larger than the accepted size."""
+
+
+# Fonction pour lire un corps de requête au fil de l'eau, sans dépasser max_bytes
+async def read_body(stream: AsyncIterator[bytes], max_bytes: int) -> bytes:
+    """
+    Raises:
+        BodyTooLarge: As soon as more than ``max_bytes`` have been received
+    """
+    chunks = []
+    size = 0
+    async for chunk in stream:
+        size += len(chunk)
+        if size > max_bytes:
+            raise BodyTooLarge(f"Corps de requête supérieur à {max_bytes} octets")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+# Fonction pour décompresser un corps de requête (Content-Encoding gzip / deflate)
+def decompress_body(body: bytes, encoding: str, max_bytes: int) -> bytes:
+    """
+    Raises:
+        BodyTooLarge: If the decompressed body exceeds ``max_bytes``
+        ValueError: If the encoding is not supported or the data is corrupt or truncated
+    """
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        data = body
+    elif encoding in ("gzip", "x-gzip", "deflate"):
+        # 32 + 15: en-tête gzip ou zlib détecté automatiquement
+        wbits = 47 if encoding != "deflate" or body[:1] == b"\x78" else -15
+        decompressor = zlib.decompressobj(wbits)
+        try:
+            data = decompressor.decompress(body, max_bytes + 1)
+        except zlib.error as e:
+            raise ValueError(f"Corps {encoding} invalide: {e}")
+        if len(data) <= max_bytes and not decompressor.eof:
+            # Flux incomplet: ne pas accepter un lot partiel
+            raise ValueError(f"Corps {encoding} tronqué")
+    else:
+        raise ValueError(f"Content-Encoding non supporté: {encoding}")
+    if len(data) > max_bytes:
+        raise BodyTooLarge(f"Corps de requête supérieur à {max_bytes} octets")
+    return data
@@ -0,0 +1,55 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    Compact probabilistic set used to de-duplicate URLs during a crawl.
+
+    Membership tests may return false positives (bounded by ``error_rate``)
+    but never false negatives, so memory stays fixed whatever the size of
+    the site being crawled.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        """
+        Args:
+            capacity: Expected number of distinct items
+            error_rate: Target false positive probability once ``capacity`` is reached
+        """
+        capacity = max(1, capacity)
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Double hashing (Kirsch-Mitzenmacher) à partir d'un seul digest
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str) -> bool:
+        """
+        Add an item to the filter.
+
+        Returns:
+            True if the item was (probably) not present before
+        """
+        added = False
+        for pos in self._positions(item):
+            byte, mask = pos >> 3, 1 << (pos & 7)
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def __len__(self) -> int:
+        return self.count
@@ -0,0 +1,35 @@
+import struct
+from typing import Iterator
+
+import bson
+
+from app.utils.api_utils import dumps_bytes
+
+try:
+    import bsonjs
+except ImportError:  # python-bsonjs absent: repli sur bson.decode + dumps_bytes
+    bsonjs = None
+
+_INT32 = struct.Struct("<i")
+
+
+def iter_documents(batch: bytes) -> Iterator[bytes]:
+    """BSON documents of a raw batch, as returned by the ``*_raw_batches`` cursors."""
+    position = 0
+    while position < len(batch):
+        size = _INT32.unpack_from(batch, position)[0]
+        yield batch[position:position + size]
+        position += size
+
+
+def document_json(document: bytes) -> bytes:
+    """
+    JSON of a raw BSON document.
+
+    With python-bsonjs the bytes are converted by libbson, without building a
+    dict. Its output is MongoDB Extended JSON, which is plain JSON for the
+    strings, numbers and nulls produced by json_projection.
+    """
+    if bsonjs is not None:
+        return bsonjs.dumps(document).encode("utf-8")
+    return dumps_bytes(bson.decode(document))
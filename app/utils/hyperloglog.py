@@ -0,0 +1,102 @@
+import hashlib
+import math
+from typing import Iterable, Optional
+
+# 2^-r pour chaque valeur de registre possible (hash de 64 bits)
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(65)]
+
+
+class HyperLogLog:
+    """
+    Cardinality sketch counting distinct items in ``2 ** precision`` bytes.
+
+    The estimate has a relative standard error of ``1.04 / sqrt(2 ** precision)``
+    (0.81% with the default precision). Two sketches of the same precision merge
+    into the sketch of the union of their items, so daily sketches add up to
+    week or month figures without the raw data.
+    """
+
+    def __init__(self, precision: int = 14, registers: Optional[bytes] = None):
+        """
+        Args:
+            precision: Number of bits of the hash selecting a register (4 to 16)
+            registers: Registers of a serialized sketch (see ``to_bytes``)
+
+        Raises:
+            ValueError: If the precision is out of range or does not match ``registers``
+        """
+        if not 4 <= precision <= 16:
+            raise ValueError(f"Précision HyperLogLog invalide: {precision}")
+        self.precision = precision
+        self.num_registers = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.num_registers)
+        if len(self.registers) != self.num_registers:
+            raise ValueError(f"{len(self.registers)} registres pour une précision de {precision}")
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        precision = len(data).bit_length() - 1
+        return cls(precision, data)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.num_registers)
+
+    def add(self, item: str) -> bool:
+        """
+        Add an item to the sketch.
+
+        Returns:
+            True if a register changed (the item was not seen before)
+        """
+        x = int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big")
+        index = x >> (64 - self.precision)
+        remaining_bits = 64 - self.precision
+        # Position du premier bit à 1 dans les bits restants
+        rank = remaining_bits - (x & ((1 << remaining_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def update(self, items: Iterable[str]) -> bool:
+        changed = False
+        for item in items:
+            changed = self.add(item) or changed
+        return changed
+
+    def merge(self, other: "HyperLogLog") -> bool:
+        """
+        Merge another sketch into this one (union of their items).
+
+        Returns:
+            True if a register changed
+
+        Raises:
+            ValueError: If the precisions differ
+        """
+        if other.precision != self.precision:
+            raise ValueError("Impossible de fusionner des sketches de précisions différentes")
+        merged = bytearray(map(max, self.registers, other.registers))
+        changed = merged != self.registers
+        self.registers = merged
+        return changed
+
+    def count(self) -> int:
+        m = self.num_registers
+        if m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / sum(map(_INVERSE_POWERS.__getitem__, self.registers))
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Petites cardinalités: comptage linéaire sur les registres vides
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def __len__(self) -> int:
+        return self.count()
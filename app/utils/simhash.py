@@ -0,0 +1,52 @@
+import hashlib
+import re
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# Un bloc script/style ou un commentaire non refermé (page tronquée) court jusqu'à la fin
+_TAG_RE = re.compile(
+    r"<(script|style)\b.*?(?:</\1\s*>|\Z)|<!--.*?(?:-->|\Z)|<[^>]*>", re.IGNORECASE | re.DOTALL
+)
+_BODY_RE = re.compile(r"<body\b[^>]*>", re.IGNORECASE)
+_HEAD_RE = re.compile(r"<head\b", re.IGNORECASE)
+
+SIMHASH_BITS = 64
+
+
+def html_tokens(html: str):
+    """
+    Lowercase words of the visible text of an HTML fragment.
+
+    Only the text of ``<body>`` is kept when the document has one; a document
+    cut before its body (large inline scripts in ``<head>``) has no tokens.
+    """
+    body = _BODY_RE.search(html)
+    if body:
+        html = html[body.end():]
+    elif _HEAD_RE.search(html):
+        return []
+    return _TOKEN_RE.findall(_TAG_RE.sub(" ", html).lower())
+
+
+def simhash(tokens, shingle_size: int = 3) -> int:
+    """
+    64-bit simhash of a token sequence, computed over word shingles.
+
+    Near-duplicate documents get fingerprints with a small Hamming distance.
+    """
+    tokens = list(tokens)
+    if len(tokens) >= shingle_size:
+        features = (" ".join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1))
+    else:
+        features = iter(tokens)
+
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
@@ -0,0 +1,74 @@
+from typing import Any, Dict, List
+
+
+class SpaceSaving:
+    """
+    Top-K summary of a stream (Space-Saving algorithm) in ``capacity`` counters.
+
+    Every item whose true frequency exceeds ``total / capacity`` is guaranteed to
+    be tracked. Counts are overestimates: the true count of an item lies in
+    ``[count - error, count]``.
+    """
+
+    def __init__(self, capacity: int = 100):
+        """
+        Args:
+            capacity: Number of counters kept
+        """
+        self.capacity = max(1, capacity)
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.total = 0
+
+    def add(self, item: str, count: int = 1):
+        self.total += count
+        if item in self.counts:
+            self.counts[item] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+            return
+        # Remplacer l'élément le moins fréquent, dont le compte devient l'erreur du nouveau
+        evicted = min(self.counts, key=self.counts.__getitem__)
+        floor = self.counts.pop(evicted)
+        del self.errors[evicted]
+        self.counts[item] = floor + count
+        self.errors[item] = floor
+
+    def min_count(self) -> int:
+        """Upper bound of the count of any untracked item."""
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def merge(self, other: "SpaceSaving"):
+        """Merge another summary into this one, keeping the ``capacity`` largest counters."""
+        own_floor, other_floor = self.min_count(), other.min_count()
+        counts, errors = {}, {}
+        for item in self.counts.keys() | other.counts.keys():
+            counts[item] = self.counts.get(item, own_floor) + other.counts.get(item, other_floor)
+            errors[item] = self.errors.get(item, own_floor) + other.errors.get(item, other_floor)
+        kept = sorted(counts, key=counts.__getitem__, reverse=True)[: self.capacity]
+        self.counts = {item: counts[item] for item in kept}
+        self.errors = {item: errors[item] for item in kept}
+        self.total += other.total
+
+    def top(self, limit: int = 10) -> List[Dict[str, Any]]:
+        items = sorted(self.counts, key=self.counts.__getitem__, reverse=True)[:limit]
+        return [{"value": item, "count": self.counts[item], "error": self.errors[item]} for item in items]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"capacity": self.capacity, "total": self.total, "items": self.top(self.capacity)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SpaceSaving":
+        summary = cls(data["capacity"])
+        summary.total = data["total"]
+        for entry in data["items"]:
+            summary.counts[entry["value"]] = entry["count"]
+            summary.errors[entry["value"]] = entry["error"]
+        return summary
+
+    def __len__(self) -> int:
+        return len(self.counts)
@@ -12,3 +12,105 @@ MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")  # Tu peux le ch
 
 # Clé secrète pour la gestion des tokens
 SECRET_KEY = os.getenv("SECRET_KEY", "your_default_secret_key")  # Remplace par la clé réelle ou une variable d'environnement
+
+# Crawl de secours quand le domaine n'a pas de sitemap.xml
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "3"))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "500"))
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "10"))
+CRAWL_USER_AGENT = os.getenv("CRAWL_USER_AGENT", "MonitoringBot/1.0")
+
+# Jobs de fond (scans longs lancés via /services/jobs)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "200"))
+
+# Détection des "soft 404" (page introuvable servie avec un code 200)
+SOFT_404_MAX_BYTES = int(os.getenv("SOFT_404_MAX_BYTES", str(64 * 1024)))
+SOFT_404_MAX_DISTANCE = int(os.getenv("SOFT_404_MAX_DISTANCE", "10"))
+# En dessous de ce nombre de mots dans le <body> lu, l'empreinte n'est pas concluante
+SOFT_404_MIN_TOKENS = int(os.getenv("SOFT_404_MIN_TOKENS", "20"))
+
+# Cache de la liste des domaines (GET /services/domains)
+DOMAINS_CACHE_TTL = float(os.getenv("DOMAINS_CACHE_TTL", "60"))
+DOMAINS_FETCH_TIMEOUT = float(os.getenv("DOMAINS_FETCH_TIMEOUT", "10"))
+DOMAINS_RETRY_DELAY = float(os.getenv("DOMAINS_RETRY_DELAY", "15"))
+
+# Écriture des visites par lots (POST /agents/visit/)
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", "50"))
+INGEST_MAX_BATCH = int(os.getenv("INGEST_MAX_BATCH", "500"))
+
+# Nombre maximal d'entrées par document (domaine, heure) de ip_logs
+IP_LOG_BUCKET_SIZE = int(os.getenv("IP_LOG_BUCKET_SIZE", "1000"))
+# Nombre maximal d'entrées ip_logs renvoyées avec la première page de GET /agents/visits
+IP_LOG_PAGE_MAX_ENTRIES = int(os.getenv("IP_LOG_PAGE_MAX_ENTRIES", "1000"))
+
+# Jeton d'accès aux routes /debug (non défini: routes désactivées)
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN")
+
+# Durée maximale de la vérification des index au démarrage (MongoDB injoignable)
+STARTUP_INDEX_TIMEOUT = float(os.getenv("STARTUP_INDEX_TIMEOUT", "30"))
+
+# Taille maximale d'une page de GET /agents/visits
+VISITS_PAGE_MAX = int(os.getenv("VISITS_PAGE_MAX", "1000"))
+
+# Nombre de visites transcodées par morceau envoyé dans les réponses en flux
+VISITS_STREAM_CHUNK = int(os.getenv("VISITS_STREAM_CHUNK", "200"))
+
+# Export GET /agents/visits/export: taille des lots lus sur le curseur (= lignes par morceau)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+
+# Nombre maximal de buckets renvoyés par GET /agents/rollups
+ROLLUP_QUERY_MAX = int(os.getenv("ROLLUP_QUERY_MAX", "1440"))
+
+# Précision des sketches HyperLogLog de visiteurs uniques (2^p octets, erreur 1.04/sqrt(2^p))
+HLL_PRECISION = int(os.getenv("HLL_PRECISION", "14"))
+# Intervalle (s) de fusion des sketches en mémoire dans MongoDB
+HLL_FLUSH_INTERVAL = float(os.getenv("HLL_FLUSH_INTERVAL", "30"))
+
+# Top-K des IPs / user agents par domaine et heure (GET /agents/top)
+HEAVY_HITTERS_CAPACITY = int(os.getenv("HEAVY_HITTERS_CAPACITY", "100"))
+HEAVY_HITTERS_SNAPSHOT_INTERVAL = float(os.getenv("HEAVY_HITTERS_SNAPSHOT_INTERVAL", "30"))
+
+# Détection d'IPs suspectes: plus de ABUSE_THRESHOLD visites sur une fenêtre glissante
+ABUSE_WINDOW_SECONDS = float(os.getenv("ABUSE_WINDOW_SECONDS", "3600"))
+ABUSE_WINDOW_BUCKETS = int(os.getenv("ABUSE_WINDOW_BUCKETS", "60"))
+ABUSE_THRESHOLD = int(os.getenv("ABUSE_THRESHOLD", "5"))
+ABUSE_MAX_KEYS = int(os.getenv("ABUSE_MAX_KEYS", "100000"))
+
+# Cache des sessions ouvertes par (domaine, utilisateur); partagé via Redis si l'URL est définie
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "100000"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "1800"))
+SESSION_CACHE_REDIS_URL = os.getenv("SESSION_CACHE_REDIS_URL")
+
+# Lots de visites (POST /agents/visits/batch): nombre de visites et taille décompressée maximale
+INGEST_BATCH_MAX_ITEMS = int(os.getenv("INGEST_BATCH_MAX_ITEMS", "1000"))
+INGEST_BATCH_MAX_BYTES = int(os.getenv("INGEST_BATCH_MAX_BYTES", str(5 * 1024 * 1024)))
+
+# Diffusion WebSocket (/ws/visits): file par client et politique quand elle déborde
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "256"))
+WS_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "coalesce")
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+
+# Bus d'événements des visites entre workers (Redis pub/sub si l'URL est définie)
+EVENT_BUS_REDIS_URL = os.getenv("EVENT_BUS_REDIS_URL")
+EVENT_BUS_CHANNEL = os.getenv("EVENT_BUS_CHANNEL", "visits_events")
+EVENT_BUS_FLUSH_MS = int(os.getenv("EVENT_BUS_FLUSH_MS", "10"))
+EVENT_BUS_SEQUENCE_KEY = os.getenv("EVENT_BUS_SEQUENCE_KEY", "visits_events:seq")
+
+# Fenêtre de regroupement des événements en une trame (clients ?encoding=batch / zlib)
+WS_COALESCE_MS = int(os.getenv("WS_COALESCE_MS", "50"))
+
+# Heartbeat des connexions WebSocket: ping toutes les N secondes (événement pour les clients
+# ?heartbeat=1, trame protocole via start.sh pour les autres), fermeture après le délai sans réponse
+WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "20"))
+WS_HEARTBEAT_TIMEOUT = float(os.getenv("WS_HEARTBEAT_TIMEOUT", "60"))
+
+# Événements gardés en mémoire pour la reprise d'un flux (/ws/visits, /agents/visits/events)
+WS_REPLAY_SIZE = int(os.getenv("WS_REPLAY_SIZE", "10000"))
+WS_SSE_KEEPALIVE = float(os.getenv("WS_SSE_KEEPALIVE", "15"))
+
+# Rétention des visites et ip_logs: au-delà de RETENTION_DAYS jours (0 = conservation illimitée),
+# archivées en .ndjson.gz par jour dans RETENTION_ARCHIVE_DIR puis supprimées
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "archive")
+RETENTION_SWEEP_INTERVAL = float(os.getenv("RETENTION_SWEEP_INTERVAL", "3600"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "10000"))
@@ -1,15 +1,67 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes.monitoring_routes import router as monitoring_router
-from app.routes.agents_ip_routes import router as agents_ip_router
+from app.routes.agents_ip_routes import (
+    router as agents_ip_router,
+    visit_ingest,
+    heavy_hitters,
+    unique_visitors,
+    broadcaster,
+    event_bus,
+    retention,
+    db,
+)
+from app.routes.debug_routes import router as debug_router
+from app.services.index_service import ensure_errors, ensure_indexes
+from app.services.job_service import job_manager
 import os
 from dotenv import load_dotenv
+from config.settings import DEBUG_TOKEN, STARTUP_INDEX_TIMEOUT
 
 # Charger les variables d'environnement
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+# Étape d'arrêt isolée: une erreur est journalisée sans empêcher les suivantes
+async def shutdown_step(name, stop):
+    try:
+        await stop()
+    except Exception:
+        logger.exception(f"❌ Erreur lors de l'arrêt de {name}")
+
+
+# Démarrage / arrêt des tâches de fond
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Démarrage borné même si MongoDB est injoignable (erreur visible dans /debug/indexes)
+    try:
+        await asyncio.wait_for(ensure_indexes(db), STARTUP_INDEX_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.error(f"❌ Création des index interrompue après {STARTUP_INDEX_TIMEOUT} s")
+        ensure_errors["*"] = f"Délai de {STARTUP_INDEX_TIMEOUT} s dépassé"
+    await event_bus.start()
+    broadcaster.start()
+    visit_ingest.start()
+    heavy_hitters.start()
+    unique_visitors.start()
+    retention.start()
+    yield
+    await shutdown_step("la rétention", retention.stop)
+    await shutdown_step("l'écriture des visites", visit_ingest.stop)
+    await shutdown_step("des top-K", heavy_hitters.stop)
+    await shutdown_step("des visiteurs uniques", unique_visitors.stop)
+    await shutdown_step("du bus d'événements", event_bus.stop)
+    await shutdown_step("des WebSockets", broadcaster.close_all)
+    await shutdown_step("des jobs", job_manager.stop)
+
+
 # Créer l'application FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Ajouter la configuration CORS
 origins = [
@@ -30,3 +82,5 @@ app.add_middleware(
 # Ajouter les routeurs
 app.include_router(monitoring_router, prefix="/services")
 app.include_router(agents_ip_router)
+if DEBUG_TOKEN:
+    app.include_router(debug_router)
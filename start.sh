@@ -1,4 +1,6 @@
 #!/bin/bash
 
 PORT=${PORT:-8000}  # Utilise 8000 si $PORT n'est pas défini
-uvicorn main:app --host=0.0.0.0 --port=$PORT --reload
+# Ping WebSocket au niveau protocole: ferme les sockets mortes des clients sans heartbeat applicatif
+uvicorn main:app --host=0.0.0.0 --port=$PORT --reload \
+    --ws-ping-interval=${WS_HEARTBEAT_INTERVAL:-20} --ws-ping-timeout=${WS_HEARTBEAT_TIMEOUT:-60}
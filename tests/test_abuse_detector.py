@@ -0,0 +1,72 @@
+from app.services.abuse_detector import AbuseDetector, WindowCounter
+
+
+def detector(**kwargs):
+    # Fenêtre de 60 s en 6 cases de 10 s
+    options = {"window_seconds": 60, "buckets": 6, "threshold": 3, "max_keys": 100}
+    options.update(kwargs)
+    return AbuseDetector(**options)
+
+
+def test_ip_is_suspect_above_the_threshold_within_the_window():
+    abuse = detector()
+    for second in (0, 5, 12):
+        abuse.record("10.0.0.1", "example.com", now=second)
+    assert not abuse.is_suspect("10.0.0.1", "example.com", now=15)
+
+    assert abuse.record("10.0.0.1", "example.com", now=20) == 4
+    assert abuse.is_suspect("10.0.0.1", "example.com", now=20)
+    # Autre domaine: compteur distinct
+    assert abuse.count("10.0.0.1", "other.com", now=20) == 0
+
+
+def test_visits_leave_the_window_bucket_by_bucket():
+    abuse = detector()
+    for second in (0, 5, 12, 20):
+        abuse.record("10.0.0.1", "example.com", now=second)
+
+    assert abuse.count("10.0.0.1", "example.com", now=59) == 4
+    # La case [0, 10) sort de la fenêtre à t=60
+    assert abuse.count("10.0.0.1", "example.com", now=60) == 2
+    assert abuse.count("10.0.0.1", "example.com", now=75) == 1
+    assert abuse.count("10.0.0.1", "example.com", now=200) == 0
+
+
+def test_suspects_are_listed_most_active_first_and_expire():
+    abuse = detector()
+    for _ in range(5):
+        abuse.record("10.0.0.1", "example.com", now=0)
+    for _ in range(7):
+        abuse.record("10.0.0.2", "other.com", now=0)
+    abuse.record("10.0.0.3", "example.com", now=0)
+
+    assert [suspect["ip"] for suspect in abuse.suspects(now=1)] == ["10.0.0.2", "10.0.0.1"]
+    assert [suspect["ip"] for suspect in abuse.suspects("example.com", now=1)] == ["10.0.0.1"]
+    assert abuse.suspects(now=60) == []
+
+
+def test_idle_keys_expire_and_the_oldest_are_evicted():
+    abuse = detector(max_keys=2)
+    abuse.record("10.0.0.1", "example.com", now=0)
+    abuse.record("10.0.0.2", "example.com", now=30)
+    abuse.record("10.0.0.3", "example.com", now=40)
+
+    assert list(abuse.counters) == [("10.0.0.2", "example.com"), ("10.0.0.3", "example.com")]
+    assert abuse.stats["evicted"] == 1
+
+    # Plus aucune visite pendant une fenêtre entière: compteur supprimé
+    abuse.record("10.0.0.3", "example.com", now=95)
+    assert list(abuse.counters) == [("10.0.0.3", "example.com")]
+    assert abuse.stats["expired"] == 1
+
+
+def test_window_counter_ignores_late_buckets_and_resets_after_a_gap():
+    counter = WindowCounter(4)
+    counter.add(10)
+    counter.add(11, 2)
+    counter.advance(9)
+    assert counter.total == 3
+
+    counter.add(20)
+    assert counter.total == 1
+    assert sum(counter.counts) == counter.total
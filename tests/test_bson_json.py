@@ -0,0 +1,56 @@
+import asyncio
+import datetime
+import json
+
+import bson
+from bson import ObjectId
+
+from app.services.visit_query_service import decode_cursor, stream_visits_page
+from app.utils.bson_json import document_json, iter_documents
+
+
+class RawBatchCollection:
+    """Collection returning fixed documents as raw BSON batches of ``batch_size``."""
+
+    def __init__(self, documents, batch_size=2):
+        self.documents = documents
+        self.batch_size = batch_size
+
+    def aggregate_raw_batches(self, pipeline, **kwargs):
+        limit = next((stage["$limit"] for stage in pipeline if "$limit" in stage), len(self.documents))
+        documents = self.documents[:limit]
+
+        async def batches():
+            for i in range(0, len(documents), self.batch_size):
+                yield b"".join(bson.encode(document) for document in documents[i:i + self.batch_size])
+
+        return batches()
+
+
+def test_document_json_matches_decoded_json():
+    document = {"_id": "abc", "ip": "1.2.3.4", "ua": "é \"q\" \n", "n": 3, "ok": True, "no": None}
+    assert json.loads(document_json(bson.encode(document))) == document
+
+
+def test_iter_documents_splits_a_batch():
+    documents = [{"i": i} for i in range(3)]
+    batch = b"".join(bson.encode(document) for document in documents)
+    assert [bson.decode(document) for document in iter_documents(batch)] == documents
+
+
+def test_stream_visits_page_from_raw_batches():
+    visits = [
+        {"_id": str(ObjectId()), "date_entree": f"2026-01-01T10:00:0{9 - i}.000Z", "ip": f"10.0.0.{i}"}
+        for i in range(5)
+    ]
+
+    async def page():
+        chunks = stream_visits_page(RawBatchCollection(visits), {}, limit=3, extra={"ips": []})
+        return b"".join([chunk async for chunk in chunks])
+
+    body = json.loads(asyncio.run(page()))
+    assert body["visits"] == visits[:3]
+    assert body["ips"] == []
+    date_entree, visit_id = decode_cursor(body["next_cursor"])
+    assert str(visit_id) == visits[2]["_id"]
+    assert date_entree == datetime.datetime(2026, 1, 1, 10, 0, 7, tzinfo=datetime.timezone.utc)
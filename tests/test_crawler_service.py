@@ -0,0 +1,115 @@
+import asyncio
+
+from app.services.crawler_service import SiteCrawler
+
+
+class FakeContent:
+    def __init__(self, body):
+        self.body = body
+
+    async def iter_chunked(self, size):
+        for i in range(0, len(self.body), size):
+            yield self.body[i:i + size]
+
+
+class FakeResponse:
+    def __init__(self, url, status, body, content_type="text/html"):
+        self.url = url
+        self.status = status
+        self.headers = {"Content-Type": content_type}
+        self.content = FakeContent(body.encode("utf-8"))
+        self.body = body
+
+    async def text(self, errors="strict"):
+        return self.body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    """Serves ``pages`` (url -> html) and records the URLs requested."""
+
+    def __init__(self, pages, robots=None, robots_status=200):
+        self.pages = pages
+        self.robots = robots
+        self.robots_status = robots_status
+        self.requested = []
+
+    def get(self, url, **kwargs):
+        self.requested.append(url)
+        if url.endswith("/robots.txt"):
+            return FakeResponse(url, self.robots_status if self.robots is not None else 404, self.robots or "", "text/plain")
+        if url in self.pages:
+            return FakeResponse(url, 200, self.pages[url])
+        return FakeResponse(url, 404, "")
+
+
+def links(*hrefs):
+    return "<html><body>" + "".join(f'<a href="{href}">link</a>' for href in hrefs) + "</body></html>"
+
+
+def site(origin):
+    return {
+        f"{origin}/": links("/a", "b#top", "/private/x", "https://elsewhere.test/", "mailto:me@example.com"),
+        f"{origin}/a": links("/a/deep", "/"),
+        f"{origin}/b": links("/a"),
+        f"{origin}/a/deep": links("/a/deeper"),
+        f"{origin}/a/deeper": links("/a/deepest"),
+        f"{origin}/private/x": links("/private/y"),
+    }
+
+
+def crawl(origin, session, **kwargs):
+    return asyncio.run(SiteCrawler(origin, **kwargs).crawl(session))
+
+
+def test_crawl_stops_at_max_depth_and_stays_on_origin():
+    origin = "https://depth.test"
+    session = FakeSession(site(origin))
+
+    pages = crawl(origin, session, max_depth=2, max_pages=100)
+
+    assert pages[0] == f"{origin}/"
+    expected = {"/", "/a", "/b", "/private/x", "/a/deep", "/private/y"}
+    assert set(pages) == {origin + path for path in expected}
+    # Les pages de profondeur max_depth sont listées mais pas récupérées
+    assert f"{origin}/a/deep" not in session.requested
+    assert not any("elsewhere.test" in url for url in session.requested)
+
+
+def test_crawl_honours_robots_disallow():
+    origin = "https://robots.test"
+    session = FakeSession(site(origin), robots="User-agent: *\nDisallow: /private/\n")
+
+    pages = crawl(origin, session, max_depth=3, max_pages=100)
+
+    assert f"{origin}/a/deeper" in pages
+    assert not any("/private/" in url for url in pages + session.requested)
+
+
+def test_forbidden_robots_txt_disallows_everything():
+    origin = "https://forbidden.test"
+    session = FakeSession(site(origin), robots="", robots_status=403)
+
+    assert crawl(origin, session, max_depth=3, max_pages=100) == [f"{origin}/"]
+
+
+def test_robots_txt_is_fetched_once_per_origin():
+    origin = "https://cached.test"
+    session = FakeSession(site(origin), robots="User-agent: *\nDisallow:\n")
+    crawl(origin, session, max_depth=1)
+    crawl(origin, session, max_depth=1)
+
+    assert sum(url.endswith("/robots.txt") for url in session.requested) == 1
+
+
+def test_crawl_returns_at_most_max_pages():
+    origin = "https://small.test"
+    pages = crawl(origin, FakeSession(site(origin)), max_depth=5, max_pages=3)
+
+    assert len(pages) == 3
+    assert len(set(pages)) == 3
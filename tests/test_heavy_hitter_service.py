@@ -0,0 +1,19 @@
+import datetime
+
+from app.services.heavy_hitter_service import HEAVY_HITTER_COLLECTION, HeavyHitters
+
+
+def test_record_only_counts_the_live_hours():
+    heavy_hitters = HeavyHitters({HEAVY_HITTER_COLLECTION: None}, capacity=10)
+    now = datetime.datetime.utcnow()
+    visits = [
+        {"domain": "example.com", "date_entree": date, "ip": "10.0.0.1", "user_agent": "UA"}
+        for date in (now, now - datetime.timedelta(hours=1), now - datetime.timedelta(hours=3), now + datetime.timedelta(hours=2))
+    ]
+
+    heavy_hitters.record(visits)
+
+    # Heures déjà enregistrées ou dates futures envoyées par le client: ignorées
+    hours = sorted({hour for _, dim, hour in heavy_hitters.windows if dim == "ip"})
+    assert len(hours) == 2
+    assert all(heavy_hitters.windows[("example.com", "ip", hour)].total == 1 for hour in hours)
@@ -0,0 +1,72 @@
+import pytest
+
+from app.utils.hyperloglog import HyperLogLog
+
+
+def items(start, stop, prefix="visitor"):
+    return (f"{prefix}-{i}" for i in range(start, stop))
+
+
+@pytest.mark.parametrize("cardinality", [10, 1000, 20000, 100000])
+def test_estimate_within_four_standard_errors(cardinality):
+    sketch = HyperLogLog(12)
+    sketch.update(items(0, cardinality))
+
+    assert abs(sketch.count() - cardinality) <= 4 * sketch.relative_error * cardinality + 1
+
+
+def test_duplicates_do_not_change_the_sketch():
+    sketch = HyperLogLog(10)
+    assert sketch.update(items(0, 500))
+    registers = sketch.to_bytes()
+
+    assert not sketch.update(items(0, 500))
+    assert sketch.to_bytes() == registers
+
+
+def test_merge_is_the_sketch_of_the_union():
+    left, right, union = HyperLogLog(12), HyperLogLog(12), HyperLogLog(12)
+    left.update(items(0, 30000))
+    right.update(items(20000, 50000))
+    union.update(items(0, 50000))
+
+    assert left.merge(right)
+    assert left.to_bytes() == union.to_bytes()
+    # Fusion idempotente: rejouer une fusion ne change rien
+    assert not left.merge(right)
+
+
+def test_daily_sketches_add_up_without_double_counting():
+    days = []
+    for day in range(7):
+        sketch = HyperLogLog(12)
+        # 1000 visiteurs fidèles chaque jour, 500 nouveaux par jour
+        sketch.update(items(0, 1000, "regular"))
+        sketch.update(items(day * 500, (day + 1) * 500, "new"))
+        days.append(sketch)
+
+    week = HyperLogLog(12)
+    for sketch in days:
+        week.merge(sketch)
+
+    expected = 1000 + 7 * 500
+    assert abs(week.count() - expected) <= 4 * week.relative_error * expected
+
+
+def test_serialization_round_trip():
+    sketch = HyperLogLog(8)
+    sketch.update(items(0, 300))
+
+    restored = HyperLogLog.from_bytes(sketch.to_bytes())
+
+    assert restored.precision == 8
+    assert restored.count() == sketch.count()
+
+
+def test_invalid_precisions_are_rejected():
+    with pytest.raises(ValueError):
+        HyperLogLog(3)
+    with pytest.raises(ValueError):
+        HyperLogLog(10).merge(HyperLogLog(12))
+    with pytest.raises(ValueError):
+        HyperLogLog(10, bytes(100))
@@ -0,0 +1,75 @@
+import datetime
+
+from app.services.ip_log_service import bucket_operations, bucket_start
+
+
+class FakeBuckets:
+    """Applies the bucket upserts the way MongoDB does (first matching document, else insert)."""
+
+    def __init__(self):
+        self.documents = []
+
+    def matches(self, document, query):
+        return (
+            document["domain"] == query["domain"]
+            and document["bucket"] == query["bucket"]
+            and document["count"] <= query["count"]["$lte"]
+        )
+
+    def apply(self, operation):
+        query, update = operation._filter, operation._doc
+        document = next((document for document in self.documents if self.matches(document, query)), None)
+        if document is None:
+            document = {"domain": query["domain"], "bucket": query["bucket"], "count": 0, "ips": []}
+            self.documents.append(document)
+        document["ips"].extend(update["$push"]["ips"]["$each"])
+        document["count"] += update["$inc"]["count"]
+        document["first"] = min(document.get("first", update["$min"]["first"]), update["$min"]["first"])
+        document["last"] = max(document.get("last", update["$max"]["last"]), update["$max"]["last"])
+
+
+def entries(count, hour=10):
+    start = datetime.datetime(2026, 1, 1, hour)
+    return [{"ip": f"10.0.0.{i % 250}", "date_entree": start + datetime.timedelta(seconds=i)} for i in range(count)]
+
+
+def write(buckets, batches, size):
+    for batch in batches:
+        for operation in bucket_operations("example.com", batch, size):
+            buckets.apply(operation)
+
+
+def test_bucket_start_truncates_to_the_utc_hour():
+    paris = datetime.timezone(datetime.timedelta(hours=1))
+    assert bucket_start(datetime.datetime(2026, 1, 1, 11, 42, 7, tzinfo=paris)) == datetime.datetime(2026, 1, 1, 10)
+
+
+def test_a_bucket_only_accepts_a_chunk_it_has_room_for():
+    operations = bucket_operations("example.com", entries(7), size=5)
+
+    # 7 entrées de la même heure: un morceau de 5 puis un de 2
+    assert [operation._filter["count"] for operation in operations] == [{"$lte": 0}, {"$lte": 3}]
+    assert [operation._doc["$inc"]["count"] for operation in operations] == [5, 2]
+
+
+def test_buckets_roll_over_without_exceeding_their_size():
+    buckets = FakeBuckets()
+    visits = entries(23)
+    # Lots de tailles variées, comme les flushs successifs de l'ingest
+    write(buckets, [visits[:3], visits[3:4], visits[4:12], visits[12:13], visits[13:23]], size=5)
+
+    assert all(document["count"] <= 5 for document in buckets.documents)
+    assert all(document["count"] == len(document["ips"]) for document in buckets.documents)
+    assert sum(document["count"] for document in buckets.documents) == 23
+    stored = sorted(entry["date_entree"] for document in buckets.documents for entry in document["ips"])
+    assert stored == [entry["date_entree"] for entry in visits]
+
+
+def test_entries_are_split_by_hour():
+    buckets = FakeBuckets()
+    write(buckets, [entries(3, hour=10) + entries(2, hour=11)], size=5)
+
+    assert sorted((document["bucket"].hour, document["count"]) for document in buckets.documents) == [(10, 3), (11, 2)]
+    for document in buckets.documents:
+        assert document["first"] == min(entry["date_entree"] for entry in document["ips"])
+        assert document["last"] == max(entry["date_entree"] for entry in document["ips"])
@@ -0,0 +1,107 @@
+import asyncio
+import datetime
+
+import pytest
+from bson import ObjectId
+from cachetools import TTLCache
+
+from app.services.session_cache import LocalSessionCache, RedisSessionCache
+
+KEY = ("example.com", "user-1")
+OTHER = ("example.com", "user-2")
+
+
+def open_session():
+    return {"_id": ObjectId(), "date_entree": datetime.datetime(2026, 1, 1, 10, 0)}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_local_get_set_invalidate():
+    async def scenario():
+        cache = LocalSessionCache(maxsize=10, ttl=60)
+        session = open_session()
+        assert await cache.get_many([KEY]) == {}
+
+        await cache.set_many({KEY: session, OTHER: None})
+        assert await cache.get_many([KEY, OTHER]) == {KEY: session, OTHER: None}
+
+        await cache.invalidate([KEY])
+        assert await cache.get_many([KEY, OTHER]) == {OTHER: None}
+        assert cache.stats == {"hits": 3, "misses": 2}
+
+    asyncio.run(scenario())
+
+
+def test_local_ttl_eviction():
+    async def scenario():
+        clock = Clock()
+        cache = LocalSessionCache()
+        cache.entries = TTLCache(maxsize=10, ttl=60, timer=clock)
+        await cache.set_many({KEY: open_session()})
+
+        clock.now = 61
+        assert await cache.get_many([KEY]) == {}
+
+    asyncio.run(scenario())
+
+
+def test_local_memory_bound():
+    async def scenario():
+        cache = LocalSessionCache(maxsize=2, ttl=60)
+        await cache.set_many({("example.com", f"user-{i}"): None for i in range(5)})
+        assert len(cache.entries) == 2
+
+    asyncio.run(scenario())
+
+
+def redis_cache(ttl=60):
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisSessionCache(fakeredis.FakeAsyncRedis(), ttl=ttl)
+
+
+def test_redis_get_set_invalidate():
+    async def scenario():
+        cache = redis_cache()
+        session = open_session()
+        assert await cache.get_many([KEY]) == {}
+
+        await cache.set_many({KEY: session, OTHER: None})
+        assert await cache.get_many([KEY, OTHER]) == {KEY: session, OTHER: None}
+
+        await cache.invalidate([KEY])
+        assert await cache.get_many([KEY, OTHER]) == {OTHER: None}
+        assert cache.stats == {"hits": 3, "misses": 2}
+
+    asyncio.run(scenario())
+
+
+def test_redis_ttl_eviction():
+    async def scenario():
+        cache = redis_cache(ttl=1)
+        await cache.set_many({KEY: open_session()})
+        assert 0 < await cache.redis.ttl(cache.redis_key(KEY)) <= 1
+
+        await asyncio.sleep(1.1)
+        assert await cache.get_many([KEY]) == {}
+
+    asyncio.run(scenario())
+
+
+def test_redis_memory_bound():
+    async def scenario():
+        # Redis n'a pas de taille maximale par cache: chaque entrée expire, rien ne s'accumule
+        cache = redis_cache(ttl=60)
+        await cache.set_many({("example.com", f"user-{i}"): None for i in range(5)})
+        keys = await cache.redis.keys(f"{cache.prefix}:*")
+        assert len(keys) == 5
+        for key in keys:
+            assert 0 < await cache.redis.ttl(key) <= 60
+
+    asyncio.run(scenario())
@@ -0,0 +1,51 @@
+from app.services.error_page_service import page_fingerprint
+from app.utils.simhash import hamming_distance, html_tokens, simhash
+from config.settings import SOFT_404_MAX_BYTES, SOFT_404_MAX_DISTANCE
+
+
+def page(body, script_size=0):
+    script = "<script>window.__DATA__ = " + "x" * script_size + ";</script>"
+    return f"<html><head><title>Site</title>{script}</head><body>{body}</body></html>"
+
+
+ARTICLE = " ".join(f"article word{i} about topic{i % 7}" for i in range(60))
+NOT_FOUND = " ".join(["sorry this page could not be found please go back home"] * 5)
+
+
+def test_html_tokens_skip_scripts_styles_and_comments():
+    html = page("<style>p { color: red }</style><!-- hidden --><p>Hello <b>World</b></p>")
+    assert html_tokens(html) == ["hello", "world"]
+
+
+def test_unterminated_script_is_dropped_up_to_the_end():
+    assert html_tokens("<p>Visible</p><script>var secret = 'words in code'") == ["visible"]
+
+
+def test_page_cut_inside_a_large_head_script_is_inconclusive():
+    # Plus de SOFT_404_MAX_BYTES de script inline dans <head>: le <body> n'est pas lu
+    not_found = page(NOT_FOUND, SOFT_404_MAX_BYTES)[:SOFT_404_MAX_BYTES]
+    article = page(ARTICLE, SOFT_404_MAX_BYTES)[:SOFT_404_MAX_BYTES]
+
+    assert html_tokens(not_found) == []
+    assert page_fingerprint(not_found) is None
+    assert page_fingerprint(article) is None
+
+
+def test_pages_behind_the_same_head_script_are_told_apart():
+    not_found = page_fingerprint(page(NOT_FOUND, 8 * 1024))
+    article = page_fingerprint(page(ARTICLE, 8 * 1024))
+
+    assert hamming_distance(not_found, article) > SOFT_404_MAX_DISTANCE
+    assert page_fingerprint(page(NOT_FOUND, 100)) == not_found
+
+
+def test_short_pages_are_inconclusive():
+    assert page_fingerprint(page("Not found")) is None
+
+
+def test_simhash_near_duplicates_are_close():
+    tokens = html_tokens(page(ARTICLE))
+    edited = tokens[:-3] + ["one", "more", "line"]
+
+    assert hamming_distance(simhash(tokens), simhash(edited)) <= SOFT_404_MAX_DISTANCE
+    assert hamming_distance(simhash(tokens), simhash(html_tokens(page(NOT_FOUND)))) > SOFT_404_MAX_DISTANCE
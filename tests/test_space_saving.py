@@ -0,0 +1,72 @@
+import random
+from collections import Counter
+
+from app.utils.space_saving import SpaceSaving
+
+
+def zipf_stream(size, distinct, seed):
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, distinct + 1)]
+    return [f"ip-{index}" for index in rng.choices(range(distinct), weights=weights, k=size)]
+
+
+def summarize(stream, capacity):
+    summary = SpaceSaving(capacity)
+    for item in stream:
+        summary.add(item)
+    return summary
+
+
+def assert_guarantees(summary, truth):
+    total = sum(truth.values())
+    assert summary.total == total
+    # Tout élément de fréquence > total / capacity est suivi
+    for item, count in truth.items():
+        if count > total / summary.capacity:
+            assert item in summary.counts
+    # Comptes surestimés d'au plus leur erreur
+    for item, count in summary.counts.items():
+        assert count - summary.errors[item] <= truth[item] <= count
+    # Un élément non suivi n'a pas pu dépasser le plus petit compteur
+    for item, count in truth.items():
+        if item not in summary.counts:
+            assert count <= summary.min_count()
+
+
+def test_frequent_items_are_tracked_with_bounded_error():
+    stream = zipf_stream(20000, 2000, seed=1)
+    summary = summarize(stream, 50)
+
+    assert len(summary) == 50
+    assert_guarantees(summary, Counter(stream))
+    assert summary.top(1)[0]["value"] == "ip-0"
+
+
+def test_exact_below_capacity():
+    stream = ["a"] * 5 + ["b"] * 3 + ["c"]
+    summary = summarize(stream, 10)
+
+    assert summary.top() == [
+        {"value": "a", "count": 5, "error": 0},
+        {"value": "b", "count": 3, "error": 0},
+        {"value": "c", "count": 1, "error": 0},
+    ]
+    assert summary.min_count() == 0
+
+
+def test_merged_summaries_keep_the_guarantees():
+    first, second = zipf_stream(10000, 1500, seed=2), zipf_stream(10000, 1500, seed=3)
+    merged = summarize(first, 50)
+    merged.merge(summarize(second, 50))
+
+    assert len(merged) == 50
+    assert_guarantees(merged, Counter(first + second))
+
+
+def test_serialization_round_trip():
+    summary = summarize(zipf_stream(2000, 300, seed=4), 20)
+
+    restored = SpaceSaving.from_dict(summary.to_dict())
+
+    assert restored.total == summary.total
+    assert restored.top(20) == summary.top(20)
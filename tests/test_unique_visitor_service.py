@@ -0,0 +1,39 @@
+import asyncio
+import datetime
+
+import pytest
+
+from app.services.unique_visitor_service import SKETCH_COLLECTION, UniqueVisitors
+
+
+def visits(users, day=datetime.datetime(2026, 1, 1, 10)):
+    return [{"domain": "example.com", "date_entree": day, "tracking_user_analytics": f"u{i}", "ip": f"10.0.{i}.1"} for i in users]
+
+
+def test_failed_merges_are_kept_for_the_next_flush():
+    unique_visitors = UniqueVisitors({SKETCH_COLLECTION: None}, precision=10)
+    merged = []
+
+    async def failing_merge(domain, day, sketches):
+        raise RuntimeError("MongoDB indisponible")
+
+    async def merge(domain, day, sketches):
+        merged.append((domain, day, sketches["visitors"].count()))
+
+    async def run():
+        unique_visitors.record(visits(range(100)))
+        unique_visitors.merge = failing_merge
+        with pytest.raises(RuntimeError):
+            await unique_visitors.flush()
+        # Visites reçues entre-temps: fusionnées avec le sketch conservé
+        unique_visitors.record(visits(range(50, 150)))
+        unique_visitors.merge = merge
+        await unique_visitors.flush()
+
+    asyncio.run(run())
+
+    assert len(merged) == 1
+    domain, day, count = merged[0]
+    assert (domain, day) == ("example.com", datetime.datetime(2026, 1, 1))
+    assert abs(count - 150) <= 10
+    assert unique_visitors.pending == {}
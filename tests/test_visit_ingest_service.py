@@ -0,0 +1,110 @@
+import asyncio
+import datetime
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from app.services.visit_ingest_service import DUPLICATE_KEY, MAX_ROLLOVER_ATTEMPTS, VisitIngestBuffer
+
+
+class ScriptedCollection:
+    """bulk_write raising the scripted errors in turn, then succeeding."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.calls = []
+
+    async def bulk_write(self, operations, ordered=True):
+        self.calls.append(operations)
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+def write_error(index, code=DUPLICATE_KEY):
+    return BulkWriteError({"writeErrors": [{"index": index, "code": code, "errmsg": "error"}], "writeConcernErrors": []})
+
+
+def visit(i):
+    now = datetime.datetime(2026, 1, 1, 10, i)
+    return (
+        {"_id": ObjectId(), "domain": "example.com", "tracking_user_analytics": f"u{i}", "date_entree": now, "date_sortie": None},
+        {"ip": f"10.0.0.{i}", "date_entree": now},
+    )
+
+
+def flush(visits_collection, count=3):
+    """Submit ``count`` visits, flush them once and return each caller's outcome."""
+
+    async def run():
+        buffer = VisitIngestBuffer(visits_collection, ScriptedCollection(), max_batch=count)
+        buffer.start = lambda: None
+        submits = [asyncio.ensure_future(buffer.submit(*visit(i))) for i in range(count)]
+        await asyncio.sleep(0)
+        items = list(buffer.pending)
+        await buffer.flush()
+        outcomes = await asyncio.gather(*submits, return_exceptions=True)
+        return buffer, items, outcomes
+
+    return asyncio.run(run())
+
+
+def test_duplicate_key_rollover_is_retried():
+    # Deux opérations par visite (clôture, insertion): l'index 3 est l'insertion de la 2e visite
+    collection = ScriptedCollection([write_error(3)])
+    buffer, items, outcomes = flush(collection)
+
+    assert all(isinstance(outcome, ObjectId) for outcome in outcomes)
+    assert len(collection.calls) == 2
+    # Le lot rejoué repart de la visite en conflit
+    assert len(collection.calls[1]) == 4
+    assert [item.attempts for item in items] == [0, 1, 0]
+    assert buffer.stats["visits"] == 3
+
+
+def test_duplicate_key_gives_up_after_max_attempts():
+    collection = ScriptedCollection([write_error(1)] * MAX_ROLLOVER_ATTEMPTS)
+    buffer, items, outcomes = flush(collection)
+
+    assert isinstance(outcomes[0], BulkWriteError)
+    assert all(isinstance(outcome, ObjectId) for outcome in outcomes[1:])
+    assert items[0].attempts == MAX_ROLLOVER_ATTEMPTS
+    assert buffer.stats["visits"] == 2
+
+
+def test_other_write_errors_reject_only_the_failed_visit():
+    collection = ScriptedCollection([write_error(3, code=121)])
+    buffer, items, outcomes = flush(collection)
+
+    assert isinstance(outcomes[1], BulkWriteError)
+    assert isinstance(outcomes[0], ObjectId) and isinstance(outcomes[2], ObjectId)
+    # Pas de nouvel essai pour la visite rejetée: seule la suivante est renvoyée
+    assert len(collection.calls[1]) == 2
+    assert [item.attempts for item in items] == [0, 0, 0]
+
+
+def test_write_concern_error_alone_commits_the_batch():
+    error = BulkWriteError({"writeErrors": [], "writeConcernErrors": [{"code": 64, "errmsg": "waiting for replication timed out"}]})
+    collection = ScriptedCollection([error])
+    buffer, items, outcomes = flush(collection)
+
+    assert all(isinstance(outcome, ObjectId) for outcome in outcomes)
+    assert len(collection.calls) == 1
+    assert buffer.stats["visits"] == 3
+
+
+def test_stop_waits_for_the_batch_being_written():
+    class SlowCollection(ScriptedCollection):
+        async def bulk_write(self, operations, ordered=True):
+            await asyncio.sleep(0.05)
+            await super().bulk_write(operations, ordered)
+
+    async def run():
+        collection = SlowCollection()
+        buffer = VisitIngestBuffer(collection, ScriptedCollection(), flush_interval_ms=1, max_batch=2)
+        submits = [asyncio.ensure_future(buffer.submit(*visit(i))) for i in range(5)]
+        await asyncio.sleep(0.02)  # premier lot en cours d'écriture
+        await buffer.stop()
+        return await asyncio.gather(*submits, return_exceptions=True)
+
+    outcomes = asyncio.run(run())
+    assert all(isinstance(outcome, ObjectId) for outcome in outcomes)
@@ -0,0 +1,135 @@
+import asyncio
+import json
+
+from app.services.websocket_broadcaster import ClientConnection, WebSocketBroadcaster
+
+
+def event(seq, domain="example.com", name="new_visit"):
+    message = json.dumps({"seq": seq, "event": name, "data": {"_id": str(seq)}})
+    return {"seq": seq, "message": message, "key": str(seq), "domain": domain, "event": name}
+
+
+def queued_seqs(connection):
+    return [seq for _, _, seq in connection.queue.values()]
+
+
+def stream_client(broadcaster, last_seq):
+    connection = ClientConnection(None, broadcaster.queue_size, broadcaster.overflow, "sse")
+    broadcaster.connections[connection.id] = connection
+    broadcaster.all_domains[connection.id] = connection
+    broadcaster.replay(connection, last_seq)
+    return connection
+
+
+def test_replay_batches_received_out_of_order():
+    broadcaster = WebSocketBroadcaster(queue_size=100)
+    # Deux workers: le lot 11-20 arrive avant le lot 1-10
+    broadcaster.publish_events([event(seq) for seq in range(11, 21)])
+    broadcaster.publish_events([event(seq) for seq in range(1, 11)])
+
+    connection = stream_client(broadcaster, last_seq=5)
+
+    assert queued_seqs(connection) == list(range(6, 21))
+    assert broadcaster.stats["resets"] == 0
+
+
+def test_replay_resets_when_missed_events_were_evicted():
+    broadcaster = WebSocketBroadcaster(queue_size=100, replay_size=10)
+    broadcaster.publish_events([event(seq) for seq in range(11, 21)])
+    broadcaster.publish_events([event(seq) for seq in range(1, 11)])
+
+    # Le tampon ne garde que 1-10, reçus en dernier: 16-20 ne peuvent plus être rejoués
+    connection = stream_client(broadcaster, last_seq=15)
+
+    assert broadcaster.stats["resets"] == 1
+    assert [json.loads(message)["event"] for message, _, _ in connection.queue.values()] == ["reset"]
+
+
+def test_replay_filters_on_subscriptions():
+    broadcaster = WebSocketBroadcaster(queue_size=100)
+    broadcaster.publish_events([event(seq, domain="b.com" if seq % 2 else "a.com") for seq in range(4, 7)])
+    broadcaster.publish_events([event(seq, domain="b.com" if seq % 2 else "a.com") for seq in range(1, 4)])
+    connection = ClientConnection(None, 100, broadcaster.overflow, "sse")
+    broadcaster.connections[connection.id] = connection
+    broadcaster.subscribe(connection, domains=["a.com"])
+
+    broadcaster.replay(connection, last_seq=0)
+
+    assert queued_seqs(connection) == [2, 4, 6]
+
+
+def test_coalesce_keeps_every_event_below_capacity():
+    connection = ClientConnection(None, 10, "coalesce", "sse")
+    connection.enqueue("new", key="new_visit:1", seq=1)
+    connection.enqueue("exit", key="update_exit:1", seq=2)
+    connection.enqueue("exit again", key="update_exit:1", seq=3)
+
+    assert [message for message, _, _ in connection.queue.values()] == ["new", "exit", "exit again"]
+    assert connection.stats["coalesced"] == 0
+
+
+def test_pings_coalesce_behind_a_slow_client():
+    broadcaster = WebSocketBroadcaster(queue_size=100)
+    connection = ClientConnection(None, broadcaster.queue_size, "coalesce", "sse")
+    connection.heartbeat = True
+    broadcaster.connections[connection.id] = connection
+    connection.enqueue("event", seq=1)
+
+    # Le client ne vide pas sa file: un seul ping en attente, le plus récent
+    for _ in range(5):
+        asyncio.run(broadcaster.reap())
+
+    messages = [message for message, _, _ in connection.queue.values()]
+    assert len(messages) == 2
+    assert messages[0] == "event"
+    assert json.loads(messages[1])["event"] == "ping"
+    assert connection.stats["coalesced"] == 4
+
+
+def test_coalesce_replaces_same_key_when_full():
+    connection = ClientConnection(None, 2, "coalesce", "sse")
+    connection.enqueue("new", key="new_visit:1", seq=1)
+    connection.enqueue("exit", key="update_exit:1", seq=2)
+    connection.enqueue("exit again", key="update_exit:1", seq=3)
+    connection.enqueue("other", key="new_visit:2", seq=4)
+
+    assert [message for message, _, _ in connection.queue.values()] == ["exit again", "other"]
+    assert connection.stats == {**connection.stats, "coalesced": 1, "dropped": 1}
+
+
+def test_unsubscribing_last_domain_receives_nothing():
+    broadcaster = WebSocketBroadcaster(queue_size=100)
+    connection = ClientConnection(None, 100, "coalesce", "sse")
+    broadcaster.register(connection, ["a.com"], [], None)
+
+    broadcaster.unsubscribe(connection, domains=["a.com"])
+    broadcaster.publish_events([event(1, domain="a.com"), event(2, domain="b.com")])
+
+    assert not connection.all_domains
+    assert queued_seqs(connection) == []
+
+
+def test_subscribe_all_domains_again():
+    broadcaster = WebSocketBroadcaster(queue_size=100)
+    connection = ClientConnection(None, 100, "coalesce", "sse")
+    broadcaster.register(connection, ["a.com"], ["new_visit"], None)
+
+    broadcaster.subscribe(connection, all_domains=True)
+    broadcaster.publish_events([event(1, domain="b.com"), event(2, name="update_exit")])
+
+    assert queued_seqs(connection) == [1]
+    assert broadcaster.by_domain == {}
+
+
+def test_pings_only_clients_that_opted_in():
+    broadcaster = WebSocketBroadcaster(queue_size=100)
+    legacy = ClientConnection(None, 100, "coalesce", "sse")
+    opted_in = ClientConnection(None, 100, "coalesce", "sse")
+    opted_in.heartbeat = True
+    for connection in (legacy, opted_in):
+        broadcaster.register(connection, [], [], None)
+
+    asyncio.run(broadcaster.reap())
+
+    assert list(legacy.queue) == []
+    assert [json.loads(message)["event"] for message, _, _ in opted_in.queue.values()] == ["ping"]